@@ -0,0 +1,240 @@
+"""
+A local origin server for benchmarks
+
+It serves deterministic bodies for any path, so a scenario only needs to
+generate urls. Every domain of a scenario is a loopback address
+(127.0.0.1, 127.0.0.2, ...), which is a different host for rate limits
+and connection pools, but the same server.
+"""
+import email.utils
+import hashlib
+import math
+import multiprocessing
+import random
+import socket
+import ssl
+import struct
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+# Served as Last-Modified of every body
+LAST_MODIFIED = email.utils.formatdate(1609459200, usegmt=True)
+WRITE_SIZE = 64 * 1024
+
+
+@dataclass
+class OriginConfig:
+    """
+    :param latency: Seconds to wait before each response
+    :param jitter: Max seconds added to latency at random
+    :param body_size: A median body size in bytes
+    :param body_sigma: Sigma of the log-normal distribution of body sizes. When 0, all the bodies have body_size.
+    :param max_age: max-age of Cache-Control. When None, no Cache-Control.
+    :param etag: Send ETag, and 304 for a matching If-None-Match
+    :param last_modified: Send Last-Modified, and 304 for a matching If-Modified-Since
+    :param error_rate: A ratio of 500 responses
+    :param reset_rate: A ratio of connections closed without a response
+    :param version: Changes all the bodies and validators
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    body_size: int = 1024
+    body_sigma: float = 0.0
+    max_age: Optional[int] = 3600
+    etag: bool = True
+    last_modified: bool = True
+    error_rate: float = 0.0
+    reset_rate: float = 0.0
+    version: int = 0
+
+
+def body_size(config: OriginConfig, path: str) -> int:
+    if config.body_sigma == 0:
+        return config.body_size
+    rng = random.Random(path)
+    return max(
+        1, int(rng.lognormvariate(math.log(config.body_size), config.body_sigma))
+    )
+
+
+def body_chunks(config: OriginConfig, path: str) -> List[bytes]:
+    """
+    Deterministic chunks of a body, which are cheap to build
+    """
+    size = body_size(config, path)
+    seed = hashlib.sha1(f"{config.version}:{path}".encode("utf-8")).digest()
+    block = seed * (WRITE_SIZE // len(seed) + 1)
+    chunks = [block[:WRITE_SIZE]] * (size // WRITE_SIZE)
+    if size % WRITE_SIZE:
+        chunks.append(block[: size % WRITE_SIZE])
+    return chunks
+
+
+def body(config: OriginConfig, path: str) -> bytes:
+    return b"".join(body_chunks(config, path))
+
+
+def etag(config: OriginConfig, path: str) -> str:
+    digest = hashlib.sha1(f"{config.version}:{path}".encode("utf-8")).hexdigest()
+    return f'"{digest[:16]}"'
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and a body are written separately, so don't wait for delayed ACKs
+    disable_nagle_algorithm = True
+    config = OriginConfig()
+
+    def do_GET(self) -> None:
+        config = self.config
+        if config.latency or config.jitter:
+            time.sleep(config.latency + random.uniform(0, config.jitter))
+
+        roll = random.random()
+        if roll < config.reset_rate:
+            # Drop the connection as a crashed origin does
+            self.close_connection = True
+            self.connection.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+            )
+            return
+        if roll < config.reset_rate + config.error_rate:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        headers = {}
+        if config.max_age is not None:
+            headers["Cache-Control"] = f"max-age={config.max_age}"
+        if config.etag:
+            headers["ETag"] = etag(config, self.path)
+        if config.last_modified:
+            headers["Last-Modified"] = LAST_MODIFIED
+
+        if (config.etag and self.headers.get("If-None-Match") == headers["ETag"]) or (
+            config.last_modified
+            and self.headers.get("If-Modified-Since") == LAST_MODIFIED
+        ):
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        chunks = body_chunks(config, self.path)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(sum(len(chunk) for chunk in chunks)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(chunk)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+class ReusePortServer(ThreadingHTTPServer):
+    # Processes bound to the same port share incoming connections
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def server_bind(self) -> None:
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def serve(
+    config: OriginConfig,
+    port: int,
+    certfile: Optional[str],
+    keyfile: Optional[str],
+    ready: "multiprocessing.synchronize.Event",
+) -> None:
+    handler = type("Handler", (OriginHandler,), {"config": config})
+    server = ReusePortServer(("0.0.0.0", port), handler)
+    if certfile is not None:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    ready.set()
+    server.serve_forever()
+
+
+class Origin:
+    """
+    Origin servers in processes sharing a port
+
+    :param config: Behavior of the origin
+    :param processes: A number of server processes
+    :param certfile: A certificate to serve HTTPS. When None, HTTP.
+    :param keyfile: A private key of certfile
+    """
+
+    def __init__(
+        self,
+        config: OriginConfig,
+        processes: int = 4,
+        certfile: Optional[str] = None,
+        keyfile: Optional[str] = None,
+    ) -> None:
+        self.config = config
+        self.scheme = "http" if certfile is None else "https"
+        self._num_processes = processes
+        self._certfile = certfile
+        self._keyfile = keyfile
+        self._processes: List[multiprocessing.Process] = []
+        self.port = 0
+
+    def __enter__(self) -> "Origin":
+        self.start()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        for _ in range(self._num_processes):
+            ready = multiprocessing.Event()
+            process = multiprocessing.Process(
+                target=serve,
+                args=(self.config, self.port, self._certfile, self._keyfile, ready),
+                daemon=True,
+            )
+            process.start()
+            ready.wait()
+            self._processes.append(process)
+
+    def stop(self) -> None:
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join()
+        self._processes = []
+
+    def url(self, domain: int, path: str) -> str:
+        """
+        A url on the domain-th host, which is a loopback address
+        """
+        n = domain + 1
+        host = f"127.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+        return f"{self.scheme}://{host}:{self.port}/{path}"
+
+    @staticmethod
+    def path(url: str) -> str:
+        return "/" + url.split("/", 3)[3]
+
+    def expected(self, url: str) -> Tuple[bytes, str]:
+        """
+        The body and the ETag served for url
+        """
+        path = self.path(url)
+        return body(self.config, path), etag(self.config, path)
@@ -0,0 +1,353 @@
+"""
+Run benchmark scenarios against the local origin
+
+    python -m benchmarks.run --list
+    python -m benchmarks.run cold skewed --engine fetch_urls --scale 0.1
+
+Each run prints URLs/s, p50/p99 latency of fetches, CPU seconds of this
+process and its worker processes, and their peak memory usage. The origin
+and the storage server aren't measured.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Set, Tuple
+
+import cached_http_fetcher
+from cached_http_fetcher.report import FETCH, FetchReport
+from cached_http_fetcher.storage import (
+    ContentStorageBase,
+    MetaStorageBase,
+    SegmentContentStorage,
+    SQLiteMetaStorage,
+    StorageServer,
+)
+
+from .origin import Origin
+from .scenarios import SCENARIOS, Scenario, prepare, scenario_urls
+
+MEMORY_INTERVAL = 0.2
+
+Engine = Callable[
+    [List[str], MetaStorageBase, ContentStorageBase, Scenario, argparse.Namespace],
+    FetchReport,
+]
+
+
+def run_fetch_urls(
+    url_list: List[str],
+    meta_storage: MetaStorageBase,
+    content_storage: ContentStorageBase,
+    scenario: Scenario,
+    args: argparse.Namespace,
+) -> FetchReport:
+    return cached_http_fetcher.fetch_urls(
+        url_list,
+        meta_storage,
+        content_storage,
+        rate_limit_count=scenario.rate_limit[0],
+        rate_limit_seconds=scenario.rate_limit[1],
+        num_fetch_processes=args.fetch_processes,
+        num_content_processes=args.content_processes,
+        logger=logging.getLogger(__name__),
+    )
+
+
+def run_fetch_urls_autoscale(
+    url_list: List[str],
+    meta_storage: MetaStorageBase,
+    content_storage: ContentStorageBase,
+    scenario: Scenario,
+    args: argparse.Namespace,
+) -> FetchReport:
+    # --fetch-processes and --content-processes are the initial numbers
+    return cached_http_fetcher.fetch_urls(
+        url_list,
+        meta_storage,
+        content_storage,
+        rate_limit_count=scenario.rate_limit[0],
+        rate_limit_seconds=scenario.rate_limit[1],
+        num_fetch_processes=args.fetch_processes,
+        num_content_processes=args.content_processes,
+        autoscale=cached_http_fetcher.Autoscale(interval=1.0),
+        logger=logging.getLogger(__name__),
+    )
+
+
+def batches(url_list: List[str], size: int) -> Iterator[List[str]]:
+    for start in range(0, len(url_list), size):
+        yield url_list[start : start + size]
+
+
+def run_fetch_urls_batches(
+    url_list: List[str],
+    meta_storage: MetaStorageBase,
+    content_storage: ContentStorageBase,
+    scenario: Scenario,
+    args: argparse.Namespace,
+) -> FetchReport:
+    # A scheduler calling fetch_urls() for each small batch
+    report = FetchReport()
+    for batch in batches(url_list, args.batch_size):
+        report.merge(
+            run_fetch_urls(batch, meta_storage, content_storage, scenario, args)
+        )
+    return report
+
+
+def run_fetcher_batches(
+    url_list: List[str],
+    meta_storage: MetaStorageBase,
+    content_storage: ContentStorageBase,
+    scenario: Scenario,
+    args: argparse.Namespace,
+) -> FetchReport:
+    report = FetchReport()
+    with cached_http_fetcher.Fetcher(
+        meta_storage,
+        content_storage,
+        rate_limit_count=scenario.rate_limit[0],
+        rate_limit_seconds=scenario.rate_limit[1],
+        num_fetch_processes=args.fetch_processes,
+        num_content_processes=args.content_processes,
+        logger=logging.getLogger(__name__),
+    ) as fetcher:
+        for batch in batches(url_list, args.batch_size):
+            report.merge(fetcher.submit(batch))
+    return report
+
+
+def run_fetch_urls_single(
+    url_list: List[str],
+    meta_storage: MetaStorageBase,
+    content_storage: ContentStorageBase,
+    scenario: Scenario,
+    args: argparse.Namespace,
+) -> FetchReport:
+    return cached_http_fetcher.fetch_urls_single(
+        url_list,
+        meta_storage=meta_storage,
+        content_storage=content_storage,
+        max_fetch_count=scenario.rate_limit[0],
+        fetch_count_window=scenario.rate_limit[1],
+        logger=logging.getLogger(__name__),
+    )
+
+
+def run_fetch_urls_async(
+    url_list: List[str],
+    meta_storage: MetaStorageBase,
+    content_storage: ContentStorageBase,
+    scenario: Scenario,
+    args: argparse.Namespace,
+) -> FetchReport:
+    return asyncio.run(
+        cached_http_fetcher.fetch_urls_async(
+            url_list,
+            meta_storage,
+            content_storage,
+            rate_limit_count=scenario.rate_limit[0],
+            rate_limit_seconds=scenario.rate_limit[1],
+            logger=logging.getLogger(__name__),
+        )
+    )
+
+
+# Add a new engine here to compare it with the others
+ENGINES: Dict[str, Engine] = {
+    "fetch_urls": run_fetch_urls,
+    "fetch_urls_autoscale": run_fetch_urls_autoscale,
+    "fetch_urls_batches": run_fetch_urls_batches,
+    "fetcher_batches": run_fetcher_batches,
+    "fetch_urls_single": run_fetch_urls_single,
+    "fetch_urls_async": run_fetch_urls_async,
+}
+
+
+@contextmanager
+def storages(kind: str) -> Iterator[Tuple[MetaStorageBase, ContentStorageBase]]:
+    if kind == "server":
+        with StorageServer() as server:
+            yield server.meta_storage(), server.content_storage()
+    else:
+        directory = tempfile.mkdtemp(prefix="cached-http-fetcher-benchmark-")
+        try:
+            yield (
+                SQLiteMetaStorage(os.path.join(directory, "meta.sqlite")),
+                SegmentContentStorage(os.path.join(directory, "content")),
+            )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def memory_usage(pid: int) -> int:
+    """
+    PSS of a process, where pages shared with forked processes are divided
+    among them, or RSS when PSS isn't available
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+class MemorySampler:
+    """
+    Peak of the total memory usage of this process and its children,
+    except excluded ones, sampled periodically. It works only on Linux.
+    """
+
+    def __init__(self, excluded: Set[int]) -> None:
+        self.peak = 0
+        self._excluded = excluded
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            pids = [os.getpid()] + [
+                p.pid
+                for p in multiprocessing.active_children()
+                if p.pid is not None and p.pid not in self._excluded
+            ]
+            self.peak = max(self.peak, sum(memory_usage(pid) for pid in pids))
+            self._stop.wait(MEMORY_INTERVAL)
+
+    def __enter__(self) -> "MemorySampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+@dataclass
+class Result:
+    scenario: str
+    engine: str
+    storage: str
+    urls: int
+    seconds: float
+    urls_per_second: float
+    p50_ms: float
+    p99_ms: float
+    cpu_seconds: float
+    peak_memory_mib: float
+    outcomes: Dict[str, int]
+
+    def __str__(self) -> str:
+        return (
+            f"{self.scenario:<13} {self.engine:<20} {self.storage:<7} "
+            f"{self.urls:>8} {self.seconds:>8.2f}s {self.urls_per_second:>9.0f}/s "
+            f"p50<={self.p50_ms:g}ms p99<={self.p99_ms:g}ms "
+            f"cpu {self.cpu_seconds:.1f}s mem {self.peak_memory_mib:.0f}MiB "
+            f"{self.outcomes}"
+        )
+
+
+def run(name: str, engine: str, args: argparse.Namespace) -> Result:
+    scenario = SCENARIOS[name]
+    with Origin(
+        scenario.origin,
+        processes=args.origin_processes,
+        certfile=args.certfile,
+        keyfile=args.keyfile,
+    ) as origin, storages(args.storage) as (meta_storage, content_storage):
+        url_list = scenario_urls(scenario, origin, args.scale)
+        prepare(scenario, origin, url_list, meta_storage, content_storage)
+        # The origin and the storage server are children, too
+        excluded = {p.pid for p in multiprocessing.active_children() if p.pid}
+
+        with MemorySampler(excluded) as sampler:
+            times = os.times()
+            started = time.perf_counter()
+            report = ENGINES[engine](
+                url_list, meta_storage, content_storage, scenario, args
+            )
+            seconds = time.perf_counter() - started
+            # Children are counted once they are joined, and the origin
+            # and the storage server are still running here
+            cpu = sum(os.times()[:4]) - sum(times[:4])
+
+    fetch = report.stages.get(FETCH)
+    return Result(
+        scenario=name,
+        engine=engine,
+        storage=args.storage,
+        urls=len(url_list),
+        seconds=seconds,
+        urls_per_second=len(url_list) / seconds if seconds > 0 else 0.0,
+        p50_ms=fetch.quantile(0.5) * 1000 if fetch is not None else 0.0,
+        p99_ms=fetch.quantile(0.99) * 1000 if fetch is not None else 0.0,
+        cpu_seconds=cpu,
+        peak_memory_mib=sampler.peak / 1024 / 1024,
+        outcomes=report.outcomes,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run, or all")
+    parser.add_argument("--list", action="store_true", help="list scenarios")
+    parser.add_argument(
+        "--engine",
+        action="append",
+        choices=sorted(ENGINES),
+        help="engines to run, or all",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=["server", "sqlite"],
+        default="server",
+        help="in-memory storages on StorageServer, or SQLite and segment files",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="a multiplier of url counts"
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--fetch-processes", type=int)
+    parser.add_argument("--content-processes", type=int)
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="urls per batch of *_batches"
+    )
+    parser.add_argument("--origin-processes", type=int, default=4)
+    parser.add_argument("--certfile", help="serve HTTPS with a certificate")
+    parser.add_argument("--keyfile")
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print(f"{name:<13} {scenario.urls:>8} urls  {scenario.description}")
+        return
+
+    logging.basicConfig(level=logging.WARNING)
+    for name in args.scenarios or list(SCENARIOS):
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario: {name}")
+        for engine in args.engine or list(ENGINES):
+            for _ in range(args.repeat):
+                result = run(name, engine, args)
+                print(json.dumps(result.__dict__) if args.json else result, flush=True)
+
+
+if __name__ == "__main__":
+    main()
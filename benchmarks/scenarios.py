@@ -0,0 +1,154 @@
+"""
+Workloads of benchmarks
+
+A scenario is a url list on the local origin, a behavior of the origin,
+and metas stored before the run.
+"""
+import hashlib
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from cached_http_fetcher.meta import put_metas
+from cached_http_fetcher.model import Meta
+from cached_http_fetcher.storage import ContentStorageBase, MetaStorageBase
+
+from .origin import LAST_MODIFIED, Origin, OriginConfig, body_size
+
+PREPARE_BATCH_SIZE = 10000
+
+# Metas stored before a run
+NONE = "none"
+FRESH = "fresh"  # all the urls are still valid, so nothing is requested
+EXPIRED = "expired"  # all the urls are revalidated, and the origin returns 304
+
+
+@dataclass
+class Scenario:
+    """
+    :param urls: A number of urls, which is multiplied by --scale
+    :param domains: A number of domains
+    :param skew: An exponent of a Zipf distribution of urls per domain. When 0, domains have the same number of urls.
+    :param prepare: Metas stored before the run: NONE, FRESH or EXPIRED
+    :param rate_limit: rate_limit_count and rate_limit_seconds
+    """
+
+    description: str
+    urls: int
+    domains: int
+    origin: OriginConfig = field(default_factory=OriginConfig)
+    skew: float = 0.0
+    prepare: str = NONE
+    rate_limit: Tuple[int, int] = (0, 0)
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "cold": Scenario(
+        "Small new bodies on even domains",
+        urls=20000,
+        domains=100,
+    ),
+    "fresh": Scenario(
+        "1M urls which are all still valid, so only metas are read",
+        urls=1000000,
+        domains=1000,
+        prepare=FRESH,
+    ),
+    "revalidate": Scenario(
+        "Expired urls revalidated by conditional requests, which return 304",
+        urls=20000,
+        domains=100,
+        prepare=EXPIRED,
+    ),
+    "skewed": Scenario(
+        "Zipf distributed domain sizes with a rate limit per host",
+        urls=20000,
+        domains=200,
+        skew=1.2,
+        origin=OriginConfig(latency=0.005),
+        rate_limit=(200, 1),
+    ),
+    "large_bodies": Scenario(
+        "Log-normal body sizes around 256KiB, up to tens of MiB",
+        urls=2000,
+        domains=20,
+        origin=OriginConfig(body_size=256 * 1024, body_sigma=1.5),
+    ),
+    "slow_origin": Scenario(
+        "An origin answering in 50ms, so fetching is network bound",
+        urls=5000,
+        domains=50,
+        origin=OriginConfig(latency=0.05),
+    ),
+    "errors": Scenario(
+        "5% 500 responses, 2% reset connections and latency jitter",
+        urls=10000,
+        domains=50,
+        origin=OriginConfig(
+            latency=0.002, jitter=0.02, error_rate=0.05, reset_rate=0.02
+        ),
+    ),
+}
+
+
+def domain_sizes(scenario: Scenario, url_count: int) -> List[int]:
+    domains = max(1, min(scenario.domains, url_count))
+    weights = [1 / (d + 1) ** scenario.skew for d in range(domains)]
+    total = sum(weights)
+    sizes = [int(url_count * w / total) for w in weights]
+    # Give the remainder to the largest domains
+    for d in range(url_count - sum(sizes)):
+        sizes[d % domains] += 1
+    return sizes
+
+
+def scenario_urls(scenario: Scenario, origin: Origin, scale: float) -> List[str]:
+    url_count = max(1, int(scenario.urls * scale))
+    return [
+        origin.url(domain, f"d{domain}/{i}.bin")
+        for domain, size in enumerate(domain_sizes(scenario, url_count))
+        for i in range(size)
+    ]
+
+
+def prepare(
+    scenario: Scenario,
+    origin: Origin,
+    url_list: List[str],
+    meta_storage: MetaStorageBase,
+    content_storage: ContentStorageBase,
+    now: Optional[int] = None,
+) -> None:
+    """
+    Store metas of url_list as the scenario requires
+    """
+    if scenario.prepare == NONE:
+        return
+    now = int(time.time()) if now is None else now
+    config = origin.config
+    for start in range(0, len(url_list), PREPARE_BATCH_SIZE):
+        metas: Dict[str, Optional[Meta]] = {}
+        for url in url_list[start : start + PREPARE_BATCH_SIZE]:
+            if scenario.prepare == FRESH:
+                # Fresh metas are never compared with the origin
+                metas[url] = Meta(
+                    cached_url=content_storage.cached_url(url),
+                    etag=None,
+                    last_modified=None,
+                    content_sha1=None,
+                    fetched_at=now,
+                    expired_at=now + 86400,
+                    content_length=body_size(config, origin.path(url)),
+                )
+            else:
+                content, etag = origin.expected(url)
+                metas[url] = Meta(
+                    cached_url=content_storage.cached_url(url),
+                    etag=etag,
+                    last_modified=LAST_MODIFIED,
+                    content_sha1=hashlib.sha1(content).digest(),
+                    fetched_at=now - 86400,
+                    expired_at=now - 1,
+                    content_length=len(content),
+                )
+        put_metas(metas, meta_storage)
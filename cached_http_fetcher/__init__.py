@@ -1,13 +1,33 @@
+from .async_entrypoint import fetch_urls_async
+from .autoscale import Autoscale
 from .entrypoint import fetch_urls, fetch_urls_single
+from .fetcher import Fetcher
 from .meta import get_meta
+from .metrics import MetricsHook, MetricsRegistry
 from .model import Meta
-from .storage import ContentStorageBase, MetaStorageBase
+from .plan import ExpiryIndex
+from .rate_limiter import RateLimiterBase
+from .report import FetchReport
+from .storage import (
+    ContentAddressedStorageBase,
+    ContentStorageBase,
+    MetaStorageBase,
+)
 
 __all__ = [
     "fetch_urls",
     "fetch_urls_single",
+    "fetch_urls_async",
+    "Fetcher",
     "get_meta",
     "Meta",
+    "MetricsHook",
+    "MetricsRegistry",
+    "ExpiryIndex",
+    "Autoscale",
+    "FetchReport",
+    "RateLimiterBase",
     "ContentStorageBase",
+    "ContentAddressedStorageBase",
     "MetaStorageBase",
 ]
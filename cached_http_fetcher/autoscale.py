@@ -0,0 +1,286 @@
+import multiprocessing
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from logging import Logger
+from typing import Any, Callable, List, Optional, Tuple
+
+DEFAULT_AUTOSCALE_INTERVAL = 2.0
+
+
+@dataclass
+class Autoscale:
+    """
+    Bounds and thresholds to resize worker pools of fetch_urls() while running
+
+    Every interval seconds, each pool is grown by a quarter (at least 1)
+    or shrunk by 1 from utilization of its workers and the fill ratio of
+    response_queue.
+
+    :param min_fetch_processes: A min number of fetcher processes
+    :param max_fetch_processes: A max number of fetcher processes. When None, cpu_count() * 8.
+    :param min_content_processes: A min number of content processes
+    :param max_content_processes: A max number of content processes. When None, cpu_count() * 2.
+    :param interval: Seconds between decisions
+    :param high_utilization: Grow a pool whose workers are busier than this
+    :param low_utilization: Shrink a pool whose workers are less busy than this
+    :param high_fill: Grow content processes while response_queue is fuller than this,
+                      and don't grow fetcher processes then
+    :param low_fill: Shrink content processes only while response_queue is emptier than this
+    :param max_blocked: Shrink fetcher processes blocked on a full response_queue longer than
+                        this ratio of time
+    """
+
+    min_fetch_processes: int = 1
+    max_fetch_processes: Optional[int] = None
+    min_content_processes: int = 1
+    max_content_processes: Optional[int] = None
+    interval: float = DEFAULT_AUTOSCALE_INTERVAL
+    high_utilization: float = 0.8
+    low_utilization: float = 0.3
+    high_fill: float = 0.5
+    low_fill: float = 0.05
+    max_blocked: float = 0.3
+
+    def fetch_bounds(self) -> Tuple[int, int]:
+        upper = self.max_fetch_processes or multiprocessing.cpu_count() * 8
+        return self.min_fetch_processes, max(self.min_fetch_processes, upper)
+
+    def content_bounds(self) -> Tuple[int, int]:
+        upper = self.max_content_processes or multiprocessing.cpu_count() * 2
+        return self.min_content_processes, max(self.min_content_processes, upper)
+
+
+class PoolStats:
+    """
+    Seconds workers of a pool wait on their input queue (idle) and on
+    their output queue (blocked), shared by the worker processes
+    """
+
+    def __init__(self) -> None:
+        self._idle = multiprocessing.Value("d", 0.0)
+        self._blocked = multiprocessing.Value("d", 0.0)
+
+    def add_idle(self, seconds: float) -> None:
+        with self._idle.get_lock():
+            self._idle.value += seconds
+
+    def add_blocked(self, seconds: float) -> None:
+        with self._blocked.get_lock():
+            self._blocked.value += seconds
+
+    def read(self) -> Tuple[float, float]:
+        return self._idle.value, self._blocked.value
+
+
+class WorkerPool:
+    """
+    Worker processes taking items from a queue, where None stops a worker
+
+    :param create: Create a worker process, which isn't started yet
+    :param queue: The input queue of workers
+    """
+
+    def __init__(
+        self,
+        create: Callable[[], multiprocessing.Process],
+        queue: "multiprocessing.Queue[Any]",
+    ) -> None:
+        self.workers: List[multiprocessing.Process] = []
+        self.live = 0
+        self._create = create
+        self._queue = queue
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def grow(self, n: int) -> int:
+        with self._lock:
+            if self._closed:
+                return 0
+            for _ in range(n):
+                worker = self._create()
+                worker.start()
+                self.workers.append(worker)
+                self.live += 1
+            return n
+
+    def shrink(self, n: int) -> int:
+        """
+        Stop n workers after the items queued now, without waiting for them
+        """
+        with self._lock:
+            if self._closed:
+                return 0
+            stopped = 0
+            for _ in range(n):
+                try:
+                    self._queue.put_nowait(None)
+                except queue.Full:
+                    # The workers are too busy to stop anyway
+                    break
+                self.live -= 1
+                stopped += 1
+            return stopped
+
+    def close(self) -> None:
+        """
+        Stop all the workers after the queued items, and forbid resizing
+        """
+        with self._lock:
+            self._closed = True
+            live = self.live
+            self.live = 0
+        for _ in range(live):
+            self._queue.put(None)
+
+
+def scale_fetch(
+    autoscale: Autoscale,
+    live: int,
+    utilization: float,
+    blocked: float,
+    fill: float,
+) -> int:
+    """
+    A number of fetcher processes to add, or to remove when negative
+    """
+    lower, upper = autoscale.fetch_bounds()
+    if blocked > autoscale.max_blocked or utilization < autoscale.low_utilization:
+        # Content processes or urls can't keep up with fetchers
+        return -1 if live > lower else 0
+    if utilization > autoscale.high_utilization and fill < autoscale.high_fill:
+        return max(0, min(max(1, live // 4), upper - live))
+    return 0
+
+
+def scale_content(
+    autoscale: Autoscale, live: int, utilization: float, fill: float
+) -> int:
+    """
+    A number of content processes to add, or to remove when negative
+    """
+    lower, upper = autoscale.content_bounds()
+    if fill > autoscale.high_fill or utilization > autoscale.high_utilization:
+        return max(0, min(max(1, live // 4), upper - live))
+    if utilization < autoscale.low_utilization and fill < autoscale.low_fill:
+        return -1 if live > lower else 0
+    return 0
+
+
+class Autoscaler:
+    """
+    A thread which resizes the pools of fetch_urls() periodically
+
+    Utilization is the ratio of time workers don't wait on their queues.
+    Time a fetcher sleeps for the rate limit counts as busy, so set
+    max_fetch_processes to bound fetchers on rate limited hosts.
+    """
+
+    def __init__(
+        self,
+        autoscale: Autoscale,
+        fetch_pool: WorkerPool,
+        fetch_stats: PoolStats,
+        content_pool: WorkerPool,
+        content_stats: PoolStats,
+        response_queue: "multiprocessing.Queue[Any]",
+        max_queued_responses: int,
+        *,
+        logger: Logger,
+    ) -> None:
+        self._autoscale = autoscale
+        self._fetch_pool = fetch_pool
+        self._fetch_stats = fetch_stats
+        self._content_pool = content_pool
+        self._content_stats = content_stats
+        self._response_queue = response_queue
+        self._max_queued_responses = max_queued_responses
+        self._logger = logger
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _fill(self) -> float:
+        if self._max_queued_responses <= 0:
+            return 0.0
+        try:
+            return self._response_queue.qsize() / self._max_queued_responses
+        except NotImplementedError:
+            # qsize() isn't available on macOS
+            return 0.0
+
+    def _run(self) -> None:
+        fetch_idle, fetch_blocked = self._fetch_stats.read()
+        content_idle, _ = self._content_stats.read()
+        fetch_live = self._fetch_pool.live
+        content_live = self._content_pool.live
+        checked_at = time.perf_counter()
+        while not self._stop.wait(self._autoscale.interval):
+            now = time.perf_counter()
+            elapsed = now - checked_at
+            idle, blocked = self._fetch_stats.read()
+            fetch_delta = scale_fetch(
+                self._autoscale,
+                self._fetch_pool.live,
+                utilization(
+                    idle - fetch_idle + blocked - fetch_blocked, fetch_live, elapsed
+                ),
+                ratio(blocked - fetch_blocked, fetch_live, elapsed),
+                self._fill(),
+            )
+            fetch_idle, fetch_blocked = idle, blocked
+            idle, _ = self._content_stats.read()
+            content_delta = scale_content(
+                self._autoscale,
+                self._content_pool.live,
+                utilization(idle - content_idle, content_live, elapsed),
+                self._fill(),
+            )
+            content_idle = idle
+
+            self._resize(self._fetch_pool, fetch_delta, "fetcher")
+            self._resize(self._content_pool, content_delta, "content")
+            fetch_live = self._fetch_pool.live
+            content_live = self._content_pool.live
+            checked_at = now
+
+    def _resize(self, pool: WorkerPool, delta: int, name: str) -> None:
+        if delta > 0:
+            changed = pool.grow(delta)
+        elif delta < 0:
+            changed = -pool.shrink(-delta)
+        else:
+            return
+        if changed:
+            self._logger.info(f"resized {name} processes to {pool.live}")
+
+
+def wait_empty(queue: "multiprocessing.Queue[Any]", interval: float) -> None:
+    """
+    Wait until workers take all the items of queue
+    """
+    try:
+        while queue.qsize() > 0:
+            time.sleep(interval)
+    except NotImplementedError:
+        # qsize() isn't available on macOS
+        pass
+
+
+def ratio(seconds: float, workers: int, elapsed: float) -> float:
+    if workers <= 0 or elapsed <= 0:
+        return 0.0
+    return min(1.0, max(0.0, seconds / (workers * elapsed)))
+
+
+def utilization(waiting: float, workers: int, elapsed: float) -> float:
+    if workers <= 0 or elapsed <= 0:
+        return 0.0
+    return 1.0 - ratio(waiting, workers, elapsed)
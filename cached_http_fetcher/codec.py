@@ -0,0 +1,154 @@
+import io
+import pickle
+import struct
+from typing import Any, List, Optional, Tuple
+
+from .model import Meta
+
+# The first byte of an encoded Meta. Pickled data starts with 0x80 (protocol 2+)
+# or a printable character (protocol 0 and 1), so it never collides.
+META_VERSION = 1
+
+_HEADER = struct.Struct("<BBqq")  # version, flags, fetched_at, expired_at
+
+_FLAG_CACHED_URL = 1 << 0
+_FLAG_ETAG = 1 << 1
+_FLAG_LAST_MODIFIED = 1 << 2
+_FLAG_CONTENT_SHA1 = 1 << 3
+_FLAG_CONTENT_LENGTH = 1 << 4
+
+
+def _encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _encode_str(value: Optional[str]) -> Optional[bytes]:
+    if value is None:
+        return None
+    return value.encode("utf-8")
+
+
+def _decode_str(value: Optional[bytes]) -> Optional[str]:
+    if value is None:
+        return None
+    return value.decode("utf-8")
+
+
+def encode_meta(meta: Meta) -> bytes:
+    """
+    Encode Meta into a compact binary
+
+    The layout is the header, then the fields which aren't None in this order:
+    content_length as a varint, and content_sha1, cached_url, etag and
+    last_modified prefixed by their lengths as varints.
+    """
+    flags = 0
+    body: List[bytes] = []
+    if meta.content_length is not None:
+        flags |= _FLAG_CONTENT_LENGTH
+        body.append(_encode_varint(meta.content_length))
+    fields: List[Tuple[int, Optional[bytes]]] = [
+        (_FLAG_CONTENT_SHA1, meta.content_sha1),
+        (_FLAG_CACHED_URL, _encode_str(meta.cached_url)),
+        (_FLAG_ETAG, _encode_str(meta.etag)),
+        (_FLAG_LAST_MODIFIED, _encode_str(meta.last_modified)),
+    ]
+    for flag, value in fields:
+        if value is not None:
+            flags |= flag
+            body.append(_encode_varint(len(value)))
+            body.append(value)
+
+    header = _HEADER.pack(META_VERSION, flags, meta.fetched_at, meta.expired_at)
+    return header + b"".join(body)
+
+
+def decode_meta(data: bytes) -> Meta:
+    """
+    Decode Meta encoded by encode_meta(), or pickled by older versions
+    """
+    if not data:
+        raise ValueError("empty meta")
+    if data[0] != META_VERSION:
+        return _LegacyMetaUnpickler(io.BytesIO(data)).load()
+
+    _version, flags, fetched_at, expired_at = _HEADER.unpack_from(data)
+    pos = _HEADER.size
+
+    content_length: Optional[int] = None
+    if flags & _FLAG_CONTENT_LENGTH:
+        content_length, pos = _decode_varint(data, pos)
+
+    values: List[Optional[bytes]] = []
+    for flag in [_FLAG_CONTENT_SHA1, _FLAG_CACHED_URL, _FLAG_ETAG, _FLAG_LAST_MODIFIED]:
+        if flags & flag:
+            length, pos = _decode_varint(data, pos)
+            values.append(data[pos : pos + length])
+            pos += length
+        else:
+            values.append(None)
+    if pos != len(data):
+        raise ValueError("invalid meta length")
+
+    content_sha1, cached_url, etag, last_modified = values
+    return Meta(
+        cached_url=_decode_str(cached_url),
+        etag=_decode_str(etag),
+        last_modified=_decode_str(last_modified),
+        content_sha1=content_sha1,
+        fetched_at=fetched_at,
+        expired_at=expired_at,
+        content_length=content_length,
+    )
+
+
+def decode_expired_at(data: bytes) -> int:
+    """
+    Decode only expired_at, which is cheaper than decode_meta()
+    """
+    if data and data[0] == META_VERSION:
+        return int(_HEADER.unpack_from(data)[3])
+    return decode_meta(data).expired_at
+
+
+class _LegacyMetaUnpickler(pickle.Unpickler):
+    """
+    An unpickler which loads only Meta, since a meta storage may be shared
+    """
+
+    _ALLOWED = {
+        ("cached_http_fetcher.model", "Meta"),
+        ("copyreg", "_reconstructor"),
+        ("builtins", "object"),
+    }
+
+    def find_class(self, module: str, name: str) -> Any:
+        if (module, name) not in self._ALLOWED:
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed")
+        return super().find_class(module, name)
+
+    def load(self) -> Meta:
+        meta = super().load()
+        if not isinstance(meta, Meta):
+            raise pickle.UnpicklingError("not a Meta")
+        return meta
@@ -1,13 +1,13 @@
 import hashlib
 import logging
+import os
 import random
 from email.utils import mktime_tz, parsedate_tz
-from typing import Dict, Mapping, Optional
-
-from requests.structures import CaseInsensitiveDict
+from typing import Dict, Mapping, Optional, Tuple
 
 from .model import FetchedResponse, Meta
-from .storage import ContentStorageBase
+from .request import CHUNK_SIZE
+from .storage import AsyncContentStorageBase, ContentStorageBase
 
 
 def parse_cache_control(cache_control: str) -> Dict[str, Optional[str]]:
@@ -60,6 +60,103 @@ def calc_expired_at(
     return now + min_cache_age
 
 
+def content_size(fetched_response: FetchedResponse) -> int:
+    if fetched_response.content_file is not None:
+        return os.path.getsize(fetched_response.content_file)
+    return len(fetched_response.content or b"")
+
+
+def calc_content_sha1(fetched_response: FetchedResponse) -> bytes:
+    """
+    SHA-1 of the body, which is usually hashed by the fetcher while reading it
+    """
+    if fetched_response.content_sha1 is not None:
+        return fetched_response.content_sha1
+    sha1 = hashlib.sha1()
+    if fetched_response.content_file is not None:
+        with open(fetched_response.content_file, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha1.update(chunk)
+    else:
+        sha1.update(fetched_response.content or b"")
+    return sha1.digest()
+
+
+def store_content(
+    fetched_response: FetchedResponse,
+    content_sha1: bytes,
+    content_length: int,
+    content_max_age: int,
+    content_storage: ContentStorageBase,
+) -> None:
+    """
+    Put the body into content_storage. A spooled body is passed as a stream.
+    """
+    content_type = fetched_response.headers.get("content-type", None)
+    cache_control = f"max-age={content_max_age}"
+    if fetched_response.content_file is not None:
+        with open(fetched_response.content_file, "rb") as f:
+            content_storage.put_content_stream(
+                fetched_response.url,
+                f,
+                content_length,
+                content_sha1,
+                cache_control=cache_control,
+                content_type=content_type,
+            )
+    else:
+        content_storage.put_hashed_content(
+            fetched_response.url,
+            fetched_response.content or b"",
+            content_sha1,
+            cache_control=cache_control,
+            content_type=content_type,
+        )
+
+
+async def store_content_async(
+    fetched_response: FetchedResponse,
+    content_sha1: bytes,
+    content_length: int,
+    content_max_age: int,
+    content_storage: AsyncContentStorageBase,
+) -> None:
+    """
+    An asyncio version of store_content()
+    """
+    content_type = fetched_response.headers.get("content-type", None)
+    cache_control = f"max-age={content_max_age}"
+    if fetched_response.content_file is not None:
+        with open(fetched_response.content_file, "rb") as f:
+            await content_storage.put_content_stream(
+                fetched_response.url,
+                f,
+                content_length,
+                content_sha1,
+                cache_control=cache_control,
+                content_type=content_type,
+            )
+    else:
+        await content_storage.put_hashed_content(
+            fetched_response.url,
+            fetched_response.content or b"",
+            content_sha1,
+            cache_control=cache_control,
+            content_type=content_type,
+        )
+
+
+def discard_content(fetched_response: FetchedResponse) -> None:
+    """
+    Remove a temporary file holding the body, if any
+    """
+    if fetched_response.content_file is not None:
+        try:
+            os.unlink(fetched_response.content_file)
+        except FileNotFoundError:
+            pass
+
+
 def put_content(
     fetched_response: FetchedResponse,
     min_cache_age: int,
@@ -68,49 +165,180 @@ def put_content(
     *,
     logger: logging.Logger,
 ) -> Optional[Meta]:
-    source_url = fetched_response.url
-    response = fetched_response.response
-    old_meta = fetched_response.old_meta
-    fetched_at = fetched_response.fetched_at
+    try:
+        return _put_content(
+            fetched_response,
+            min_cache_age,
+            content_max_age,
+            content_storage,
+            logger=logger,
+        )
+    finally:
+        discard_content(fetched_response)
 
-    cached_url = content_storage.cached_url(source_url)
-
-    # TODO: Improve handling 304
-    if response.status_code == 200 or response.status_code == 304:
-        response_headers = CaseInsensitiveDict(response.headers)
-
-        if response.status_code == 200:
-            content = response.content or b""
-            content_sha1 = hashlib.sha1(content).digest()
-
-            if old_meta is None or old_meta.content_sha1 != content_sha1:
-                content_type = response_headers.get("content-type", None)
-                try:
-                    content_storage.put_content(
-                        source_url,
-                        content,
-                        content_type=content_type,
-                        cache_control=f"max-age={content_max_age}",
-                    )
-                except Exception:
-                    # Meta shouldn't be saved
-                    logger.warning(f"Content storage throws an exception: {source_url}")
-                    return None
-        else:
-            if old_meta is None:
-                raise ValueError("old meta must be set on 304")
-            elif old_meta.content_sha1 is None:
-                raise ValueError("old meta must have content_sha1")
-            content_sha1 = old_meta.content_sha1
-
-        expired_at = calc_expired_at(response_headers, fetched_at, min_cache_age)
-
-        return Meta(
-            cached_url=cached_url,
-            etag=response_headers.get("etag", None),
-            last_modified=response_headers.get("last-modified", None),
-            content_sha1=content_sha1,
-            fetched_at=fetched_at,
-            expired_at=expired_at,
+
+def _put_content(
+    fetched_response: FetchedResponse,
+    min_cache_age: int,
+    content_max_age: int,
+    content_storage: ContentStorageBase,
+    *,
+    logger: logging.Logger,
+) -> Optional[Meta]:
+    if fetched_response.status_code not in (200, 304):
+        return None
+
+    if has_new_body(fetched_response):
+        content_sha1 = calc_content_sha1(fetched_response)
+        size = content_size(fetched_response)
+        # The body is read only when it is changed
+        if is_changed(fetched_response, content_sha1):
+            try:
+                store_content(
+                    fetched_response,
+                    content_sha1,
+                    size,
+                    content_max_age,
+                    content_storage,
+                )
+            except Exception as ex:
+                # Meta shouldn't be saved
+                logger.warning(
+                    "Content storage throws an exception: "
+                    f"{fetched_response.url}: {ex!r}"
+                )
+                return None
+        content_length: Optional[int] = size
+    else:
+        content_sha1, content_length = unchanged_content(fetched_response)
+
+    return build_meta(
+        fetched_response,
+        content_storage.cached_content_url(fetched_response.url, content_sha1),
+        content_sha1,
+        content_length,
+        min_cache_age,
+    )
+
+
+async def put_content_async(
+    fetched_response: FetchedResponse,
+    min_cache_age: int,
+    content_max_age: int,
+    content_storage: AsyncContentStorageBase,
+    *,
+    logger: logging.Logger,
+) -> Optional[Meta]:
+    """
+    An asyncio version of put_content()
+    """
+    try:
+        return await _put_content_async(
+            fetched_response,
+            min_cache_age,
+            content_max_age,
+            content_storage,
+            logger=logger,
         )
-    return None
+    finally:
+        discard_content(fetched_response)
+
+
+async def _put_content_async(
+    fetched_response: FetchedResponse,
+    min_cache_age: int,
+    content_max_age: int,
+    content_storage: AsyncContentStorageBase,
+    *,
+    logger: logging.Logger,
+) -> Optional[Meta]:
+    if fetched_response.status_code not in (200, 304):
+        return None
+
+    if has_new_body(fetched_response):
+        # Hashed by the fetcher, so it doesn't block the loop
+        content_sha1 = calc_content_sha1(fetched_response)
+        size = content_size(fetched_response)
+        if is_changed(fetched_response, content_sha1):
+            try:
+                await store_content_async(
+                    fetched_response,
+                    content_sha1,
+                    size,
+                    content_max_age,
+                    content_storage,
+                )
+            except Exception as ex:
+                # Meta shouldn't be saved
+                logger.warning(
+                    "Content storage throws an exception: "
+                    f"{fetched_response.url}: {ex!r}"
+                )
+                return None
+        content_length: Optional[int] = size
+    else:
+        content_sha1, content_length = unchanged_content(fetched_response)
+
+    return build_meta(
+        fetched_response,
+        content_storage.cached_content_url(fetched_response.url, content_sha1),
+        content_sha1,
+        content_length,
+        min_cache_age,
+    )
+
+
+def has_new_body(fetched_response: FetchedResponse) -> bool:
+    """
+    Whether the response has a body, rather than not modified or unchanged
+    by validators on 200
+    """
+    return fetched_response.status_code == 200 and not fetched_response.body_skipped
+
+
+def is_changed(fetched_response: FetchedResponse, content_sha1: bytes) -> bool:
+    old_meta = fetched_response.old_meta
+    return old_meta is None or old_meta.content_sha1 != content_sha1
+
+
+def unchanged_content(
+    fetched_response: FetchedResponse,
+) -> Tuple[bytes, Optional[int]]:
+    """
+    SHA-1 and length of the content in the storage, which is still valid
+    """
+    old_meta = fetched_response.old_meta
+    if old_meta is None:
+        raise ValueError("old meta must be set on 304")
+    elif old_meta.content_sha1 is None:
+        raise ValueError("old meta must have content_sha1")
+    return old_meta.content_sha1, old_meta.content_length
+
+
+def build_meta(
+    fetched_response: FetchedResponse,
+    cached_url: str,
+    content_sha1: bytes,
+    content_length: Optional[int],
+    min_cache_age: int,
+) -> Meta:
+    response_headers = fetched_response.headers
+    old_meta = fetched_response.old_meta
+    if has_new_body(fetched_response) or old_meta is None:
+        etag = response_headers.get("etag", None)
+        last_modified = response_headers.get("last-modified", None)
+    else:
+        # A 304 response may omit validators, so keep the old ones
+        etag = response_headers.get("etag", old_meta.etag)
+        last_modified = response_headers.get("last-modified", old_meta.last_modified)
+
+    fetched_at = fetched_response.fetched_at
+    return Meta(
+        cached_url=cached_url,
+        etag=etag,
+        last_modified=last_modified,
+        content_sha1=content_sha1,
+        fetched_at=fetched_at,
+        expired_at=calc_expired_at(response_headers, fetched_at, min_cache_age),
+        content_length=content_length,
+    )
@@ -1,67 +1,301 @@
 import multiprocessing
+import multiprocessing.synchronize
+import queue
+import shutil
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from logging import Logger
-from typing import Iterable, Optional, Set
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+from urllib.parse import urlparse
 
-from .content import put_content
-from .meta import get_valid_meta, put_meta
-from .model import FetchedResponse
+from .autoscale import Autoscale, Autoscaler, PoolStats, WorkerPool, wait_empty
+from .content import content_size, has_new_body, is_changed, put_content
+from .meta import get_valid_metas, put_metas, valid_metas
+from .metrics import (
+    RESPONSE_QUEUE,
+    URL_QUEUE,
+    InstrumentedContentStorage,
+    InstrumentedMetaStorage,
+    MetricsHook,
+    sample_queues,
+)
+from .model import FetchedResponse, Meta
+from .plan import ExpiryIndex, PlannedChunk, PlanReport, plan_url_chunks
 from .rate_limit_fetcher import RateLimitFetcher
+from .rate_limiter import (
+    DEFAULT_MAX_CONCURRENCY_PER_HOST,
+    RateLimiterBase,
+    SharedConcurrencyLimiter,
+    create_rate_limiter,
+)
+from .report import (
+    BODY_SKIPPED,
+    ERROR_STATUS,
+    FAILED,
+    FETCH,
+    FRESH,
+    META_READ,
+    META_WRITE,
+    NOT_MODIFIED,
+    STORE_CONTENT,
+    STORE_FAILED,
+    STORED,
+    UNCHANGED,
+    FetchReport,
+)
+from .request import DEFAULT_IDLE_TIMEOUT, DEFAULT_POOL_MAXSIZE, FetchSession
 from .storage import ContentStorageBase, MetaStorageBase
-from .url_list import urls_per_domain
+from .url_list import DEFAULT_CHUNK_SIZE, stream_url_chunks
 
 DEFAULT_MIN_CACHE_AGE = 86400
 DEFAULT_CONTENT_MAX_AGE = 3600
+# A max number of url chunks waiting for fetcher processes
+DEFAULT_MAX_QUEUED_CHUNKS = 1000
+DEFAULT_META_BATCH_SIZE = 100
+# A max number of responses waiting for content processes
+DEFAULT_MAX_QUEUED_RESPONSES = 1000
+# A number of content writes each content process runs at once
+DEFAULT_MAX_IN_FLIGHT_WRITES = 1
+# Seconds to wait for a response before writing pending metas
+META_FLUSH_INTERVAL = 1.0
+# Seconds between reports of idle time by a worker waiting on its queue
+# with autoscale, so that a starved pool isn't seen as busy
+IDLE_POLL_INTERVAL = 0.1
+# A prefix of a directory holding spooled bodies of a run
+SPOOL_DIR_PREFIX = "cached-http-fetcher-spool-"
+REPORT_POLL_INTERVAL = 0.1
+
+
+class BatchEnd:
+    """
+    A marker after the items of a batch. Each worker takes one, reports
+    the batch and waits for the other workers of its pool to take theirs.
+    """
+
+
+# Urls of a chunk, with metas when they were read while planning
+UrlChunk = Union[List[str], PlannedChunk]
+UrlQueueItem = Union[UrlChunk, BatchEnd, None]
+ResponseQueueItem = Union[FetchedResponse, BatchEnd, None]
 
 
 class FetchWorker(multiprocessing.Process):
     def __init__(
         self,
-        url_queue: "multiprocessing.Queue[Optional[Set[str]]]",
-        response_queue: "multiprocessing.Queue[Optional[FetchedResponse]]",
+        url_queue: "multiprocessing.Queue[UrlQueueItem]",
+        response_queue: "multiprocessing.Queue[ResponseQueueItem]",
         meta_storage: MetaStorageBase,
         max_fetch_count: int,
         fetch_count_window: int,
+        *,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        revalidate: bool = True,
+        rate_limiter: Optional[RateLimiterBase] = None,
+        concurrency_limiter: Optional[SharedConcurrencyLimiter] = None,
+        max_content_length: Optional[int] = None,
+        spool_dir: Optional[str] = None,
+        report_queue: "Optional[multiprocessing.Queue[FetchReport]]" = None,
+        metrics: Optional[MetricsHook] = None,
+        stats: Optional[PoolStats] = None,
+        barrier: Optional[multiprocessing.synchronize.Barrier] = None,
     ):
         super().__init__()
         self._url_queue = url_queue
         self._response_queue = response_queue
         self._meta_storage = meta_storage
+        self._revalidate = revalidate
+        self._report_queue = report_queue
+        self._metrics = metrics
+        self._stats = stats
+        self._barrier = barrier
+        self.report = FetchReport()
         self._logger = multiprocessing.get_logger()
+        # Connections are opened lazily in the worker process and reused
+        # for all the urls this worker fetches
+        self._session = FetchSession(
+            pool_maxsize=pool_maxsize, idle_timeout=idle_timeout
+        )
         self._rate_limit_fetcher = RateLimitFetcher(
             max_fetch_count=max_fetch_count,
             fetch_count_window=fetch_count_window,
+            session=self._session,
+            rate_limiter=rate_limiter,
+            concurrency_limiter=concurrency_limiter,
+            max_content_length=max_content_length,
+            spool_dir=spool_dir,
+            metrics=metrics,
             logger=self._logger,
         )
 
+    def fetch_chunk(self, url_chunk: UrlChunk) -> Iterator[FetchedResponse]:
+        now = int(time.time())
+        # On revalidation, expired meta is also passed to the fetcher
+        # to send a conditional request
+        valid_after = 0 if self._revalidate else now
+        if isinstance(url_chunk, PlannedChunk):
+            # Metas were read while planning
+            urls = url_chunk.urls
+            old_metas = valid_metas(url_chunk.metas, valid_after)
+        else:
+            urls = url_chunk
+            started = time.perf_counter()
+            try:
+                old_metas = get_valid_metas(
+                    urls,
+                    valid_after,
+                    self._meta_storage,
+                    logger=self._logger,
+                )
+            except Exception as ex:
+                self._logger.exception("Error on FetchWorker: %s", ex)
+                self.report.count(FAILED, len(urls))
+                return
+            self.report.observe(META_READ, time.perf_counter() - started)
+
+        for url, old_meta in zip(urls, old_metas):
+            now = int(time.time())
+            started = time.perf_counter()
+            fetched_responses: List[FetchedResponse] = []
+            try:
+                for fetched_response in self._rate_limit_fetcher.fetch(
+                    url, old_meta, now
+                ):
+                    fetched_responses.append(fetched_response)
+            except Exception as ex:
+                self._logger.exception("Error on FetchWorker: %s", ex)
+            record_fetch(
+                self.report,
+                url,
+                old_meta,
+                now,
+                fetched_responses,
+                time.perf_counter() - started,
+            )
+            yield from fetched_responses
+
+    def close_connections(self) -> None:
+        self._session.close()
+
+    def end_batch(self) -> None:
+        """
+        Report urls fetched since the previous batch, keeping connections open
+        """
+        if self._metrics is not None:
+            self._metrics.flush()
+        if self._report_queue is not None:
+            self._report_queue.put(self.report)
+        self.report = FetchReport()
+        if self._barrier is not None:
+            self._barrier.wait()
+
     def run(self) -> None:
+        stats = self._stats
+        timeout = IDLE_POLL_INTERVAL if stats is not None else None
         while True:
-            url_set = self._url_queue.get()
-            if url_set is None:
+            started = time.perf_counter()
+            try:
+                url_chunk = self._url_queue.get(timeout=timeout)
+            except queue.Empty:
+                if stats is not None:
+                    stats.add_idle(time.perf_counter() - started)
+                continue
+            if stats is not None:
+                stats.add_idle(time.perf_counter() - started)
+            if url_chunk is None:
                 break
+            if isinstance(url_chunk, BatchEnd):
+                self.end_batch()
+                continue
+
+            for fetched_response in self.fetch_chunk(url_chunk):
+                started = time.perf_counter()
+                self._response_queue.put(fetched_response)
+                if stats is not None:
+                    stats.add_blocked(time.perf_counter() - started)
 
-            for url in url_set:
-                now = int(time.time())
-                try:
-                    old_meta = get_valid_meta(
-                        url, now, self._meta_storage, logger=self._logger
-                    )
-                    for fetched_response in self._rate_limit_fetcher.fetch(
-                        url, old_meta, now
-                    ):
-                        self._response_queue.put(fetched_response)
-                except Exception as ex:
-                    self._logger.exception("Error on FetchWorker: %s", ex)
+        self.close_connections()
+        if self._metrics is not None:
+            self._metrics.flush()
+        if self._report_queue is not None:
+            self._report_queue.put(self.report)
+
+
+def record_fetch(
+    report: FetchReport,
+    url: str,
+    old_meta: Optional[Meta],
+    now: int,
+    fetched_responses: List[FetchedResponse],
+    seconds: float,
+) -> None:
+    """
+    Add a result of fetching a url to report
+    """
+    if not fetched_responses:
+        if old_meta is not None and old_meta.expired_at > now:
+            report.count(FRESH)
+            return
+        report.count(FAILED)
+    report.observe(FETCH, seconds)
+    summary = report.domain(urlparse(url).netloc)
+    summary.requests += 1
+    summary.seconds += seconds
+    if not fetched_responses:
+        summary.failures += 1
+    for fetched_response in fetched_responses:
+        report.count_status(fetched_response.status_code)
+        size = content_size(fetched_response)
+        report.bytes_downloaded += size
+        summary.bytes_downloaded += size
+
+
+def record_store(
+    report: FetchReport, fetched_response: FetchedResponse, meta: Optional[Meta]
+) -> None:
+    """
+    Add a result of storing a response to report
+    """
+    if fetched_response.status_code not in (200, 304):
+        report.count(ERROR_STATUS)
+    elif meta is None:
+        report.count(STORE_FAILED)
+    elif fetched_response.status_code == 304:
+        report.count(NOT_MODIFIED)
+        report.bytes_saved += meta.content_length or 0
+    elif fetched_response.body_skipped:
+        report.count(BODY_SKIPPED)
+        report.bytes_saved += meta.content_length or 0
+    elif (
+        has_new_body(fetched_response)
+        and meta.content_sha1 is not None
+        and is_changed(fetched_response, meta.content_sha1)
+    ):
+        report.count(STORED)
+        report.bytes_stored += meta.content_length or 0
+    else:
+        report.count(UNCHANGED)
 
 
 class ContentWorker(multiprocessing.Process):
     def __init__(
         self,
-        response_queue: "multiprocessing.Queue[Optional[FetchedResponse]]",
+        response_queue: "multiprocessing.Queue[ResponseQueueItem]",
         min_cache_age: int,
         content_max_age: int,
         meta_storage: MetaStorageBase,
         content_storage: ContentStorageBase,
+        *,
+        meta_batch_size: int = DEFAULT_META_BATCH_SIZE,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT_WRITES,
+        expiry_index: Optional[ExpiryIndex] = None,
+        report_queue: "Optional[multiprocessing.Queue[FetchReport]]" = None,
+        metrics: Optional[MetricsHook] = None,
+        stats: Optional[PoolStats] = None,
+        barrier: Optional[multiprocessing.synchronize.Barrier] = None,
+        processed: Optional[multiprocessing.synchronize.Semaphore] = None,
     ):
         super().__init__()
         self._response_queue = response_queue
@@ -69,43 +303,220 @@ class ContentWorker(multiprocessing.Process):
         self._content_max_age = content_max_age
         self._meta_storage = meta_storage
         self._content_storage = content_storage
+        self._meta_batch_size = meta_batch_size
+        self._max_in_flight = max_in_flight
         self._logger = multiprocessing.get_logger()
+        # Metas of stored contents, which are written in a batch
+        self._pending_metas: Dict[str, Optional[Meta]] = {}
+        # Updated with written metas, so the next plan skips fresh urls
+        self._expiry_index = expiry_index
+        self._report_queue = report_queue
+        self._metrics = metrics
+        self._stats = stats
+        self._barrier = barrier
+        # Released for each response stored or failed
+        self._processed = processed
+        self.report = FetchReport()
+        # Created in the worker process on the first use
+        self._lock: Optional[threading.Lock] = None
+        self._window: Optional[threading.Semaphore] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_lock(self) -> threading.Lock:
+        if self._lock is None:
+            self._lock = threading.Lock()
+        return self._lock
+
+    def store(self, fetched_response: FetchedResponse) -> None:
+        """
+        Store a content, and keep its meta to be written after the content
+        """
+        started = time.perf_counter()
+        meta: Optional[Meta] = None
+        try:
+            meta = put_content(
+                fetched_response,
+                self._min_cache_age,
+                self._content_max_age,
+                self._content_storage,
+                logger=self._logger,
+            )
+        except Exception as ex:
+            self._logger.exception("Error on ContentWorker: %s", ex)
+        seconds = time.perf_counter() - started
+
+        with self._get_lock():
+            self.report.observe(STORE_CONTENT, seconds)
+            record_store(self.report, fetched_response, meta)
+            if meta is None:
+                return
+            self._pending_metas[fetched_response.url] = meta
+            full = len(self._pending_metas) >= self._meta_batch_size
+        if full:
+            self.flush_metas()
+
+    def process(self, fetched_response: FetchedResponse) -> None:
+        """
+        Store a content. With max_in_flight > 1, it runs on a thread pool,
+        and this blocks while max_in_flight contents are being stored.
+        """
+        self._get_lock()
+        if self._max_in_flight <= 1:
+            self.store(fetched_response)
+            self._done()
+            return
+
+        if self._executor is None:
+            self._window = threading.Semaphore(self._max_in_flight)
+            self._executor = ThreadPoolExecutor(max_workers=self._max_in_flight)
+        window = self._window
+        assert window is not None
+        # The next response isn't taken from the queue while the window is full
+        window.acquire()
+        future = self._executor.submit(self.store, fetched_response)
+
+        def done(_: object) -> None:
+            window.release()
+            self._done()
+
+        future.add_done_callback(done)
+
+    def _done(self) -> None:
+        if self._processed is not None:
+            self._processed.release()
+
+    def flush_metas(self) -> None:
+        with self._get_lock():
+            if not self._pending_metas:
+                return
+            metas = self._pending_metas
+            self._pending_metas = {}
+        started = time.perf_counter()
+        try:
+            put_metas(metas, self._meta_storage)
+        except Exception as ex:
+            self._logger.exception("Error on ContentWorker: %s", ex)
+        else:
+            if self._expiry_index is not None:
+                for url, meta in metas.items():
+                    if meta is not None:
+                        self._expiry_index.update(url, meta.expired_at)
+        with self._get_lock():
+            self.report.observe(META_WRITE, time.perf_counter() - started)
+
+    def drain(self) -> None:
+        """
+        Wait for contents being stored, and write pending metas
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.flush_metas()
+
+    def end_batch(self) -> None:
+        """
+        Report responses stored since the previous batch
+        """
+        self.drain()
+        if self._metrics is not None:
+            self._metrics.flush()
+        if self._report_queue is not None:
+            self._report_queue.put(self.report)
+        with self._get_lock():
+            self.report = FetchReport()
+        if self._barrier is not None:
+            self._barrier.wait()
+
+    def log_stats(self) -> None:
+        outcomes = self.report.outcomes
+        self._logger.info(
+            f"revalidated {outcomes.get(NOT_MODIFIED, 0)} urls, "
+            f"skipped {outcomes.get(BODY_SKIPPED, 0)} unchanged bodies, "
+            f"saved {self.report.bytes_saved} bytes"
+        )
 
     def run(self) -> None:
+        stats = self._stats
+        timeout = IDLE_POLL_INTERVAL if stats is not None else META_FLUSH_INTERVAL
+        polls_per_flush = max(1, round(META_FLUSH_INTERVAL / timeout))
+        polls = 0
         while True:
-            fetched_response = self._response_queue.get()
+            started = time.perf_counter()
+            try:
+                fetched_response = self._response_queue.get(timeout=timeout)
+            except queue.Empty:
+                if stats is not None:
+                    stats.add_idle(time.perf_counter() - started)
+                polls += 1
+                if polls >= polls_per_flush:
+                    # Don't keep metas pending while no response comes
+                    self.flush_metas()
+                    polls = 0
+                continue
+            polls = 0
+            if stats is not None:
+                stats.add_idle(time.perf_counter() - started)
             if fetched_response is None:
                 break
+            if isinstance(fetched_response, BatchEnd):
+                self.end_batch()
+                continue
 
-            try:
-                meta = put_content(
-                    fetched_response,
-                    self._min_cache_age,
-                    self._content_max_age,
-                    self._content_storage,
-                    logger=self._logger,
-                )
-                if meta is not None:
-                    put_meta(fetched_response.url, meta, self._meta_storage)
-            except Exception as ex:
-                self._logger.exception("Error on ContentWorker: %s", ex)
+            self.process(fetched_response)
 
+        self.drain()
+        self.log_stats()
+        if self._metrics is not None:
+            self._metrics.flush()
+        if self._report_queue is not None:
+            self._report_queue.put(self.report)
 
-def url_queue_from_iterable(
-    url_list: Iterable[str], logger: Logger
-) -> "multiprocessing.Queue[Optional[Set[str]]]":
-    url_dict = urls_per_domain(url_list)
-    url_queue: "multiprocessing.Queue[Optional[Set[str]]]" = multiprocessing.Queue()
-    domain_count = 0
-    url_count = 0
-    for _domain, url_set in url_dict.items():
-        url_queue.put(url_set)
-        domain_count += 1
-        url_count += len(url_set)
 
-    logger.info(f"fetch {url_count} urls from {domain_count} domains")
+def collect_reports(
+    report_queue: "multiprocessing.Queue[FetchReport]",
+    workers: List[multiprocessing.Process],
+    report: FetchReport,
+) -> int:
+    """
+    Merge reports into report until workers exit, and return the number
+    of merged reports
 
-    return url_queue
+    Reports are taken before joining, since a process which put a large
+    item into a queue doesn't exit until the item is consumed. Reports of
+    other workers, e.g. ones stopped by the autoscaler, are merged, too.
+    """
+    collected = 0
+    while any(worker.is_alive() for worker in workers):
+        try:
+            report.merge(report_queue.get(timeout=REPORT_POLL_INTERVAL))
+            collected += 1
+        except queue.Empty:
+            pass
+    for worker in workers:
+        worker.join()
+    return collected
+
+
+def scheduled_url_chunks(
+    url_list: Iterable[str],
+    meta_storage: MetaStorageBase,
+    chunk_size: int,
+    *,
+    pre_filter: bool,
+    expiry_index: Optional[ExpiryIndex],
+    report: PlanReport,
+    logger: Logger,
+) -> Iterator[UrlChunk]:
+    url_chunks = stream_url_chunks(url_list, chunk_size)
+    if not pre_filter:
+        return url_chunks
+    return plan_url_chunks(
+        url_chunks,
+        meta_storage,
+        expiry_index=expiry_index,
+        report=report,
+        logger=logger,
+    )
 
 
 def fetch_urls_single(
@@ -115,32 +526,83 @@ def fetch_urls_single(
     content_storage: ContentStorageBase,
     max_fetch_count: int = 0,
     fetch_count_window: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
     min_cache_age: int = DEFAULT_MIN_CACHE_AGE,
     content_max_age: int = DEFAULT_CONTENT_MAX_AGE,
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+    idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    revalidate: bool = True,
+    meta_batch_size: int = DEFAULT_META_BATCH_SIZE,
+    pre_filter: bool = True,
+    expiry_index: Optional[ExpiryIndex] = None,
+    max_content_length: Optional[int] = None,
+    max_in_flight_writes: int = DEFAULT_MAX_IN_FLIGHT_WRITES,
+    metrics: Optional[MetricsHook] = None,
     logger: Logger,
-) -> None:
+) -> FetchReport:
     """
     A single process version of fetch_urls()
     """
-    url_queue = url_queue_from_iterable(url_list, logger)
-    response_queue: multiprocessing.Queue[
-        Optional[FetchedResponse]
-    ] = multiprocessing.Queue()
+    started = time.perf_counter()
+    if metrics is not None:
+        meta_storage = InstrumentedMetaStorage(meta_storage, metrics)
+        content_storage = InstrumentedContentStorage(content_storage, metrics)
+    url_queue: "multiprocessing.Queue[UrlQueueItem]" = multiprocessing.Queue()
+    response_queue: "multiprocessing.Queue[ResponseQueueItem]" = multiprocessing.Queue()
+    spool_dir = tempfile.mkdtemp(prefix=SPOOL_DIR_PREFIX)
 
-    url_queue.put(None)
     fw = FetchWorker(
-        url_queue, response_queue, meta_storage, max_fetch_count, fetch_count_window
+        url_queue,
+        response_queue,
+        meta_storage,
+        max_fetch_count,
+        fetch_count_window,
+        pool_maxsize=pool_maxsize,
+        idle_timeout=idle_timeout,
+        revalidate=revalidate,
+        max_content_length=max_content_length,
+        spool_dir=spool_dir,
+        metrics=metrics,
     )
-
-    fw.run()
-    fw.close()
-    response_queue.put(None)
     ow = ContentWorker(
-        response_queue, min_cache_age, content_max_age, meta_storage, content_storage
+        response_queue,
+        min_cache_age,
+        content_max_age,
+        meta_storage,
+        content_storage,
+        meta_batch_size=meta_batch_size,
+        max_in_flight=max_in_flight_writes,
+        expiry_index=expiry_index,
+        metrics=metrics,
     )
-    ow.run()
+
+    # Each response is stored as soon as it is fetched, without queueing
+    report = FetchReport()
+    url_count = 0
+    for url_chunk in scheduled_url_chunks(
+        url_list,
+        meta_storage,
+        chunk_size,
+        pre_filter=pre_filter,
+        expiry_index=expiry_index,
+        report=report.plan,
+        logger=logger,
+    ):
+        url_count += len(url_chunk)
+        for fetched_response in fw.fetch_chunk(url_chunk):
+            ow.process(fetched_response)
+
+    fw.close_connections()
+    fw.close()
+    ow.drain()
     ow.close()
-    logger.info("fetched")
+    shutil.rmtree(spool_dir, ignore_errors=True)
+    report.merge(fw.report)
+    report.merge(ow.report)
+    report.elapsed = time.perf_counter() - started
+    logger.info(f"fetched {url_count} urls")
+    logger.info(str(report))
+    return report
 
 
 def fetch_urls(
@@ -150,70 +612,223 @@ def fetch_urls(
     *,
     rate_limit_count: int = 0,
     rate_limit_seconds: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
     min_cache_age: int = DEFAULT_MIN_CACHE_AGE,
     content_max_age: int = DEFAULT_CONTENT_MAX_AGE,
     num_fetch_processes: Optional[int] = None,
     num_content_processes: Optional[int] = None,
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+    idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    revalidate: bool = True,
+    rate_limiter: Optional[RateLimiterBase] = None,
+    max_concurrency_per_host: int = DEFAULT_MAX_CONCURRENCY_PER_HOST,
+    max_queued_chunks: int = DEFAULT_MAX_QUEUED_CHUNKS,
+    meta_batch_size: int = DEFAULT_META_BATCH_SIZE,
+    pre_filter: bool = True,
+    expiry_index: Optional[ExpiryIndex] = None,
+    max_content_length: Optional[int] = None,
+    max_queued_responses: int = DEFAULT_MAX_QUEUED_RESPONSES,
+    max_in_flight_writes: int = DEFAULT_MAX_IN_FLIGHT_WRITES,
+    metrics: Optional[MetricsHook] = None,
+    autoscale: Optional[Autoscale] = None,
     logger: Logger,
-) -> None:
+) -> FetchReport:
     """
     Fetch urls, store meta data into meta_storage and store cached response body to content_storage
 
     :param url_list: List of urls to be fetched
     :param meta_storage: A storage for meta data, implements MetaStorageBase
     :param content_storage: A storage for response contents, implements ContentStorageBase
-    :param rate_limit_count: A max fetch count in fetch_count_window for rate limit. When 0, no rate limit.
+    :param rate_limit_count: A max fetch count per host in rate_limit_seconds for rate limit. When 0, no rate limit.
     :param rate_limit_seconds: Seconds for counting fetch for rate limit. When 0, no rate limit.
-    :param num_fetch_processes: A number of fetcher processes
-    :param num_content_processes: A number of processer processes
+    :param chunk_size: A max number of urls a fetcher process takes at once
+    :param num_fetch_processes: A number of fetcher processes, or the initial number with autoscale
+    :param num_content_processes: A number of processer processes, or the initial number with autoscale
+    :param pool_maxsize: A max number of keep-alive connections per host in each fetcher process
+    :param idle_timeout: Seconds to keep idle connections in each fetcher process
+    :param revalidate: Send conditional requests for expired urls with If-None-Match/If-Modified-Since
+    :param rate_limiter: A rate limiter shared by fetcher processes, implements RateLimiterBase.
+                         When None, a shared memory rate limiter is created from rate_limit_count
+                         and rate_limit_seconds.
+    :param max_concurrency_per_host: A max number of requests to a host at once over all the
+                                     fetcher processes, even without a rate limit. Chunks of a
+                                     large domain are taken by many fetcher processes in parallel,
+                                     so this bounds the load on the host. 1 by default, so
+                                     a host gets one request at a time. When 0, no limit.
+    :param max_queued_chunks: A max number of url chunks waiting for fetcher processes.
+                              Reading url_list is blocked while the queue is full.
+    :param meta_batch_size: A max number of metas each content process writes at once
+    :param pre_filter: Check metas before queueing urls, and queue only stale or missing urls
+                       with their metas, so fetcher processes don't read them again
+    :param expiry_index: An ExpiryIndex kept between calls, to skip meta reads of fresh urls.
+                         Content processes update it with the metas they write.
+    :param max_content_length: A max body size. A larger response is dropped while downloading.
+    :param max_queued_responses: A max number of responses waiting for content processes.
+                                 Fetcher processes are blocked while the queue is full.
+    :param max_in_flight_writes: A number of contents each content process stores at once
+                                 on a thread pool. Storages must be thread safe when it is over 1.
+    :param metrics: Hooks called while fetching, e.g. a MetricsRegistry.
+                    It is copied to worker processes, and storages are wrapped to time their calls.
+    :param autoscale: Resize the pools of fetcher and content processes while running
+                      within the bounds. When None, the numbers of processes are fixed.
     :param logger: Logger
+    :return: Statistics of the run aggregated over worker processes
     """
-    fetch_jobs = []
-    content_jobs = []
-    url_queue = url_queue_from_iterable(url_list, logger)
+    started = time.perf_counter()
+    if metrics is not None:
+        meta_storage = InstrumentedMetaStorage(meta_storage, metrics)
+        content_storage = InstrumentedContentStorage(content_storage, metrics)
+    report_queue: "multiprocessing.Queue[FetchReport]" = multiprocessing.Queue()
+    url_queue: "multiprocessing.Queue[UrlQueueItem]" = multiprocessing.Queue(
+        max_queued_chunks
+    )
 
-    response_queue: multiprocessing.Queue[
-        Optional[FetchedResponse]
-    ] = multiprocessing.Queue()
+    response_queue: "multiprocessing.Queue[ResponseQueueItem]" = multiprocessing.Queue(
+        max_queued_responses
+    )
 
     num_fetch_processes = num_fetch_processes or multiprocessing.cpu_count() * 4
     num_content_processes = num_content_processes or multiprocessing.cpu_count()
+    fetch_stats: Optional[PoolStats] = None
+    content_stats: Optional[PoolStats] = None
+    if autoscale is not None:
+        # The initial numbers are in the bounds
+        lower, upper = autoscale.fetch_bounds()
+        num_fetch_processes = min(max(num_fetch_processes, lower), upper)
+        lower, upper = autoscale.content_bounds()
+        num_content_processes = min(max(num_content_processes, lower), upper)
+        fetch_stats = PoolStats()
+        content_stats = PoolStats()
+
+    if rate_limiter is None:
+        # Fetcher processes share the rate limit per host
+        rate_limiter = create_rate_limiter(
+            rate_limit_count, rate_limit_seconds, shared=True
+        )
+    concurrency_limiter = (
+        SharedConcurrencyLimiter(max_concurrency_per_host)
+        if max_concurrency_per_host > 0
+        else None
+    )
+    # Removed at the end with bodies which no content process stored,
+    # e.g. ones left in the queue by a dead worker
+    spool_dir = tempfile.mkdtemp(prefix=SPOOL_DIR_PREFIX)
 
-    for _ in range(num_fetch_processes):
-        fw = FetchWorker(
+    def create_fetch_worker() -> multiprocessing.Process:
+        return FetchWorker(
             url_queue,
             response_queue,
             meta_storage,
             rate_limit_count,
             rate_limit_seconds,
+            pool_maxsize=pool_maxsize,
+            idle_timeout=idle_timeout,
+            revalidate=revalidate,
+            rate_limiter=rate_limiter,
+            concurrency_limiter=concurrency_limiter,
+            max_content_length=max_content_length,
+            spool_dir=spool_dir,
+            report_queue=report_queue,
+            metrics=metrics,
+            stats=fetch_stats,
         )
-        fetch_jobs.append(fw)
-        fw.start()
 
-    for _ in range(num_content_processes):
-        cw = ContentWorker(
+    def create_content_worker() -> multiprocessing.Process:
+        return ContentWorker(
             response_queue,
             min_cache_age,
             content_max_age,
             meta_storage,
             content_storage,
+            meta_batch_size=meta_batch_size,
+            max_in_flight=max_in_flight_writes,
+            expiry_index=expiry_index,
+            report_queue=report_queue,
+            metrics=metrics,
+            stats=content_stats,
         )
-        content_jobs.append(cw)
-        cw.start()
 
-    for _ in fetch_jobs:
-        url_queue.put(None)
+    fetch_pool = WorkerPool(create_fetch_worker, url_queue)
+    fetch_pool.grow(num_fetch_processes)
+    content_pool = WorkerPool(create_content_worker, response_queue)
+    content_pool.grow(num_content_processes)
+
+    autoscaler: Optional[Autoscaler] = None
+    if autoscale is not None and fetch_stats is not None and content_stats is not None:
+        autoscaler = Autoscaler(
+            autoscale,
+            fetch_pool,
+            fetch_stats,
+            content_pool,
+            content_stats,
+            response_queue,
+            max_queued_responses,
+            logger=logger,
+        )
+        autoscaler.start()
+
+    stop_sampling = threading.Event()
+    sampler = threading.Thread(
+        target=sample_queues,
+        args=(
+            metrics,
+            {URL_QUEUE: url_queue, RESPONSE_QUEUE: response_queue},
+            stop_sampling,
+        ),
+        daemon=True,
+    )
+    if metrics is not None:
+        sampler.start()
+
+    # url_list is read while fetching, and put() blocks while url_queue is full
+    report = FetchReport()
+    url_count = 0
+    for url_chunk in scheduled_url_chunks(
+        url_list,
+        meta_storage,
+        chunk_size,
+        pre_filter=pre_filter,
+        expiry_index=expiry_index,
+        report=report.plan,
+        logger=logger,
+    ):
+        url_queue.put(url_chunk)
+        url_count += len(url_chunk)
+    logger.info(f"queued {url_count} urls")
+
+    if autoscaler is not None:
+        # Fetchers are still resized until they take all the chunks
+        wait_empty(url_queue, REPORT_POLL_INTERVAL)
 
     # Wait for fetching all the caches
-    for fj in fetch_jobs:
-        fj.join()
+    fetch_pool.close()
+    collected = collect_reports(report_queue, fetch_pool.workers, report)
 
     # Now nobody puts an item into `response_queue`, so we adds a terminator.
-    for _ in content_jobs:
-        response_queue.put(None)
+    if autoscaler is not None:
+        autoscaler.stop()
+    content_pool.close()
 
     # Wait for optimizing all the caches
-    for cj in content_jobs:
-        cj.join()
+    collected += collect_reports(report_queue, content_pool.workers, report)
+    workers = len(fetch_pool.workers) + len(content_pool.workers)
+    while collected < workers:
+        try:
+            report.merge(report_queue.get(timeout=REPORT_POLL_INTERVAL))
+            collected += 1
+        except queue.Empty:
+            # A worker died without a report
+            break
+    shutil.rmtree(spool_dir, ignore_errors=True)
+    if metrics is not None:
+        stop_sampling.set()
+        sampler.join()
+    if autoscale is not None:
+        logger.info(
+            f"used {len(fetch_pool.workers)} fetcher processes "
+            f"and {len(content_pool.workers)} content processes"
+        )
 
-    logger.info("fetched")
+    report.elapsed = time.perf_counter() - started
+    logger.info(f"fetched\n{report}")
+    return report
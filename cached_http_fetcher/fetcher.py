@@ -0,0 +1,300 @@
+import multiprocessing
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from logging import Logger
+from typing import Any, Iterable, List, Optional
+
+from .entrypoint import (
+    DEFAULT_CONTENT_MAX_AGE,
+    DEFAULT_MAX_IN_FLIGHT_WRITES,
+    DEFAULT_MAX_QUEUED_CHUNKS,
+    DEFAULT_MAX_QUEUED_RESPONSES,
+    DEFAULT_META_BATCH_SIZE,
+    DEFAULT_MIN_CACHE_AGE,
+    REPORT_POLL_INTERVAL,
+    SPOOL_DIR_PREFIX,
+    BatchEnd,
+    ContentWorker,
+    FetchWorker,
+    ResponseQueueItem,
+    UrlQueueItem,
+    collect_reports,
+    scheduled_url_chunks,
+)
+from .metrics import (
+    RESPONSE_QUEUE,
+    URL_QUEUE,
+    InstrumentedContentStorage,
+    InstrumentedMetaStorage,
+    MetricsHook,
+    sample_queues,
+)
+from .plan import ExpiryIndex
+from .rate_limiter import (
+    DEFAULT_MAX_CONCURRENCY_PER_HOST,
+    RateLimiterBase,
+    SharedConcurrencyLimiter,
+    create_rate_limiter,
+)
+from .report import FetchReport
+from .request import DEFAULT_IDLE_TIMEOUT, DEFAULT_POOL_MAXSIZE
+from .storage import ContentStorageBase, MetaStorageBase
+from .url_list import DEFAULT_CHUNK_SIZE
+
+
+class Fetcher:
+    """
+    Worker processes of fetch_urls() kept running over batches of urls
+
+    The processes are started once, and each fetcher process keeps its
+    connections open between batches, so a small batch doesn't pay for
+    starting processes and connecting to hosts. Batches are fetched one at a time.
+
+    with Fetcher(meta_storage, content_storage, logger=logger) as fetcher:
+        report = fetcher.submit(url_list)
+
+    The parameters are the same as fetch_urls().
+    """
+
+    def __init__(
+        self,
+        meta_storage: MetaStorageBase,
+        content_storage: ContentStorageBase,
+        *,
+        rate_limit_count: int = 0,
+        rate_limit_seconds: int = 0,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        min_cache_age: int = DEFAULT_MIN_CACHE_AGE,
+        content_max_age: int = DEFAULT_CONTENT_MAX_AGE,
+        num_fetch_processes: Optional[int] = None,
+        num_content_processes: Optional[int] = None,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        revalidate: bool = True,
+        rate_limiter: Optional[RateLimiterBase] = None,
+        max_concurrency_per_host: int = DEFAULT_MAX_CONCURRENCY_PER_HOST,
+        max_queued_chunks: int = DEFAULT_MAX_QUEUED_CHUNKS,
+        meta_batch_size: int = DEFAULT_META_BATCH_SIZE,
+        pre_filter: bool = True,
+        expiry_index: Optional[ExpiryIndex] = None,
+        max_content_length: Optional[int] = None,
+        max_queued_responses: int = DEFAULT_MAX_QUEUED_RESPONSES,
+        max_in_flight_writes: int = DEFAULT_MAX_IN_FLIGHT_WRITES,
+        metrics: Optional[MetricsHook] = None,
+        logger: Logger,
+    ) -> None:
+        if metrics is not None:
+            meta_storage = InstrumentedMetaStorage(meta_storage, metrics)
+            content_storage = InstrumentedContentStorage(content_storage, metrics)
+        self._meta_storage = meta_storage
+        self._chunk_size = chunk_size
+        self._pre_filter = pre_filter
+        self._expiry_index = expiry_index
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        # Set when a worker process exits, which leaves the others waiting
+        self._broken = False
+
+        self._report_queue: "multiprocessing.Queue[FetchReport]" = (
+            multiprocessing.Queue()
+        )
+        self._url_queue: "multiprocessing.Queue[UrlQueueItem]" = multiprocessing.Queue(
+            max_queued_chunks
+        )
+        self._response_queue: "multiprocessing.Queue[ResponseQueueItem]" = (
+            multiprocessing.Queue(max_queued_responses)
+        )
+        self._spool_dir = tempfile.mkdtemp(prefix=SPOOL_DIR_PREFIX)
+        # Released by content processes for each response of a batch
+        self._processed = multiprocessing.Semaphore(0)
+
+        num_fetch_processes = num_fetch_processes or multiprocessing.cpu_count() * 4
+        num_content_processes = num_content_processes or multiprocessing.cpu_count()
+        # Each worker takes exactly one BatchEnd, since it waits on the
+        # barrier until all the others of its pool take theirs
+        fetch_barrier = multiprocessing.Barrier(num_fetch_processes)
+        content_barrier = multiprocessing.Barrier(num_content_processes)
+
+        if rate_limiter is None:
+            # Fetcher processes share the rate limit per host
+            rate_limiter = create_rate_limiter(
+                rate_limit_count, rate_limit_seconds, shared=True
+            )
+        concurrency_limiter = (
+            SharedConcurrencyLimiter(max_concurrency_per_host)
+            if max_concurrency_per_host > 0
+            else None
+        )
+
+        self._fetch_workers: List[multiprocessing.Process] = [
+            FetchWorker(
+                self._url_queue,
+                self._response_queue,
+                meta_storage,
+                rate_limit_count,
+                rate_limit_seconds,
+                pool_maxsize=pool_maxsize,
+                idle_timeout=idle_timeout,
+                revalidate=revalidate,
+                rate_limiter=rate_limiter,
+                concurrency_limiter=concurrency_limiter,
+                max_content_length=max_content_length,
+                spool_dir=self._spool_dir,
+                report_queue=self._report_queue,
+                metrics=metrics,
+                barrier=fetch_barrier,
+            )
+            for _ in range(num_fetch_processes)
+        ]
+        self._content_workers: List[multiprocessing.Process] = [
+            ContentWorker(
+                self._response_queue,
+                min_cache_age,
+                content_max_age,
+                meta_storage,
+                content_storage,
+                meta_batch_size=meta_batch_size,
+                max_in_flight=max_in_flight_writes,
+                expiry_index=expiry_index,
+                report_queue=self._report_queue,
+                metrics=metrics,
+                barrier=content_barrier,
+                processed=self._processed,
+            )
+            for _ in range(num_content_processes)
+        ]
+
+        self._stop_sampling = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        if metrics is not None:
+            self._sampler = threading.Thread(
+                target=sample_queues,
+                args=(
+                    metrics,
+                    {URL_QUEUE: self._url_queue, RESPONSE_QUEUE: self._response_queue},
+                    self._stop_sampling,
+                ),
+                daemon=True,
+            )
+
+    def __enter__(self) -> "Fetcher":
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Fetcher is closed")
+            if self._started:
+                return
+            self._started = True
+            for worker in self._fetch_workers + self._content_workers:
+                worker.start()
+            if self._sampler is not None:
+                self._sampler.start()
+
+    def submit(self, url_list: Iterable[str]) -> FetchReport:
+        """
+        Fetch urls in the worker processes, and wait until they are stored
+
+        :param url_list: List of urls to be fetched
+        :return: Statistics of the batch aggregated over worker processes
+        """
+        self.start()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Fetcher is closed")
+            started = time.perf_counter()
+            report = FetchReport()
+            url_count = 0
+            for url_chunk in scheduled_url_chunks(
+                url_list,
+                self._meta_storage,
+                self._chunk_size,
+                pre_filter=self._pre_filter,
+                expiry_index=self._expiry_index,
+                report=report.plan,
+                logger=self._logger,
+            ):
+                self._url_queue.put(url_chunk)
+                url_count += len(url_chunk)
+
+            # Every fetched response has a status code
+            fetched = FetchReport()
+            self._end_batch(self._url_queue, self._fetch_workers, fetched)
+            report.merge(fetched)
+            for _ in range(sum(fetched.status_codes.values())):
+                while not self._processed.acquire(timeout=REPORT_POLL_INTERVAL):
+                    self._check_workers()
+            # Now the content processes have nothing but pending metas
+            self._end_batch(self._response_queue, self._content_workers, report)
+
+            report.elapsed = time.perf_counter() - started
+            self._logger.info(f"fetched {url_count} urls")
+            self._logger.info(str(report))
+            return report
+
+    def _end_batch(
+        self,
+        q: "multiprocessing.Queue[Any]",
+        workers: List[multiprocessing.Process],
+        report: FetchReport,
+    ) -> None:
+        for _ in workers:
+            q.put(BatchEnd())
+        for _ in workers:
+            while True:
+                try:
+                    report.merge(self._report_queue.get(timeout=REPORT_POLL_INTERVAL))
+                    break
+                except queue.Empty:
+                    self._check_workers()
+
+    def _check_workers(self) -> None:
+        workers = self._fetch_workers + self._content_workers
+        if not all(worker.is_alive() for worker in workers):
+            self._broken = True
+            self._closed = True
+            raise RuntimeError("a worker process of Fetcher exited")
+
+    def close(self) -> None:
+        """
+        Stop the worker processes after the current batch
+        """
+        with self._lock:
+            if self._closed and not self._broken:
+                return
+            self._closed = True
+            if not self._started:
+                shutil.rmtree(self._spool_dir, ignore_errors=True)
+                return
+            workers = self._fetch_workers + self._content_workers
+            if self._broken:
+                # Live workers may be waiting on a barrier forever
+                for worker in workers:
+                    worker.terminate()
+                for worker in workers:
+                    worker.join()
+                self._broken = False
+            else:
+                # Reports are empty since the last batch
+                for _ in self._fetch_workers:
+                    self._url_queue.put(None)
+                collect_reports(self._report_queue, self._fetch_workers, FetchReport())
+                for _ in self._content_workers:
+                    self._response_queue.put(None)
+                collect_reports(
+                    self._report_queue, self._content_workers, FetchReport()
+                )
+            shutil.rmtree(self._spool_dir, ignore_errors=True)
+            if self._sampler is not None:
+                self._stop_sampling.set()
+                self._sampler.join()
@@ -1,9 +1,9 @@
-import pickle
 from logging import Logger
-from typing import Optional
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
 
+from .codec import decode_meta, encode_meta
 from .model import Meta
-from .storage import MetaStorageBase
+from .storage import AsyncMetaStorageBase, MetaStorageBase
 
 
 def put_meta(
@@ -12,7 +12,7 @@ def put_meta(
     if meta is None:
         meta_storage.delete(source_url)
     else:
-        meta_storage.put(source_url, pickle.dumps(meta))
+        meta_storage.put(source_url, encode_meta(meta))
 
 
 def get_meta(
@@ -22,11 +22,11 @@ def get_meta(
     get a Meta instance from url
     """
 
-    meta_pickled = meta_storage.get(source_url)
-    if meta_pickled is None:
+    meta_encoded = meta_storage.get(source_url)
+    if meta_encoded is None:
         return None
     try:
-        meta: Meta = pickle.loads(meta_pickled)
+        meta = decode_meta(meta_encoded)
         return meta
     except Exception:
         logger.error(f"Invalid meta data: {source_url}")
@@ -48,3 +48,126 @@ def get_valid_meta(
     if meta is None or (now > 0 and meta.expired_at < now):
         return None
     return meta
+
+
+def put_metas(
+    metas: Mapping[str, Optional[Meta]], meta_storage: MetaStorageBase
+) -> None:
+    """
+    put Meta instances at once, where None deletes the entry
+    """
+    values: Dict[str, bytes] = {}
+    deleted: List[str] = []
+    for source_url, meta in metas.items():
+        if meta is None:
+            deleted.append(source_url)
+        else:
+            values[source_url] = encode_meta(meta)
+    if values:
+        meta_storage.put_many(values)
+    if deleted:
+        meta_storage.delete_many(deleted)
+
+
+def get_metas(
+    source_urls: Sequence[str], meta_storage: MetaStorageBase, *, logger: Logger
+) -> List[Optional[Meta]]:
+    """
+    get Meta instances from urls at once
+
+    Unlike get_meta(), an invalid entry is removed and returned as None,
+    so it doesn't fail the other urls.
+    """
+    metas, invalid_urls = decode_metas(
+        source_urls, meta_storage.get_many(source_urls), logger=logger
+    )
+    if invalid_urls:
+        meta_storage.delete_many(invalid_urls)
+    return metas
+
+
+def decode_metas(
+    source_urls: Sequence[str],
+    values: Sequence[Optional[bytes]],
+    *,
+    logger: Logger,
+) -> Tuple[List[Optional[Meta]], List[str]]:
+    """
+    Decode metas, and return them with urls of invalid entries
+    """
+    metas: List[Optional[Meta]] = []
+    invalid_urls: List[str] = []
+    for source_url, meta_encoded in zip(source_urls, values):
+        meta: Optional[Meta] = None
+        if meta_encoded is not None:
+            try:
+                meta = decode_meta(meta_encoded)
+            except Exception:
+                logger.error(f"Invalid meta data: {source_url}")
+                invalid_urls.append(source_url)
+        metas.append(meta)
+    return metas, invalid_urls
+
+
+def get_valid_metas(
+    source_urls: Sequence[str],
+    now: int,
+    meta_storage: MetaStorageBase,
+    *,
+    logger: Logger,
+) -> List[Optional[Meta]]:
+    """
+    get valid Meta instances from urls at once
+
+    :param now: current epoch for cache invalidation. When 0, no cache invalidation.
+    """
+
+    return valid_metas(get_metas(source_urls, meta_storage, logger=logger), now)
+
+
+def valid_metas(metas: List[Optional[Meta]], now: int) -> List[Optional[Meta]]:
+    return [
+        None if meta is None or (now > 0 and meta.expired_at < now) else meta
+        for meta in metas
+    ]
+
+
+async def put_meta_async(
+    source_url: str, meta: Optional[Meta], meta_storage: AsyncMetaStorageBase
+) -> None:
+    """
+    An asyncio version of put_meta()
+    """
+    if meta is None:
+        await meta_storage.delete(source_url)
+    else:
+        await meta_storage.put(source_url, encode_meta(meta))
+
+
+async def get_metas_async(
+    source_urls: Sequence[str], meta_storage: AsyncMetaStorageBase, *, logger: Logger
+) -> List[Optional[Meta]]:
+    """
+    An asyncio version of get_metas()
+    """
+    metas, invalid_urls = decode_metas(
+        source_urls, await meta_storage.get_many(source_urls), logger=logger
+    )
+    if invalid_urls:
+        await meta_storage.delete_many(invalid_urls)
+    return metas
+
+
+async def get_valid_metas_async(
+    source_urls: Sequence[str],
+    now: int,
+    meta_storage: AsyncMetaStorageBase,
+    *,
+    logger: Logger,
+) -> List[Optional[Meta]]:
+    """
+    An asyncio version of get_valid_metas()
+    """
+    return valid_metas(
+        await get_metas_async(source_urls, meta_storage, logger=logger), now
+    )
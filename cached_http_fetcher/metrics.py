@@ -0,0 +1,448 @@
+import bisect
+import glob
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from .report import LATENCY_BUCKETS
+from .storage import ContentStorageBase, ContentStream, MetaStorageBase
+
+PREFIX = "cached_http_fetcher_"
+DEFAULT_PUSH_INTERVAL = 1.0
+
+# Queues sampled by fetch_urls()
+URL_QUEUE = "url"
+RESPONSE_QUEUE = "response"
+
+# (metric name, sorted label pairs)
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class MetricsHook:
+    """
+    Hooks called while fetching, which do nothing by default
+
+    Override the ones you need, and pass an instance as `metrics` to
+    fetch_urls(). It is copied to each worker process, so it must be
+    picklable, and it is called from multiple threads.
+    """
+
+    def queue_depth(self, queue: str, depth: int) -> None:
+        """
+        A number of items in url_queue or response_queue, sampled periodically
+        """
+
+    def request_started(self) -> None:
+        pass
+
+    def request_finished(self) -> None:
+        pass
+
+    def rate_limit_wait(self, host: str, seconds: float) -> None:
+        """
+        Seconds a fetcher sleeps for the rate limit of host
+        """
+
+    def retry(self, reason: str) -> None:
+        """
+        A request is retried after a connection error or a timeout
+        """
+
+    def storage_call(self, storage: str, method: str, seconds: float) -> None:
+        """
+        Latency of a storage call, where storage is "meta" or "content"
+        """
+
+    def flush(self) -> None:
+        """
+        Called when a worker process finishes
+        """
+
+
+class MetricsRegistry(MetricsHook):
+    """
+    A MetricsHook which keeps counters, gauges and histograms in memory,
+    and exports them in the Prometheus text format
+
+    Each worker process writes a snapshot of its own metrics to a file in
+    directory at most every push_interval seconds, and the process which
+    created the registry adds them up on export. Use it as a context
+    manager, or call close() to stop the HTTP server and remove directory.
+
+    :param directory: A directory for snapshots of worker processes. When None, a temporary one.
+    :param push_interval: Seconds between snapshots of a worker process
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        push_interval: float = DEFAULT_PUSH_INTERVAL,
+    ) -> None:
+        self._own_directory = directory is None
+        self._directory = directory or tempfile.mkdtemp(
+            prefix="cached-http-fetcher-metrics-"
+        )
+        self._push_interval = push_interval
+        self._owner_pid = os.getpid()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        # A pid can be reused by a later worker, so a snapshot has a unique name
+        self._snapshot_path = os.path.join(
+            self._directory, f"{self._pid}-{os.urandom(4).hex()}.pickle"
+        )
+        self._lock = threading.Lock()
+        self._counters: Dict[Key, float] = {}
+        self._gauges: Dict[Key, float] = {}
+        self._histograms: Dict[Key, List[float]] = {}
+        self._pushed_at = 0.0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {
+            "directory": self._directory,
+            "push_interval": self._push_interval,
+            "owner_pid": self._owner_pid,
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self._own_directory = False
+        self._directory = state["directory"]
+        self._push_interval = state["push_interval"]
+        self._owner_pid = state["owner_pid"]
+        self._server = None
+        self._reset()
+
+    def __enter__(self) -> "MetricsRegistry":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _check_pid(self) -> None:
+        if self._pid != os.getpid():
+            # Values inherited by fork() are counted by the parent
+            self._reset()
+
+    def _record(
+        self, kind: str, name: str, labels: Mapping[str, str], value: float
+    ) -> None:
+        self._check_pid()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if kind == "counter":
+                self._counters[key] = self._counters.get(key, 0) + value
+            elif kind == "gauge":
+                self._gauges[key] = self._gauges.get(key, 0) + value
+            elif kind == "gauge_set":
+                self._gauges[key] = value
+            else:
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    # bucket counts, then sum and count
+                    histogram = self._histograms[key] = [0.0] * (
+                        len(LATENCY_BUCKETS) + 3
+                    )
+                histogram[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+                histogram[-2] += value
+                histogram[-1] += 1
+            push = (
+                self._pid != self._owner_pid
+                and time.monotonic() - self._pushed_at >= self._push_interval
+            )
+        if push:
+            self.push()
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        self._record("counter", name, labels, value)
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        self._record("gauge_set", name, labels, value)
+
+    def add(self, name: str, value: float, **labels: str) -> None:
+        self._record("gauge", name, labels, value)
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        self._record("histogram", name, labels, seconds)
+
+    def queue_depth(self, queue: str, depth: int) -> None:
+        self.set("queue_depth", depth, queue=queue)
+
+    def request_started(self) -> None:
+        self.add("in_flight_requests", 1)
+
+    def request_finished(self) -> None:
+        self.add("in_flight_requests", -1)
+
+    def rate_limit_wait(self, host: str, seconds: float) -> None:
+        # Hosts aren't labels, since there can be too many of them
+        self.observe("rate_limit_wait_seconds", seconds)
+
+    def retry(self, reason: str) -> None:
+        self.inc("request_retries_total", reason=reason)
+
+    def storage_call(self, storage: str, method: str, seconds: float) -> None:
+        self.observe("storage_call_seconds", seconds, storage=storage, method=method)
+
+    def flush(self) -> None:
+        if os.getpid() != self._owner_pid:
+            self.push()
+
+    def _snapshot(
+        self,
+    ) -> Tuple[Dict[Key, float], Dict[Key, float], Dict[Key, List[float]]]:
+        with self._lock:
+            return (
+                dict(self._counters),
+                dict(self._gauges),
+                {key: list(values) for key, values in self._histograms.items()},
+            )
+
+    def push(self) -> None:
+        """
+        Write a snapshot of this process, which replaces the previous one
+        """
+        self._check_pid()
+        self._pushed_at = time.monotonic()
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(self._snapshot(), f)
+        os.replace(tmp_path, self._snapshot_path)
+
+    def collect(
+        self,
+    ) -> Tuple[Dict[Key, float], Dict[Key, float], Dict[Key, List[float]]]:
+        """
+        Sum up metrics of this process and snapshots of worker processes
+        """
+        self._check_pid()
+        counters, gauges, histograms = self._snapshot()
+        for path in glob.glob(os.path.join(self._directory, "*.pickle")):
+            if path == self._snapshot_path:
+                continue
+            try:
+                with open(path, "rb") as f:
+                    other = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            for target, values in zip((counters, gauges), other[:2]):
+                for key, value in values.items():
+                    target[key] = target.get(key, 0) + value
+            for key, values in other[2].items():
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histograms[key] = values
+                else:
+                    histograms[key] = [a + b for a, b in zip(histogram, values)]
+        return counters, gauges, histograms
+
+    def export(self) -> str:
+        """
+        Metrics in the Prometheus text format
+        """
+        counters, gauges, histograms = self.collect()
+        lines: List[str] = []
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({key[0] for key in values}):
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{PREFIX}{name}{format_labels(labels)} {value:g}")
+        for name in sorted({key[0] for key in histograms}):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0.0
+                for bound, count in zip(
+                    LATENCY_BUCKETS + (float("inf"),), histogram[:-2]
+                ):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(
+                        f"{PREFIX}{name}_bucket"
+                        f"{format_labels(labels + (('le', le),))} {cumulative:g}"
+                    )
+                lines.append(
+                    f"{PREFIX}{name}_sum{format_labels(labels)} {histogram[-2]:g}"
+                )
+                lines.append(
+                    f"{PREFIX}{name}_count{format_labels(labels)} {histogram[-1]:g}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 0, host: str = "127.0.0.1") -> Tuple[str, int]:
+        """
+        Serve export() on http://host:port/metrics in a daemon thread, and
+        return the bound address
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.export().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.server_address[:2]  # type: ignore
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._own_directory and os.getpid() == self._owner_pid:
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+
+def format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def sample_queues(
+    metrics: MetricsHook,
+    queues: Mapping[str, Any],
+    stop: threading.Event,
+    interval: float = DEFAULT_PUSH_INTERVAL,
+) -> None:
+    """
+    Report depths of queues until stop is set, and once more after that
+    """
+    stopped = False
+    while not stopped:
+        stopped = stop.wait(interval)
+        for name, q in queues.items():
+            try:
+                metrics.queue_depth(name, q.qsize())
+            except NotImplementedError:
+                # qsize() isn't available on macOS
+                return
+
+
+class InstrumentedMetaStorage(MetaStorageBase):
+    """
+    A MetaStorageBase which reports latency of each call of storage to metrics
+    """
+
+    def __init__(self, storage: MetaStorageBase, metrics: MetricsHook) -> None:
+        self.storage = storage
+        self._metrics = metrics
+
+    def _call(self, method: str, *args: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return getattr(self.storage, method)(*args)
+        finally:
+            self._metrics.storage_call("meta", method, time.perf_counter() - started)
+
+    def get(self, source_url: str) -> Optional[bytes]:
+        return self._call("get", source_url)  # type: ignore
+
+    def delete(self, source_url: str) -> None:
+        self._call("delete", source_url)
+
+    def put(self, source_url: str, value: bytes) -> None:
+        self._call("put", source_url, value)
+
+    def get_many(self, source_urls: Sequence[str]) -> List[Optional[bytes]]:
+        return self._call("get_many", source_urls)  # type: ignore
+
+    def delete_many(self, source_urls: Sequence[str]) -> None:
+        self._call("delete_many", source_urls)
+
+    def put_many(self, values: Mapping[str, bytes]) -> None:
+        self._call("put_many", values)
+
+
+class InstrumentedContentStorage(ContentStorageBase):
+    """
+    A ContentStorageBase which reports latency of each call of storage to metrics
+    """
+
+    def __init__(self, storage: ContentStorageBase, metrics: MetricsHook) -> None:
+        self.storage = storage
+        self._metrics = metrics
+
+    def _call(self, method: str, *args: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return getattr(self.storage, method)(*args)
+        finally:
+            self._metrics.storage_call("content", method, time.perf_counter() - started)
+
+    def get(self, source_url: str) -> Optional[bytes]:
+        return self._call("get", source_url)  # type: ignore
+
+    def delete(self, source_url: str) -> None:
+        self._call("delete", source_url)
+
+    def put_content(
+        self,
+        source_url: str,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self._call("put_content", source_url, value, cache_control, content_type)
+
+    def put_content_stream(
+        self,
+        source_url: str,
+        stream: ContentStream,
+        length: int,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self._call(
+            "put_content_stream",
+            source_url,
+            stream,
+            length,
+            sha1,
+            cache_control,
+            content_type,
+        )
+
+    def put_hashed_content(
+        self,
+        source_url: str,
+        value: bytes,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self._call(
+            "put_hashed_content", source_url, value, sha1, cache_control, content_type
+        )
+
+    # Building a url isn't a storage call
+    def cached_url(self, source_url: str) -> str:
+        return self.storage.cached_url(source_url)
+
+    def cached_content_url(self, source_url: str, content_sha1: bytes) -> str:
+        return self.storage.cached_content_url(source_url, content_sha1)
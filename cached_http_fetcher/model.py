@@ -1,22 +1,97 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 
-import requests
 
+class FrozenSlots:
+    """
+    A base of frozen dataclasses with __slots__
+
+    The default pickling of frozen dataclasses with __slots__ doesn't work on
+    Python < 3.10, so they are pickled as a plain tuple of values.
+    """
+
+    __slots__: Tuple[str, ...] = ()
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return (
+            self.__class__,
+            tuple(getattr(self, name) for name in self.__slots__),
+        )
+
+
+@dataclass(frozen=True, init=False)
+class Meta(FrozenSlots):
+    __slots__ = (
+        "cached_url",
+        "etag",
+        "last_modified",
+        "content_sha1",
+        "fetched_at",
+        "expired_at",
+        "content_length",
+    )
 
-@dataclass(frozen=True)
-class Meta:
     cached_url: Optional[str]  # None for non 200 responses
     etag: Optional[str]
     last_modified: Optional[str]
     content_sha1: Optional[bytes]
     fetched_at: int
     expired_at: int
+    content_length: Optional[int]
+
+    # A default value would conflict with __slots__, so __init__ gives it
+    def __init__(
+        self,
+        cached_url: Optional[str],
+        etag: Optional[str],
+        last_modified: Optional[str],
+        content_sha1: Optional[bytes],
+        fetched_at: int,
+        expired_at: int,
+        content_length: Optional[int] = None,
+    ) -> None:
+        object.__setattr__(self, "cached_url", cached_url)
+        object.__setattr__(self, "etag", etag)
+        object.__setattr__(self, "last_modified", last_modified)
+        object.__setattr__(self, "content_sha1", content_sha1)
+        object.__setattr__(self, "fetched_at", fetched_at)
+        object.__setattr__(self, "expired_at", expired_at)
+        object.__setattr__(self, "content_length", content_length)
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Restore Meta pickled before it had __slots__
+        for name in self.__slots__:
+            object.__setattr__(self, name, state.get(name, None))
 
 
 @dataclass(frozen=True)
-class FetchedResponse:
+class FetchedResponse(FrozenSlots):
+    """
+    A response passed from a fetcher process to a content process
+
+    Only the status, the headers we use and the body are kept, so it can be
+    pickled cheaply. A large body is spooled to a temporary file in the fetcher
+    process, and only its path is passed.
+    """
+
+    __slots__ = (
+        "url",
+        "fetched_at",
+        "status_code",
+        "headers",
+        "content",
+        "content_file",
+        "content_sha1",
+        "body_skipped",
+        "old_meta",
+    )
+
     url: str
     fetched_at: int
-    response: requests.Response
+    status_code: int
+    headers: Dict[str, str]  # lower-cased header names
+    content: Optional[bytes]
+    content_file: Optional[str]  # a path of the spooled body
+    content_sha1: Optional[bytes]  # hashed while reading the body
+    body_skipped: bool  # unchanged by validators, so the body wasn't read
     old_meta: Optional[Meta]
@@ -0,0 +1,133 @@
+import ctypes
+import multiprocessing
+import time
+from dataclasses import dataclass
+from logging import Logger
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .meta import get_metas
+from .model import Meta
+from .storage import MetaStorageBase
+from .url_list import url_digest
+
+# 16 bytes per slot, so 16 MiB
+DEFAULT_EXPIRY_INDEX_SLOTS = 1 << 20
+
+
+@dataclass
+class PlanReport:
+    fresh: int = 0  # still valid, not scheduled
+    stale: int = 0  # expired, scheduled
+    missing: int = 0  # not cached yet, scheduled
+
+    def __str__(self) -> str:
+        return f"{self.fresh} fresh, {self.stale} stale, {self.missing} missing urls"
+
+
+@dataclass
+class PlannedChunk:
+    """
+    Urls of a host to be fetched, with their metas read while planning
+
+    A meta is None for a missing url. Fetcher processes use the metas
+    instead of reading them again.
+    """
+
+    urls: List[str]
+    metas: List[Optional[Meta]]
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+
+class ExpiryIndex:
+    """
+    An index of expired_at by url, shared by processes
+
+    Urls are indexed by 64-bit digests in a fixed-size table in shared memory,
+    so it must be created before worker processes are started. It is filled
+    while planning, and content processes update it when they write metas.
+    Each url has one slot, and a url overwrites an earlier url sharing the
+    slot, whose meta is read again next time. Keep an instance between runs
+    to skip meta reads of urls which are known to be fresh.
+
+    :param num_slots: A number of slots, which bounds the memory usage
+    """
+
+    def __init__(self, num_slots: int = DEFAULT_EXPIRY_INDEX_SLOTS) -> None:
+        self._num_slots = num_slots
+        self._lock = multiprocessing.Lock()
+        # A digest of 0 is an empty slot
+        self._digests = multiprocessing.RawArray(ctypes.c_uint64, num_slots)
+        self._expired_at = multiprocessing.RawArray(ctypes.c_int64, num_slots)
+        self._size = multiprocessing.RawValue(ctypes.c_int64, 0)
+
+    def __len__(self) -> int:
+        return self._size.value
+
+    def _slot(self, source_url: str) -> Tuple[int, int]:
+        digest = url_digest(source_url) or 1
+        return digest, digest % self._num_slots
+
+    def get(self, source_url: str) -> Optional[int]:
+        digest, slot = self._slot(source_url)
+        with self._lock:
+            if self._digests[slot] != digest:
+                return None
+            return self._expired_at[slot]
+
+    def update(self, source_url: str, expired_at: int) -> None:
+        digest, slot = self._slot(source_url)
+        with self._lock:
+            if self._digests[slot] == 0:
+                self._size.value += 1
+            self._digests[slot] = digest
+            self._expired_at[slot] = expired_at
+
+
+def plan_url_chunks(
+    url_chunks: Iterable[List[str]],
+    meta_storage: MetaStorageBase,
+    *,
+    expiry_index: Optional[ExpiryIndex] = None,
+    report: PlanReport,
+    logger: Logger,
+) -> Iterator[PlannedChunk]:
+    """
+    Drop fresh urls from url chunks, so only stale or missing urls are fetched
+
+    Metas are read in a batch per chunk, except urls which are fresh in
+    expiry_index, and passed to fetcher processes with the urls. Counts of
+    each category are added to report.
+    """
+    for url_chunk in url_chunks:
+        now = int(time.time())
+        unknown_urls = []
+        for url in url_chunk:
+            expired_at = expiry_index.get(url) if expiry_index is not None else None
+            if expired_at is not None and expired_at > now:
+                report.fresh += 1
+            else:
+                unknown_urls.append(url)
+        if not unknown_urls:
+            continue
+
+        scheduled = PlannedChunk([], [])
+        metas = get_metas(unknown_urls, meta_storage, logger=logger)
+        for url, meta in zip(unknown_urls, metas):
+            if meta is None:
+                report.missing += 1
+                scheduled.urls.append(url)
+                scheduled.metas.append(None)
+                continue
+            if expiry_index is not None:
+                expiry_index.update(url, meta.expired_at)
+            if meta.expired_at > now:
+                report.fresh += 1
+            else:
+                report.stale += 1
+                scheduled.urls.append(url)
+                scheduled.metas.append(meta)
+
+        if scheduled.urls:
+            yield scheduled
@@ -1,49 +1,101 @@
-import sys
 import time
+from contextlib import ExitStack
 from logging import Logger
-from typing import Generator, Optional
+from typing import TYPE_CHECKING, Generator, Optional
+from urllib.parse import urlparse
 
 from requests import RequestException
 
 from .model import FetchedResponse, Meta
-from .request import cached_requests_get
+from .rate_limiter import (
+    RateLimiterBase,
+    SharedConcurrencyLimiter,
+    create_rate_limiter,
+)
+from .request import FetchSession, cached_requests_get
+
+if TYPE_CHECKING:
+    from .metrics import MetricsHook
 
 
 class RateLimitFetcher:
+    """
+    Fetch urls with a rate limit per host
+
+    :param max_fetch_count: A max fetch count in fetch_count_window. When 0, no rate limit.
+    :param fetch_count_window: Seconds for counting fetch. When 0, no rate limit.
+    :param rate_limiter: A rate limiter shared with other fetchers.
+                         When None, a rate limiter in this process is used.
+    :param concurrency_limiter: A limit of requests per host at once shared with other fetchers.
+                                When None, no limit.
+    :param max_content_length: A max body size. A larger response is dropped.
+    :param spool_dir: A directory of temporary files holding large bodies
+    :param metrics: Hooks called on rate limit waits, requests and retries
+    """
+
     def __init__(
-        self, *, max_fetch_count: int, fetch_count_window: int, logger: Logger
+        self,
+        *,
+        max_fetch_count: int,
+        fetch_count_window: int,
+        session: Optional[FetchSession] = None,
+        rate_limiter: Optional[RateLimiterBase] = None,
+        concurrency_limiter: Optional[SharedConcurrencyLimiter] = None,
+        max_content_length: Optional[int] = None,
+        spool_dir: Optional[str] = None,
+        metrics: "Optional[MetricsHook]" = None,
+        logger: Logger,
     ):
-        self._max_fetch_count = max_fetch_count
-        self._fetch_count_window = fetch_count_window
-        if self._max_fetch_count == 0 or self._fetch_count_window == 0:
-            self._max_fetch_count = sys.maxsize
-            self._fetch_count_window = sys.maxsize
+        self._session = session
+        self._max_content_length = max_content_length
+        self._spool_dir = spool_dir
+        self._metrics = metrics
+        if rate_limiter is None:
+            rate_limiter = create_rate_limiter(
+                max_fetch_count, fetch_count_window, shared=False
+            )
+        self._rate_limiter = rate_limiter
+        self._concurrency_limiter = concurrency_limiter
         self._logger = logger
 
-        self.fetch_count_start = time.time()
-        self.fetch_count = 0
-
     def fetch(
         self, url: str, old_meta: Optional[Meta], now: int
     ) -> Generator[FetchedResponse, None, None]:
         try:
-            elapsed = now - self.fetch_count_start
-            remaining = self._fetch_count_window - elapsed
-            if remaining <= 0:
-                self.fetch_count_start = time.time()
-                self.fetch_count = 0
-
-            fetched_response = cached_requests_get(
-                url, old_meta, now, logger=self._logger
-            )
+            # A still valid url isn't requested, so it doesn't take a token
+            requested = old_meta is None or old_meta.expired_at <= now
+            host = urlparse(url).netloc
+            if self._rate_limiter is not None and requested:
+                wait = self._rate_limiter.acquire(host)
+                if wait > 0:
+                    if self._metrics is not None:
+                        self._metrics.rate_limit_wait(host, wait)
+                    time.sleep(wait)
+
+            with ExitStack() as stack:
+                if self._concurrency_limiter is not None and requested:
+                    # Held while the body is read
+                    stack.enter_context(self._concurrency_limiter.hold(host))
+                if self._metrics is not None:
+                    self._metrics.request_started()
+                try:
+                    fetched_response = cached_requests_get(
+                        url,
+                        old_meta,
+                        now,
+                        session=self._session,
+                        max_content_length=self._max_content_length,
+                        spool_dir=self._spool_dir,
+                        metrics=self._metrics,
+                        logger=self._logger,
+                    )
+                finally:
+                    if self._metrics is not None:
+                        self._metrics.request_finished()
 
             # fetched_response can be None when we don't need to fetch the cache
             if fetched_response is not None:
                 yield fetched_response
-
-                self.fetch_count += 1
-                if self.fetch_count > self._max_fetch_count:
-                    time.sleep(remaining)
         except RequestException as e:
             self._logger.warning(str(e))
         except Exception as e:
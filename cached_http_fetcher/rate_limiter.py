@@ -0,0 +1,159 @@
+import ctypes
+import multiprocessing
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+DEFAULT_NUM_SLOTS = 4096
+# One request to a host at a time, as fetch_urls() always did
+DEFAULT_MAX_CONCURRENCY_PER_HOST = 1
+
+
+def take_token(
+    tokens: float, updated_at: float, capacity: float, rate: float, now: float
+) -> Tuple[float, float]:
+    """
+    Take a token from a token bucket
+
+    A token is reserved even if the bucket is empty, so concurrent callers
+    wait for their own turn.
+
+    :return: A tuple of the remaining tokens and seconds to wait
+    """
+    tokens = min(capacity, tokens + (now - updated_at) * rate) - 1
+    if tokens >= 0:
+        return tokens, 0.0
+    return tokens, -tokens / rate
+
+
+class RateLimiterBase(ABC):
+    @abstractmethod
+    def acquire(self, key: str) -> float:
+        """
+        Take a token for key, and return seconds to wait before a request
+        """
+        pass
+
+
+class MemoryRateLimiter(RateLimiterBase):
+    """
+    A token bucket rate limiter per key in a process
+
+    :param rate_limit_count: A max fetch count in rate_limit_seconds
+    :param rate_limit_seconds: Seconds for counting fetch
+    """
+
+    def __init__(self, rate_limit_count: int, rate_limit_seconds: float) -> None:
+        self._capacity = float(rate_limit_count)
+        self._rate = rate_limit_count / rate_limit_seconds
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (self._capacity, now))
+            tokens, wait = take_token(
+                tokens, updated_at, self._capacity, self._rate, now
+            )
+            self._buckets[key] = (tokens, now)
+        return wait
+
+
+class SharedMemoryRateLimiter(RateLimiterBase):
+    """
+    A token bucket rate limiter per key shared by processes
+
+    Buckets live in shared memory, so it must be created before worker
+    processes are started. Keys are hashed into num_slots buckets, and keys
+    sharing a bucket are limited together.
+
+    :param rate_limit_count: A max fetch count in rate_limit_seconds
+    :param rate_limit_seconds: Seconds for counting fetch
+    :param num_slots: A number of buckets
+    """
+
+    def __init__(
+        self,
+        rate_limit_count: int,
+        rate_limit_seconds: float,
+        *,
+        num_slots: int = DEFAULT_NUM_SLOTS,
+    ) -> None:
+        self._capacity = float(rate_limit_count)
+        self._rate = rate_limit_count / rate_limit_seconds
+        self._num_slots = num_slots
+        self._lock = multiprocessing.Lock()
+        # Zero-initialized, and an empty bucket is refilled on the first use
+        self._tokens = multiprocessing.RawArray(ctypes.c_double, num_slots)
+        self._updated_at = multiprocessing.RawArray(ctypes.c_double, num_slots)
+
+    def acquire(self, key: str) -> float:
+        # hash() is randomized per process, so use a stable hash
+        slot = zlib.crc32(key.encode("utf-8")) % self._num_slots
+        now = time.time()
+        with self._lock:
+            tokens, wait = take_token(
+                self._tokens[slot],
+                self._updated_at[slot],
+                self._capacity,
+                self._rate,
+                now,
+            )
+            self._tokens[slot] = tokens
+            self._updated_at[slot] = now
+        return wait
+
+
+class SharedConcurrencyLimiter:
+    """
+    A max number of requests per key at once, shared by processes
+
+    Counters live in shared memory, so it must be created before worker
+    processes are started. Keys are hashed into num_slots counters as
+    SharedMemoryRateLimiter does.
+
+    :param max_concurrency: A max number of requests per key at once
+    :param num_slots: A number of counters
+    """
+
+    def __init__(
+        self, max_concurrency: int, *, num_slots: int = DEFAULT_NUM_SLOTS
+    ) -> None:
+        self._max_concurrency = max_concurrency
+        self._num_slots = num_slots
+        self._condition = multiprocessing.Condition()
+        self._counts = multiprocessing.RawArray(ctypes.c_int, num_slots)
+
+    @contextmanager
+    def hold(self, key: str) -> Iterator[None]:
+        """
+        Wait until a request for key can start, and count it until it ends
+        """
+        slot = zlib.crc32(key.encode("utf-8")) % self._num_slots
+        with self._condition:
+            while self._counts[slot] >= self._max_concurrency:
+                self._condition.wait()
+            self._counts[slot] += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._counts[slot] -= 1
+                self._condition.notify_all()
+
+
+def create_rate_limiter(
+    rate_limit_count: int, rate_limit_seconds: float, *, shared: bool
+) -> Optional[RateLimiterBase]:
+    """
+    Create a rate limiter, or None when rate_limit_count or rate_limit_seconds is 0
+    """
+    if rate_limit_count <= 0 or rate_limit_seconds <= 0:
+        return None
+    if shared:
+        return SharedMemoryRateLimiter(rate_limit_count, rate_limit_seconds)
+    return MemoryRateLimiter(rate_limit_count, rate_limit_seconds)
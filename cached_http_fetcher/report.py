@@ -0,0 +1,163 @@
+import bisect
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from .plan import PlanReport
+
+# Upper bounds of latency buckets in seconds. The last bucket is unbounded.
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Outcomes of a url
+FRESH = "fresh"  # still valid, not requested
+FAILED = "failed"  # no response, or dropped by the fetcher
+STORED = "stored"  # a new or changed content is stored
+UNCHANGED = "unchanged"  # 200 with the same content
+NOT_MODIFIED = "not_modified"  # 304
+BODY_SKIPPED = "body_skipped"  # 200 unchanged by validators, not downloaded
+STORE_FAILED = "store_failed"  # the content storage failed
+ERROR_STATUS = "error_status"  # neither 200 nor 304
+
+# Stages timed by workers
+META_READ = "meta_read"
+FETCH = "fetch"  # a request including rate limit waits and reading the body
+STORE_CONTENT = "store_content"
+META_WRITE = "meta_write"
+
+
+@dataclass
+class LatencyHistogram:
+    counts: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    count: int = 0
+    total: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        The upper bound of the bucket including the q-quantile
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (math.inf,), self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.count} calls, total {self.total:.1f}s, "
+            f"mean {self.mean * 1000:.1f}ms, p50 <= {self.quantile(0.5) * 1000:g}ms, "
+            f"p99 <= {self.quantile(0.99) * 1000:g}ms"
+        )
+
+
+@dataclass
+class DomainSummary:
+    requests: int = 0
+    failures: int = 0
+    bytes_downloaded: int = 0
+    seconds: float = 0.0
+
+    def merge(self, other: "DomainSummary") -> None:
+        self.requests += other.requests
+        self.failures += other.failures
+        self.bytes_downloaded += other.bytes_downloaded
+        self.seconds += other.seconds
+
+
+@dataclass
+class FetchReport:
+    """
+    Statistics of a run, which are aggregated over worker processes
+
+    Each worker fills its own report, and they are merged into the report
+    returned by the entry points.
+    """
+
+    plan: PlanReport = field(default_factory=PlanReport)
+    outcomes: Dict[str, int] = field(default_factory=dict)
+    status_codes: Dict[int, int] = field(default_factory=dict)
+    bytes_downloaded: int = 0
+    bytes_stored: int = 0
+    bytes_saved: int = 0  # stored bodies which weren't downloaded again
+    stages: Dict[str, LatencyHistogram] = field(default_factory=dict)
+    domains: Dict[str, DomainSummary] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    def count(self, outcome: str, n: int = 1) -> None:
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + n
+
+    def count_status(self, status_code: int) -> None:
+        self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+
+    def observe(self, stage: str, seconds: float) -> None:
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def domain(self, domain: str) -> DomainSummary:
+        summary = self.domains.get(domain)
+        if summary is None:
+            summary = self.domains[domain] = DomainSummary()
+        return summary
+
+    def merge(self, other: "FetchReport") -> None:
+        self.plan.fresh += other.plan.fresh
+        self.plan.stale += other.plan.stale
+        self.plan.missing += other.plan.missing
+        for outcome, n in other.outcomes.items():
+            self.count(outcome, n)
+        for status_code, n in other.status_codes.items():
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + n
+        self.bytes_downloaded += other.bytes_downloaded
+        self.bytes_stored += other.bytes_stored
+        self.bytes_saved += other.bytes_saved
+        for stage, histogram in other.stages.items():
+            self.stages.setdefault(stage, LatencyHistogram()).merge(histogram)
+        for domain, summary in other.domains.items():
+            self.domain(domain).merge(summary)
+
+    def __str__(self) -> str:
+        lines = [
+            f"planned {self.plan}",
+            "outcomes "
+            + ", ".join(
+                f"{n} {outcome}" for outcome, n in sorted(self.outcomes.items())
+            ),
+            "status codes "
+            + ", ".join(f"{n} {code}" for code, n in sorted(self.status_codes.items())),
+            f"downloaded {self.bytes_downloaded} bytes, stored {self.bytes_stored} bytes, "
+            f"saved {self.bytes_saved} bytes in {self.elapsed:.1f}s",
+        ]
+        for stage, histogram in self.stages.items():
+            lines.append(f"{stage}: {histogram}")
+        return "\n".join(lines)
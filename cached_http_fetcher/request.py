@@ -1,9 +1,12 @@
+import hashlib
+import os
 import random
 import ssl
+import tempfile
 import time
 import warnings
 from logging import Logger
-from typing import Dict, Optional
+from typing import IO, TYPE_CHECKING, Dict, Mapping, Optional, Tuple
 
 import requests
 from requests import Response
@@ -12,6 +15,9 @@ from urllib3 import poolmanager
 
 from .model import FetchedResponse, Meta
 
+if TYPE_CHECKING:
+    from .metrics import MetricsHook
+
 # Ignore some warnings
 warnings.simplefilter("ignore", UserWarning)
 warnings.simplefilter("ignore", InsecureRequestWarning)
@@ -22,6 +28,22 @@ USER_AGENT = (
 )
 MAX_TRIES = 4
 TIMEOUT = 10
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_IDLE_TIMEOUT = 60.0
+CHUNK_SIZE = 64 * 1024
+# A body larger than this is passed to content processes via a temporary file
+INLINE_CONTENT_MAX = 1024 * 1024
+# A body of non 200 responses up to this size is read to reuse the connection
+DRAIN_CONTENT_MAX = 64 * 1024
+TRANSPORT_HEADERS = (
+    "cache-control",
+    "content-length",
+    "content-type",
+    "etag",
+    "expires",
+    "last-modified",
+)
 
 
 class TLSHTTPAdapter(requests.adapters.HTTPAdapter):
@@ -38,15 +60,94 @@ class TLSHTTPAdapter(requests.adapters.HTTPAdapter):
         )
 
 
-def requests_get(url: str, headers: Dict[str, str]) -> Optional[Response]:
+class FetchSession:
+    """
+    A long-lived HTTP session which keeps connections to origins warm
+
+    The underlying requests.Session is created lazily, so an instance can be
+    built in a parent process and used in a worker process. When the session
+    hasn't been used for idle_timeout seconds, it is closed and recreated.
+
+    :param pool_connections: A number of per-host connection pools to cache
+    :param pool_maxsize: A max number of connections kept in each pool
+    :param idle_timeout: Seconds to keep idle connections. When 0, keep them forever.
+    :param keep_alive: Reuse connections between requests
+    """
+
+    def __init__(
+        self,
+        *,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        keep_alive: bool = True,
+    ):
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._idle_timeout = idle_timeout
+        self._keep_alive = keep_alive
+        self._session: Optional[requests.Session] = None
+        self._last_used = 0.0
+
+    def _new_session(self) -> requests.Session:
+        session = requests.session()
+        session.mount(
+            "http://",
+            requests.adapters.HTTPAdapter(
+                pool_connections=self._pool_connections,
+                pool_maxsize=self._pool_maxsize,
+            ),
+        )
+        session.mount(
+            "https://",
+            TLSHTTPAdapter(
+                pool_connections=self._pool_connections,
+                pool_maxsize=self._pool_maxsize,
+            ),
+        )
+        if not self._keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def get_session(self) -> requests.Session:
+        now = time.monotonic()
+        if (
+            self._session is not None
+            and self._idle_timeout > 0
+            and now - self._last_used > self._idle_timeout
+        ):
+            self.close()
+        if self._session is None:
+            self._session = self._new_session()
+        self._last_used = now
+        return self._session
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+def requests_get(
+    url: str,
+    headers: Dict[str, str],
+    session: Optional[FetchSession] = None,
+    metrics: "Optional[MetricsHook]" = None,
+) -> Optional[Response]:
     headers["User-Agent"] = USER_AGENT
+    if session is None:
+        # A throwaway session for a single request. Closing it drops pooled
+        # connections, while the streamed response keeps its own.
+        throwaway = FetchSession(idle_timeout=0)
+        try:
+            return requests_get(url, headers, throwaway, metrics)
+        finally:
+            throwaway.close()
     tries = 0
     wait = 1.0
     while tries < MAX_TRIES:
         try:
-            session = requests.session()
-            session.mount("https://", TLSHTTPAdapter())
-            response = session.get(
+            response = session.get_session().get(
                 url,
                 headers=headers,
                 verify=False,
@@ -57,9 +158,11 @@ def requests_get(url: str, headers: Dict[str, str]) -> Optional[Response]:
             return response
         except requests.exceptions.ConnectionError:
             # TODO: Check the host existence
-            pass
+            reason = "connection_error"
         except requests.exceptions.Timeout:
-            pass
+            reason = "timeout"
+        if metrics is not None and tries + 1 < MAX_TRIES:
+            metrics.retry(reason)
         time.sleep(wait)
         wait *= 2
         wait += random.uniform(0, wait)  # jitter
@@ -67,8 +170,132 @@ def requests_get(url: str, headers: Dict[str, str]) -> Optional[Response]:
     return None
 
 
+class ContentTooLarge(Exception):
+    pass
+
+
+def read_body(
+    response: Response,
+    max_content_length: Optional[int] = None,
+    spool_dir: Optional[str] = None,
+) -> Tuple[Optional[bytes], Optional[str], bytes]:
+    """
+    Read a response body in chunks while hashing it, and spool it to a temporary
+    file when it is large
+
+    :param max_content_length: A max body size. When exceeded, ContentTooLarge is
+                               raised without reading the rest of the body.
+    :param spool_dir: A directory of the temporary file. When None, the default one.
+    :return: A tuple of the body or None, a path of the spooled body or None,
+             and SHA-1 of the body
+    """
+    buffer = bytearray()
+    spool: Optional[IO[bytes]] = None
+    sha1 = hashlib.sha1()
+    length = 0
+    try:
+        declared_length = response.headers.get("content-length")
+        if (
+            max_content_length is not None
+            and declared_length is not None
+            and declared_length.isdigit()
+            and int(declared_length) > max_content_length
+        ):
+            raise ContentTooLarge(declared_length)
+
+        for chunk in response.iter_content(CHUNK_SIZE):
+            length += len(chunk)
+            if max_content_length is not None and length > max_content_length:
+                raise ContentTooLarge(length)
+            sha1.update(chunk)
+            if spool is not None:
+                spool.write(chunk)
+                continue
+            buffer += chunk
+            if len(buffer) > INLINE_CONTENT_MAX:
+                spool = tempfile.NamedTemporaryFile(
+                    prefix="cached-http-fetcher-", dir=spool_dir, delete=False
+                )
+                spool.write(buffer)
+                buffer = bytearray()
+    except Exception:
+        if spool is not None:
+            spool.close()
+            os.unlink(spool.name)
+        raise
+    finally:
+        # Closing a response before reading all drops the connection
+        response.close()
+
+    if spool is not None:
+        spool.close()
+        return None, spool.name, sha1.digest()
+    return bytes(buffer), None, sha1.digest()
+
+
+def release_response(response: Response) -> None:
+    """
+    Read and discard a small body, so the connection goes back to the pool
+
+    Closing a response before reading all drops the connection, which is
+    done for a body larger than DRAIN_CONTENT_MAX.
+    """
+    try:
+        declared_length = response.headers.get("content-length")
+        if (
+            declared_length is not None
+            and declared_length.isdigit()
+            and int(declared_length) > DRAIN_CONTENT_MAX
+        ):
+            return
+        length = 0
+        for chunk in response.iter_content(CHUNK_SIZE):
+            length += len(chunk)
+            if length > DRAIN_CONTENT_MAX:
+                return
+    except requests.exceptions.RequestException:
+        pass
+    finally:
+        response.close()
+
+
+def is_unchanged(headers: Mapping[str, str], old_meta: Optional[Meta]) -> bool:
+    """
+    Whether a 200 response has the same body as old_meta, judging by validators
+
+    Content-Length must match the stored length, and either a strong ETag or
+    Last-Modified must match the stored one.
+    """
+    if (
+        old_meta is None
+        or old_meta.content_sha1 is None
+        or old_meta.content_length is None
+    ):
+        return False
+    content_length = headers.get("content-length")
+    if content_length is None or content_length != str(old_meta.content_length):
+        return False
+    if "content-encoding" in headers:
+        # Content-Length is the encoded size, not the stored size
+        return False
+
+    etag = headers.get("etag")
+    if etag is not None and old_meta.etag is not None:
+        return etag == old_meta.etag and not etag.startswith("W/")
+    last_modified = headers.get("last-modified")
+    return last_modified is not None and last_modified == old_meta.last_modified
+
+
 def cached_requests_get(
-    url: str, old_meta: Optional[Meta], now: int, *, logger: Logger
+    url: str,
+    old_meta: Optional[Meta],
+    now: int,
+    *,
+    session: Optional[FetchSession] = None,
+    max_content_length: Optional[int] = None,
+    spool_dir: Optional[str] = None,
+    metrics: "Optional[MetricsHook]" = None,
+    logger: Logger,
 ) -> Optional[FetchedResponse]:
     req_headers: Dict[str, str] = {}
 
@@ -81,12 +308,45 @@ def cached_requests_get(
         if old_meta.last_modified is not None:
             req_headers["If-Modified-Since"] = old_meta.last_modified
 
-    response = requests_get(url, req_headers)
+    response = requests_get(url, req_headers, session, metrics)
 
     if response is None:
         logger.warn(f"Cannot get {url}")
         return None
 
+    content: Optional[bytes] = None
+    content_file: Optional[str] = None
+    content_sha1: Optional[bytes] = None
+    body_skipped = False
+    if response.status_code == 200 and is_unchanged(response.headers, old_meta):
+        # An origin ignoring conditional requests. Drop the connection
+        # instead of downloading the same body again.
+        response.close()
+        body_skipped = True
+    elif response.status_code == 200:
+        try:
+            content, content_file, content_sha1 = read_body(
+                response, max_content_length, spool_dir
+            )
+        except ContentTooLarge:
+            logger.warning(f"Content is larger than {max_content_length}: {url}")
+            return None
+    else:
+        # Bodies of other responses aren't stored
+        release_response(response)
+
     return FetchedResponse(
-        url=url, fetched_at=now, response=response, old_meta=old_meta
+        url=url,
+        fetched_at=now,
+        status_code=response.status_code,
+        headers={
+            name: response.headers[name]
+            for name in TRANSPORT_HEADERS
+            if name in response.headers
+        },
+        content=content,
+        content_file=content_file,
+        content_sha1=content_sha1,
+        body_skipped=body_skipped,
+        old_meta=old_meta,
     )
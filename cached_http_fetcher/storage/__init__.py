@@ -1,9 +1,48 @@
-from .base import ContentStorageBase, MetaStorageBase
-from .memory import ContentMemoryStorage, MemoryStorage
+from .async_adapter import (
+    AsyncContentStorageAdapter,
+    AsyncMetaStorageAdapter,
+    SyncContentStorageAdapter,
+    SyncMetaStorageAdapter,
+)
+from .async_base import AsyncContentStorageBase, AsyncMetaStorageBase
+from .base import (
+    ContentAddressedStorageBase,
+    ContentStorageBase,
+    ContentStream,
+    MetaStorageBase,
+)
+from .memory import (
+    ContentAddressedMemoryStorage,
+    ContentMemoryStorage,
+    LRUContentMemoryStorage,
+    LRUMemoryStorage,
+    MemoryStorage,
+)
+from .segment import SegmentContentStorage
+from .server import ContentStorageClient, MetaStorageClient, StorageServer
+from .sqlite import SQLiteMetaStorage
+from .tiered import TieredMetaStorage
 
 __all__ = [
+    "AsyncContentStorageBase",
+    "AsyncMetaStorageBase",
+    "AsyncContentStorageAdapter",
+    "AsyncMetaStorageAdapter",
+    "SyncContentStorageAdapter",
+    "SyncMetaStorageAdapter",
+    "ContentAddressedStorageBase",
     "ContentStorageBase",
+    "ContentStream",
     "MetaStorageBase",
+    "ContentAddressedMemoryStorage",
     "ContentMemoryStorage",
     "MemoryStorage",
+    "LRUContentMemoryStorage",
+    "LRUMemoryStorage",
+    "SegmentContentStorage",
+    "StorageServer",
+    "MetaStorageClient",
+    "ContentStorageClient",
+    "SQLiteMetaStorage",
+    "TieredMetaStorage",
 ]
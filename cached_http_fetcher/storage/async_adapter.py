@@ -0,0 +1,286 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import Executor
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    TypeVar,
+)
+
+from .async_base import AsyncContentStorageBase, AsyncMetaStorageBase
+from .base import ContentStorageBase, ContentStream, MetaStorageBase
+
+T = TypeVar("T")
+
+
+class AsyncMetaStorageAdapter(AsyncMetaStorageBase):
+    """
+    An AsyncMetaStorageBase which runs a MetaStorageBase on an executor
+
+    :param storage: A synchronous meta storage
+    :param executor: An executor to run storage calls. When None, the default executor of the loop.
+    """
+
+    def __init__(
+        self, storage: MetaStorageBase, executor: Optional[Executor] = None
+    ) -> None:
+        self.storage = storage
+        self._executor = executor
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(func, *args)
+        )
+
+    async def get(self, source_url: str) -> Optional[bytes]:
+        return await self._run(self.storage.get, source_url)
+
+    async def delete(self, source_url: str) -> None:
+        await self._run(self.storage.delete, source_url)
+
+    async def put(self, source_url: str, value: bytes) -> None:
+        await self._run(self.storage.put, source_url, value)
+
+    async def get_many(self, source_urls: Sequence[str]) -> List[Optional[bytes]]:
+        return await self._run(self.storage.get_many, source_urls)
+
+    async def delete_many(self, source_urls: Sequence[str]) -> None:
+        await self._run(self.storage.delete_many, source_urls)
+
+    async def put_many(self, values: Mapping[str, bytes]) -> None:
+        await self._run(self.storage.put_many, values)
+
+
+class AsyncContentStorageAdapter(AsyncContentStorageBase):
+    """
+    An AsyncContentStorageBase which runs a ContentStorageBase on an executor
+
+    :param storage: A synchronous content storage
+    :param executor: An executor to run storage calls. When None, the default executor of the loop.
+    """
+
+    def __init__(
+        self, storage: ContentStorageBase, executor: Optional[Executor] = None
+    ) -> None:
+        self.storage = storage
+        self._executor = executor
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(func, *args)
+        )
+
+    async def get(self, source_url: str) -> Optional[bytes]:
+        return await self._run(self.storage.get, source_url)
+
+    async def delete(self, source_url: str) -> None:
+        await self._run(self.storage.delete, source_url)
+
+    async def put_content(
+        self,
+        source_url: str,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        await self._run(
+            self.storage.put_content, source_url, value, cache_control, content_type
+        )
+
+    async def put_content_stream(
+        self,
+        source_url: str,
+        stream: ContentStream,
+        length: int,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        # The stream is read on the executor, too
+        await self._run(
+            self.storage.put_content_stream,
+            source_url,
+            stream,
+            length,
+            sha1,
+            cache_control,
+            content_type,
+        )
+
+    async def put_hashed_content(
+        self,
+        source_url: str,
+        value: bytes,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        await self._run(
+            self.storage.put_hashed_content,
+            source_url,
+            value,
+            sha1,
+            cache_control,
+            content_type,
+        )
+
+    def cached_url(self, source_url: str) -> str:
+        return self.storage.cached_url(source_url)
+
+    def cached_content_url(self, source_url: str, content_sha1: bytes) -> str:
+        return self.storage.cached_content_url(source_url, content_sha1)
+
+
+class EventLoopThread:
+    """
+    An event loop running in a daemon thread, which is started lazily in
+    each process
+
+    An instance can be pickled to be passed to worker processes.
+    """
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__()  # type: ignore
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                # A thread isn't inherited by fork(), so start a new one
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True).start()
+                self._loop = loop
+                self._pid = os.getpid()
+            return self._loop
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop()).result()
+
+
+class SyncMetaStorageAdapter(MetaStorageBase):
+    """
+    A MetaStorageBase which runs an AsyncMetaStorageBase on an event loop
+    in a background thread
+
+    It can be passed to fetch_urls(). Don't call it from a coroutine.
+
+    :param storage: An asyncio meta storage
+    """
+
+    def __init__(self, storage: AsyncMetaStorageBase) -> None:
+        self.storage = storage
+        self._loop_thread = EventLoopThread()
+
+    def get(self, source_url: str) -> Optional[bytes]:
+        return self._loop_thread.run(self.storage.get(source_url))
+
+    def delete(self, source_url: str) -> None:
+        self._loop_thread.run(self.storage.delete(source_url))
+
+    def put(self, source_url: str, value: bytes) -> None:
+        self._loop_thread.run(self.storage.put(source_url, value))
+
+    def get_many(self, source_urls: Sequence[str]) -> List[Optional[bytes]]:
+        return self._loop_thread.run(self.storage.get_many(source_urls))
+
+    def delete_many(self, source_urls: Sequence[str]) -> None:
+        self._loop_thread.run(self.storage.delete_many(source_urls))
+
+    def put_many(self, values: Mapping[str, bytes]) -> None:
+        self._loop_thread.run(self.storage.put_many(values))
+
+
+class SyncContentStorageAdapter(ContentStorageBase):
+    """
+    A ContentStorageBase which runs an AsyncContentStorageBase on an event
+    loop in a background thread
+
+    It can be passed to fetch_urls(). Don't call it from a coroutine.
+
+    :param storage: An asyncio content storage
+    """
+
+    def __init__(self, storage: AsyncContentStorageBase) -> None:
+        self.storage = storage
+        self._loop_thread = EventLoopThread()
+
+    def get(self, source_url: str) -> Optional[bytes]:
+        return self._loop_thread.run(self.storage.get(source_url))
+
+    def delete(self, source_url: str) -> None:
+        self._loop_thread.run(self.storage.delete(source_url))
+
+    def put_content(
+        self,
+        source_url: str,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self._loop_thread.run(
+            self.storage.put_content(
+                source_url,
+                value,
+                cache_control=cache_control,
+                content_type=content_type,
+            )
+        )
+
+    def put_content_stream(
+        self,
+        source_url: str,
+        stream: ContentStream,
+        length: int,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self._loop_thread.run(
+            self.storage.put_content_stream(
+                source_url,
+                stream,
+                length,
+                sha1,
+                cache_control=cache_control,
+                content_type=content_type,
+            )
+        )
+
+    def put_hashed_content(
+        self,
+        source_url: str,
+        value: bytes,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self._loop_thread.run(
+            self.storage.put_hashed_content(
+                source_url,
+                value,
+                sha1,
+                cache_control=cache_control,
+                content_type=content_type,
+            )
+        )
+
+    def cached_url(self, source_url: str) -> str:
+        return self.storage.cached_url(source_url)
+
+    def cached_content_url(self, source_url: str, content_sha1: bytes) -> str:
+        return self.storage.cached_content_url(source_url, content_sha1)
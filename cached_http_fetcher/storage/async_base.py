@@ -0,0 +1,108 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import List, Mapping, Optional, Sequence
+
+from .base import ContentStream, read_stream
+
+
+class AsyncMetaStorageBase(ABC):
+    """
+    An asyncio version of MetaStorageBase
+    """
+
+    @abstractmethod
+    async def get(self, source_url: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    async def delete(self, source_url: str) -> None:
+        pass
+
+    @abstractmethod
+    async def put(self, source_url: str, value: bytes) -> None:
+        pass
+
+    # Batch operations run single operations concurrently by default.
+    # Override them when the storage supports batches.
+
+    async def get_many(self, source_urls: Sequence[str]) -> List[Optional[bytes]]:
+        return list(
+            await asyncio.gather(*[self.get(source_url) for source_url in source_urls])
+        )
+
+    async def delete_many(self, source_urls: Sequence[str]) -> None:
+        await asyncio.gather(*[self.delete(source_url) for source_url in source_urls])
+
+    async def put_many(self, values: Mapping[str, bytes]) -> None:
+        await asyncio.gather(
+            *[self.put(source_url, value) for source_url, value in values.items()]
+        )
+
+
+class AsyncContentStorageBase(ABC):
+    """
+    An asyncio version of ContentStorageBase
+
+    cached_url() and cached_content_url() are not coroutines, since they
+    usually only build a url.
+    """
+
+    @abstractmethod
+    async def get(self, source_url: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    async def delete(self, source_url: str) -> None:
+        pass
+
+    @abstractmethod
+    async def put_content(
+        self,
+        source_url: str,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        pass
+
+    @abstractmethod
+    def cached_url(self, source_url: str) -> str:
+        pass
+
+    async def put_content_stream(
+        self,
+        source_url: str,
+        stream: ContentStream,
+        length: int,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        """
+        Put a body given as a stream. This default buffers the whole body
+        and calls put_content().
+        """
+        await self.put_content(
+            source_url,
+            read_stream(stream),
+            cache_control=cache_control,
+            content_type=content_type,
+        )
+
+    async def put_hashed_content(
+        self,
+        source_url: str,
+        value: bytes,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        """
+        Put a body whose SHA-1 is already known. This default calls put_content().
+        """
+        await self.put_content(
+            source_url, value, cache_control=cache_control, content_type=content_type
+        )
+
+    def cached_content_url(self, source_url: str, content_sha1: bytes) -> str:
+        return self.cached_url(source_url)
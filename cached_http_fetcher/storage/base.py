@@ -1,5 +1,9 @@
+import hashlib
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import IO, Callable, Iterable, List, Mapping, Optional, Sequence, Union
+
+# A file object or an iterator of chunks
+ContentStream = Union[IO[bytes], Iterable[bytes]]
 
 
 class MetaStorageBase(ABC):
@@ -15,6 +19,20 @@ class MetaStorageBase(ABC):
     def put(self, source_url: str, value: bytes) -> None:
         pass
 
+    # Batch operations. Override them when the storage supports batches,
+    # e.g. MGET/MSET on Redis, to save round trips.
+
+    def get_many(self, source_urls: Sequence[str]) -> List[Optional[bytes]]:
+        return [self.get(source_url) for source_url in source_urls]
+
+    def delete_many(self, source_urls: Sequence[str]) -> None:
+        for source_url in source_urls:
+            self.delete(source_url)
+
+    def put_many(self, values: Mapping[str, bytes]) -> None:
+        for source_url, value in values.items():
+            self.put(source_url, value)
+
 
 class ContentStorageBase(ABC):
     @abstractmethod
@@ -38,3 +56,224 @@ class ContentStorageBase(ABC):
     @abstractmethod
     def cached_url(self, source_url: str) -> str:
         pass
+
+    def put_content_stream(
+        self,
+        source_url: str,
+        stream: ContentStream,
+        length: int,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        """
+        Put a body given as a stream, which is used for large bodies
+
+        Override it when the storage can upload a stream, e.g. a multipart
+        upload on S3, to keep memory bounded. This default buffers the whole
+        body and calls put_content().
+
+        :param stream: A binary file object or an iterator of chunks
+        :param length: A byte length of the body
+        :param sha1: SHA-1 of the body
+        """
+        self.put_content(
+            source_url,
+            read_stream(stream),
+            cache_control=cache_control,
+            content_type=content_type,
+        )
+
+    def put_hashed_content(
+        self,
+        source_url: str,
+        value: bytes,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        """
+        Put a body whose SHA-1 is already known
+
+        Override it when the storage uses the hash, so it isn't computed again.
+        This default calls put_content().
+
+        :param sha1: SHA-1 of the body
+        """
+        self.put_content(
+            source_url, value, cache_control=cache_control, content_type=content_type
+        )
+
+    def cached_content_url(self, source_url: str, content_sha1: bytes) -> str:
+        """
+        A url of a stored content, which is saved in Meta.cached_url
+
+        Override it when the url depends on the content.
+        """
+        return self.cached_url(source_url)
+
+
+class ContentAddressedStorageBase(ContentStorageBase):
+    """
+    A content storage which stores each distinct body once
+
+    Bodies are stored as blobs keyed by their SHA-1, and each url is linked
+    to a blob. A blob is shared by all the urls with the same body, and is
+    deleted when no url links to it. Implement the blob and link methods
+    below, and the url based methods of ContentStorageBase are built on them.
+    """
+
+    @abstractmethod
+    def has_blob(self, sha1: bytes) -> bool:
+        pass
+
+    @abstractmethod
+    def get_blob(self, sha1: bytes) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def put_blob(
+        self,
+        sha1: bytes,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        pass
+
+    @abstractmethod
+    def blob_url(self, sha1: bytes) -> str:
+        pass
+
+    @abstractmethod
+    def linked_blob(self, source_url: str) -> Optional[bytes]:
+        """
+        SHA-1 of the blob linked from source_url, or None
+        """
+        pass
+
+    @abstractmethod
+    def link(self, source_url: str, sha1: bytes) -> None:
+        """
+        Link source_url to a blob, replacing the previous link
+
+        The reference count of the blob is incremented, and the one of the
+        previously linked blob is decremented. A blob which isn't referenced
+        any more is deleted.
+        """
+        pass
+
+    @abstractmethod
+    def put_and_link(
+        self, source_url: str, sha1: bytes, put_blob: Callable[[], None]
+    ) -> None:
+        """
+        Link source_url to a blob, calling put_blob() first when the blob is missing
+
+        It must be atomic, e.g. under a lock of the storage. Otherwise the blob
+        may be deleted by unlinking other urls between the check and the link.
+        """
+        pass
+
+    @abstractmethod
+    def unlink(self, source_url: str) -> None:
+        """
+        Remove the link from source_url, and decrement the reference count
+        """
+        pass
+
+    def put_blob_stream(
+        self,
+        sha1: bytes,
+        stream: ContentStream,
+        length: int,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self.put_blob(
+            sha1,
+            read_stream(stream),
+            cache_control=cache_control,
+            content_type=content_type,
+        )
+
+    def get(self, source_url: str) -> Optional[bytes]:
+        sha1 = self.linked_blob(source_url)
+        if sha1 is None:
+            return None
+        return self.get_blob(sha1)
+
+    def delete(self, source_url: str) -> None:
+        self.unlink(source_url)
+
+    def put_content(
+        self,
+        source_url: str,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self.put_hashed_content(
+            source_url,
+            value,
+            hashlib.sha1(value).digest(),
+            cache_control=cache_control,
+            content_type=content_type,
+        )
+
+    def put_hashed_content(
+        self,
+        source_url: str,
+        value: bytes,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self.put_and_link(
+            source_url,
+            sha1,
+            lambda: self.put_blob(
+                sha1, value, cache_control=cache_control, content_type=content_type
+            ),
+        )
+
+    def put_content_stream(
+        self,
+        source_url: str,
+        stream: ContentStream,
+        length: int,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        # A known body isn't read at all
+        self.put_and_link(
+            source_url,
+            sha1,
+            lambda: self.put_blob_stream(
+                sha1,
+                stream,
+                length,
+                cache_control=cache_control,
+                content_type=content_type,
+            ),
+        )
+
+    def cached_url(self, source_url: str) -> str:
+        sha1 = self.linked_blob(source_url)
+        if sha1 is None:
+            raise KeyError(source_url)
+        return self.blob_url(sha1)
+
+    def cached_content_url(self, source_url: str, content_sha1: bytes) -> str:
+        return self.blob_url(content_sha1)
+
+
+def read_stream(stream: ContentStream) -> bytes:
+    """
+    Read a whole content stream into bytes
+    """
+    read = getattr(stream, "read", None)
+    if read is not None:
+        return bytes(read())
+    return b"".join(stream)  # type: ignore
@@ -1,7 +1,17 @@
+import hashlib
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence
 
-from .base import ContentStorageBase, MetaStorageBase
+from .base import (
+    ContentAddressedStorageBase,
+    ContentStorageBase,
+    ContentStream,
+    MetaStorageBase,
+)
+
+READ_SIZE = 64 * 1024
 
 
 class MemoryStorage(MetaStorageBase):
@@ -19,10 +29,138 @@ class MemoryStorage(MetaStorageBase):
     def delete(self, source_url: str) -> None:
         del self.dict[source_url]
 
+    def get_many(self, source_urls: Sequence[str]) -> List[Optional[bytes]]:
+        return [self.dict.get(source_url, None) for source_url in source_urls]
+
+    def delete_many(self, source_urls: Sequence[str]) -> None:
+        for source_url in source_urls:
+            del self.dict[source_url]
+
+    def put_many(self, values: Mapping[str, bytes]) -> None:
+        for value in values.values():
+            if not isinstance(value, bytes):
+                raise ValueError
+        self.dict.update(values)
+
     def dict_for_debug(self) -> Dict[str, bytes]:
         return self.dict
 
 
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def __str__(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+
+
+class LRUMemoryStorage(MemoryStorage):
+    """
+    A MemoryStorage bounded by bytes, which evicts least recently used entries
+
+    A size of an entry is the length of its value and its utf-8 encoded key.
+    A value larger than max_bytes can't be stored, and ValueError is raised like
+    LRUContentMemoryStorage. All operations are O(1).
+
+    :param max_bytes: A max total size of entries
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.dict: "OrderedDict[str, bytes]" = OrderedDict()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry_size(source_url: str, value: bytes) -> int:
+        return len(source_url.encode("utf-8")) + len(value)
+
+    def _get(self, source_url: str) -> Optional[bytes]:
+        value = self.dict.get(source_url, None)
+        if value is None:
+            self.stats.misses += 1
+            return None
+        self.dict.move_to_end(source_url)
+        self.stats.hits += 1
+        return value
+
+    def fits(self, source_url: str, value: bytes) -> bool:
+        return self._entry_size(source_url, value) <= self.max_bytes
+
+    def _check(self, source_url: str, value: bytes) -> None:
+        if not isinstance(value, bytes):
+            raise ValueError
+        if not self.fits(source_url, value):
+            raise ValueError(f"value is larger than {self.max_bytes}: {source_url}")
+
+    def _put(self, source_url: str, value: bytes) -> None:
+        self._delete(source_url)
+        size = self._entry_size(source_url, value)
+        self.dict[source_url] = value
+        self.size += size
+        while self.size > self.max_bytes:
+            evicted_url, evicted_value = self.dict.popitem(last=False)
+            self.size -= self._entry_size(evicted_url, evicted_value)
+            self.stats.evictions += 1
+
+    def _delete(self, source_url: str) -> None:
+        # An entry may have been evicted already
+        value = self.dict.pop(source_url, None)
+        if value is not None:
+            self.size -= self._entry_size(source_url, value)
+
+    def get(self, source_url: str) -> Optional[bytes]:
+        with self._lock:
+            return self._get(source_url)
+
+    def put(self, source_url: str, value: bytes) -> None:
+        self._check(source_url, value)
+        with self._lock:
+            self._put(source_url, value)
+
+    def delete(self, source_url: str) -> None:
+        with self._lock:
+            self._delete(source_url)
+
+    def get_many(self, source_urls: Sequence[str]) -> List[Optional[bytes]]:
+        with self._lock:
+            return [self._get(source_url) for source_url in source_urls]
+
+    def delete_many(self, source_urls: Sequence[str]) -> None:
+        with self._lock:
+            for source_url in source_urls:
+                self._delete(source_url)
+
+    def put_many(self, values: Mapping[str, bytes]) -> None:
+        # Nothing is stored if any value is refused
+        for source_url, value in values.items():
+            self._check(source_url, value)
+        with self._lock:
+            for source_url, value in values.items():
+                self._put(source_url, value)
+
+
+def read_verified_stream(stream: ContentStream, length: int, sha1: bytes) -> bytes:
+    """
+    Read a content stream in chunks, and verify it like a storage checking an upload
+    """
+    read = getattr(stream, "read", None)
+    chunks: Iterable[bytes]
+    if read is not None:
+        chunks = iter(lambda: read(READ_SIZE), b"")
+    else:
+        chunks = stream  # type: ignore
+    value = bytearray()
+    for chunk in chunks:
+        value += chunk
+    if len(value) != length or hashlib.sha1(value).digest() != sha1:
+        raise ValueError("broken content stream")
+    return bytes(value)
+
+
 @dataclass(frozen=True)
 class ContentMemoryEntry:
     value: bytes
@@ -56,8 +194,177 @@ class ContentMemoryStorage(ContentStorageBase):
             content_type=content_type,
         )
 
+    def put_content_stream(
+        self,
+        source_url: str,
+        stream: ContentStream,
+        length: int,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        value = read_verified_stream(stream, length, sha1)
+        self.put_content(
+            source_url,
+            value,
+            cache_control=cache_control,
+            content_type=content_type,
+        )
+
     def cached_url(self, source_url: str) -> str:
         return f"memory:{source_url}"
 
     def dict_for_debug(self) -> Dict[str, ContentMemoryEntry]:
         return self.dict
+
+
+class LRUContentMemoryStorage(ContentMemoryStorage):
+    """
+    A ContentMemoryStorage bounded by bytes of values, which evicts least
+    recently used entries
+
+    A value larger than max_bytes can't be stored, and ValueError is raised so
+    that no Meta refers to it. All operations are O(1).
+
+    :param max_bytes: A max total size of values
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.dict: "OrderedDict[str, ContentMemoryEntry]" = OrderedDict()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def get(self, source_url: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self.dict.get(source_url, None)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self.dict.move_to_end(source_url)
+            self.stats.hits += 1
+            return entry.value
+
+    def delete(self, source_url: str) -> None:
+        with self._lock:
+            self._delete(source_url)
+
+    def _delete(self, source_url: str) -> None:
+        # An entry may have been evicted already
+        entry = self.dict.pop(source_url, None)
+        if entry is not None:
+            self.size -= len(entry.value)
+
+    def put_content(
+        self,
+        source_url: str,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        if len(value) > self.max_bytes:
+            raise ValueError(f"content is larger than {self.max_bytes}: {source_url}")
+        entry = ContentMemoryEntry(
+            value=value,
+            cache_control=cache_control,
+            content_type=content_type,
+        )
+        with self._lock:
+            self._delete(source_url)
+            self.dict[source_url] = entry
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.dict.popitem(last=False)
+                self.size -= len(evicted.value)
+                self.stats.evictions += 1
+
+
+class ContentAddressedMemoryStorage(ContentAddressedStorageBase):
+    def __init__(self) -> None:
+        self.blobs: Dict[bytes, ContentMemoryEntry] = {}
+        self.links: Dict[str, bytes] = {}
+        self.refcounts: Dict[bytes, int] = {}
+        # Methods may be called from threads, e.g. via a multiprocessing manager.
+        # Reentrant, since put_and_link() puts a blob under the lock.
+        self._lock = threading.RLock()
+
+    def has_blob(self, sha1: bytes) -> bool:
+        return sha1 in self.blobs
+
+    def get_blob(self, sha1: bytes) -> Optional[bytes]:
+        v = self.blobs.get(sha1, None)
+        if v is not None:
+            return v.value
+        return None
+
+    def put_blob(
+        self,
+        sha1: bytes,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        entry = ContentMemoryEntry(
+            value=value,
+            cache_control=cache_control,
+            content_type=content_type,
+        )
+        with self._lock:
+            self.blobs[sha1] = entry
+
+    def put_blob_stream(
+        self,
+        sha1: bytes,
+        stream: ContentStream,
+        length: int,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self.put_blob(
+            sha1,
+            read_verified_stream(stream, length, sha1),
+            cache_control=cache_control,
+            content_type=content_type,
+        )
+
+    def blob_url(self, sha1: bytes) -> str:
+        return f"memory:sha1:{sha1.hex()}"
+
+    def linked_blob(self, source_url: str) -> Optional[bytes]:
+        return self.links.get(source_url, None)
+
+    def link(self, source_url: str, sha1: bytes) -> None:
+        with self._lock:
+            self._link(source_url, sha1)
+
+    def put_and_link(
+        self, source_url: str, sha1: bytes, put_blob: Callable[[], None]
+    ) -> None:
+        with self._lock:
+            if sha1 not in self.blobs:
+                put_blob()
+            self._link(source_url, sha1)
+
+    def _link(self, source_url: str, sha1: bytes) -> None:
+        old_sha1 = self.links.get(source_url, None)
+        if old_sha1 == sha1:
+            return
+        self.links[source_url] = sha1
+        self.refcounts[sha1] = self.refcounts.get(sha1, 0) + 1
+        if old_sha1 is not None:
+            self._release(old_sha1)
+
+    def unlink(self, source_url: str) -> None:
+        with self._lock:
+            sha1 = self.links.pop(source_url)
+            self._release(sha1)
+
+    def _release(self, sha1: bytes) -> None:
+        self.refcounts[sha1] -= 1
+        if self.refcounts[sha1] == 0:
+            del self.refcounts[sha1]
+            self.blobs.pop(sha1, None)
+
+    def dict_for_debug(self) -> Dict[bytes, ContentMemoryEntry]:
+        return self.blobs
@@ -0,0 +1,160 @@
+import fcntl
+import mmap
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from .base import ContentStorageBase, ContentStream
+from .sqlite import DEFAULT_TIMEOUT, SQLiteConnections
+
+READ_SIZE = 64 * 1024
+SEGMENT_FILE = "segment.dat"
+INDEX_FILE = "index.sqlite"
+
+
+class SegmentContentStorage(ContentStorageBase):
+    """
+    A content storage in an append-only segment file in a directory
+
+    Bodies are appended to the segment file under an exclusive file lock,
+    and their offsets are kept in an index on SQLite. Reads are served from
+    a memory map of the segment file. It can be shared by processes on the
+    same host.
+
+    Space of deleted or replaced bodies isn't reclaimed.
+
+    :param directory: A directory of the segment file and the index
+    :param timeout: Seconds to wait for a lock of the index held by another process
+    """
+
+    def __init__(self, directory: str, *, timeout: float = DEFAULT_TIMEOUT) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._segment_path = os.path.join(directory, SEGMENT_FILE)
+        self._connections = SQLiteConnections(
+            os.path.join(directory, INDEX_FILE), timeout=timeout
+        )
+        with self._connections.get() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS content ("
+                "source_url TEXT PRIMARY KEY, "
+                "offset INTEGER NOT NULL, "
+                "length INTEGER NOT NULL, "
+                "cache_control TEXT NOT NULL, "
+                "content_type TEXT"
+                ") WITHOUT ROWID"
+            )
+        self._init_map()
+
+    def _init_map(self) -> None:
+        self._map: Optional[mmap.mmap] = None
+        self._map_pid = os.getpid()
+        self._map_lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        for name in ["_map", "_map_pid", "_map_lock"]:
+            del state[name]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._init_map()
+
+    def _read(self, offset: int, length: int) -> bytes:
+        if length == 0:
+            return b""
+        with self._map_lock:
+            if self._map_pid != os.getpid():
+                # A map inherited by fork() is left to the parent process
+                self._map = None
+                self._map_pid = os.getpid()
+            if self._map is None or len(self._map) < offset + length:
+                # The segment file has grown since it was mapped
+                if self._map is not None:
+                    self._map.close()
+                with open(self._segment_path, "rb") as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._map[offset : offset + length]
+
+    def _append(self, chunks: Iterable[bytes]) -> Tuple[int, int]:
+        # A file opened for each append has its own lock, so threads are also excluded
+        with open(self._segment_path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                for chunk in chunks:
+                    f.write(chunk)
+                f.flush()
+                length = f.tell() - offset
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return offset, length
+
+    def _index(
+        self,
+        source_url: str,
+        offset: int,
+        length: int,
+        cache_control: str,
+        content_type: Optional[str],
+    ) -> None:
+        # The body is written before the index, so the index never points
+        # to a partial body
+        with self._connections.get() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO content "
+                "(source_url, offset, length, cache_control, content_type) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (source_url, offset, length, cache_control, content_type),
+            )
+
+    def get(self, source_url: str) -> Optional[bytes]:
+        row = (
+            self._connections.get()
+            .execute(
+                "SELECT offset, length FROM content WHERE source_url = ?",
+                (source_url,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return self._read(row[0], row[1])
+
+    def delete(self, source_url: str) -> None:
+        with self._connections.get() as conn:
+            conn.execute("DELETE FROM content WHERE source_url = ?", (source_url,))
+
+    def put_content(
+        self,
+        source_url: str,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        offset, length = self._append([value])
+        self._index(source_url, offset, length, cache_control, content_type)
+
+    def put_content_stream(
+        self,
+        source_url: str,
+        stream: ContentStream,
+        length: int,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        read = getattr(stream, "read", None)
+        chunks: Iterable[bytes]
+        if read is not None:
+            chunks = iter(lambda: read(READ_SIZE), b"")
+        else:
+            chunks = stream  # type: ignore
+        offset, written = self._append(chunks)
+        if written != length:
+            raise ValueError(f"broken content stream: {source_url}")
+        self._index(source_url, offset, written, cache_control, content_type)
+
+    def cached_url(self, source_url: str) -> str:
+        return f"segment:{source_url}"
@@ -0,0 +1,327 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from multiprocessing.connection import Client, Connection, Listener
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from .base import ContentStorageBase, ContentStream, MetaStorageBase
+from .memory import READ_SIZE, ContentMemoryStorage, MemoryStorage
+
+META = "meta"
+CONTENT = "content"
+META_METHODS = {"get", "delete", "put", "get_many", "delete_many", "put_many"}
+CONTENT_METHODS = {
+    "get",
+    "delete",
+    "put_content",
+    "put_hashed_content",
+    "cached_url",
+    "cached_content_url",
+}
+STREAM_METHOD = "put_content_stream"
+SHUTDOWN = "shutdown"
+
+
+class StorageServer:
+    """
+    A server process which serves a meta storage and a content storage to
+    worker processes over a local socket
+
+    Unlike storages on a multiprocessing manager, a batch operation is a
+    single round trip, and a large body is sent in chunks. Use it as a
+    context manager, and pass meta_storage() and content_storage() to
+    fetch_urls().
+
+    :param meta_storage: A meta storage in the server. Defaults to MemoryStorage.
+    :param content_storage: A content storage in the server. Defaults to ContentMemoryStorage.
+    """
+
+    def __init__(
+        self,
+        meta_storage: Optional[MetaStorageBase] = None,
+        content_storage: Optional[ContentStorageBase] = None,
+    ) -> None:
+        self._meta_storage = (
+            meta_storage if meta_storage is not None else MemoryStorage()
+        )
+        self._content_storage = (
+            content_storage if content_storage is not None else ContentMemoryStorage()
+        )
+        self._directory: Optional[str] = None
+        self._address = ""
+        self._authkey = os.urandom(32)
+        self._process: Optional[multiprocessing.Process] = None
+
+    def __enter__(self) -> "StorageServer":
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._directory = tempfile.mkdtemp(prefix="cached-http-fetcher-")
+        self._address = os.path.join(self._directory, "storage.sock")
+        ready = multiprocessing.Event()
+        self._process = multiprocessing.Process(
+            target=serve,
+            args=(
+                self._address,
+                self._authkey,
+                self._meta_storage,
+                self._content_storage,
+                ready,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+        ready.wait()
+
+    def stop(self) -> None:
+        if self._process is None:
+            return
+        with Client(self._address, authkey=self._authkey) as conn:
+            conn.send((SHUTDOWN, None, ()))
+            conn.recv()
+        self._process.join()
+        self._process = None
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+    def meta_storage(self) -> "MetaStorageClient":
+        return MetaStorageClient(self._address, self._authkey)
+
+    def content_storage(self) -> "ContentStorageClient":
+        return ContentStorageClient(self._address, self._authkey)
+
+
+def serve(
+    address: str,
+    authkey: bytes,
+    meta_storage: MetaStorageBase,
+    content_storage: ContentStorageBase,
+    ready: Any,
+) -> None:
+    """
+    Serve storages until a shutdown request comes. Each connection is
+    handled in its own thread.
+    """
+    shutdown = threading.Event()
+    storages = {META: meta_storage, CONTENT: content_storage}
+
+    with Listener(address, family="AF_UNIX", authkey=authkey) as listener:
+
+        def accept() -> None:
+            while True:
+                conn = listener.accept()
+                threading.Thread(
+                    target=handle, args=(conn, storages, shutdown), daemon=True
+                ).start()
+
+        threading.Thread(target=accept, daemon=True).start()
+        ready.set()
+        shutdown.wait()
+
+
+def handle(
+    conn: Connection, storages: Dict[str, Any], shutdown: threading.Event
+) -> None:
+    with conn:
+        while True:
+            try:
+                target, method, args = conn.recv()
+            except EOFError:
+                return
+            if target == SHUTDOWN:
+                conn.send((True, None))
+                shutdown.set()
+                return
+            try:
+                if target == META and method in META_METHODS:
+                    result = getattr(storages[META], method)(*args)
+                elif target == CONTENT and method in CONTENT_METHODS:
+                    result = getattr(storages[CONTENT], method)(*args)
+                elif target == CONTENT and method == STREAM_METHOD:
+                    source_url, length, sha1, cache_control, content_type = args
+                    chunks = receive_chunks(conn)
+                    try:
+                        storages[CONTENT].put_content_stream(
+                            source_url,
+                            chunks,
+                            length,
+                            sha1,
+                            cache_control=cache_control,
+                            content_type=content_type,
+                        )
+                    finally:
+                        # Skip chunks left by a failed storage
+                        for _ in chunks:
+                            pass
+                    result = None
+                else:
+                    raise ValueError(f"unknown method: {target}.{method}")
+                conn.send((True, result))
+            except Exception as ex:
+                try:
+                    conn.send((False, ex))
+                except Exception:
+                    # The exception can't be pickled
+                    conn.send((False, RuntimeError(repr(ex))))
+
+
+def receive_chunks(conn: Connection) -> Iterator[bytes]:
+    while True:
+        chunk = conn.recv_bytes()
+        if not chunk:
+            return
+        yield chunk
+
+
+class StorageClient:
+    """
+    A connection to StorageServer per process and thread
+
+    An instance can be pickled to be passed to worker processes.
+    """
+
+    def __init__(self, address: str, authkey: bytes) -> None:
+        self._address = address
+        self._authkey = authkey
+        self._local = threading.local()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"address": self._address, "authkey": self._authkey}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["address"], state["authkey"])  # type: ignore
+
+    def _connection(self) -> Connection:
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            # A connection inherited by fork() must not be used
+            self._local.conn = Client(self._address, authkey=self._authkey)
+            self._local.pid = pid
+        return self._local.conn  # type: ignore
+
+    def _close(self) -> None:
+        if getattr(self._local, "pid", None) == os.getpid():
+            self._local.conn.close()
+        self._local.pid = None
+
+    def _receive(self, conn: Connection) -> Any:
+        ok, result = conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def _call(self, target: str, method: str, *args: Any) -> Any:
+        conn = self._connection()
+        conn.send((target, method, args))
+        return self._receive(conn)
+
+
+class MetaStorageClient(StorageClient, MetaStorageBase):
+    def get(self, source_url: str) -> Optional[bytes]:
+        return self._call(META, "get", source_url)  # type: ignore
+
+    def delete(self, source_url: str) -> None:
+        self._call(META, "delete", source_url)
+
+    def put(self, source_url: str, value: bytes) -> None:
+        self._call(META, "put", source_url, value)
+
+    def get_many(self, source_urls: Sequence[str]) -> List[Optional[bytes]]:
+        return self._call(META, "get_many", list(source_urls))  # type: ignore
+
+    def delete_many(self, source_urls: Sequence[str]) -> None:
+        self._call(META, "delete_many", list(source_urls))
+
+    def put_many(self, values: Mapping[str, bytes]) -> None:
+        self._call(META, "put_many", dict(values))
+
+
+class ContentStorageClient(StorageClient, ContentStorageBase):
+    def get(self, source_url: str) -> Optional[bytes]:
+        return self._call(CONTENT, "get", source_url)  # type: ignore
+
+    def delete(self, source_url: str) -> None:
+        self._call(CONTENT, "delete", source_url)
+
+    def put_content(
+        self,
+        source_url: str,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self._call(
+            CONTENT, "put_content", source_url, value, cache_control, content_type
+        )
+
+    def put_content_stream(
+        self,
+        source_url: str,
+        stream: ContentStream,
+        length: int,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        args: Tuple[Any, ...] = (source_url, length, sha1, cache_control, content_type)
+        read = getattr(stream, "read", None)
+        chunks: Iterable[bytes]
+        if read is not None:
+            chunks = iter(lambda: read(READ_SIZE), b"")
+        else:
+            chunks = stream  # type: ignore
+        conn = self._connection()
+        conn.send((CONTENT, STREAM_METHOD, args))
+        try:
+            for chunk in chunks:
+                if chunk:
+                    conn.send_bytes(chunk)
+        except Exception:
+            # The server is waiting for the rest, so the connection can't be reused
+            self._close()
+            raise
+        conn.send_bytes(b"")
+        self._receive(conn)
+
+    def put_hashed_content(
+        self,
+        source_url: str,
+        value: bytes,
+        sha1: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self._call(
+            CONTENT,
+            "put_hashed_content",
+            source_url,
+            value,
+            sha1,
+            cache_control,
+            content_type,
+        )
+
+    def cached_url(self, source_url: str) -> str:
+        return self._call(CONTENT, "cached_url", source_url)  # type: ignore
+
+    def cached_content_url(self, source_url: str, content_sha1: bytes) -> str:
+        return self._call(  # type: ignore
+            CONTENT, "cached_content_url", source_url, content_sha1
+        )
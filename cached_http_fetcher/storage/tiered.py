@@ -0,0 +1,112 @@
+import time
+from typing import Dict, List, Mapping, Optional, Sequence
+
+from ..codec import decode_expired_at
+from .base import MetaStorageBase
+from .memory import LRUMemoryStorage
+
+DEFAULT_LOCAL_MAX_BYTES = 64 * 1024 * 1024
+
+
+class TieredMetaStorage(MetaStorageBase):
+    """
+    A meta storage which caches a backend storage in process memory
+
+    Reads go to the local cache first, and writes go to the backend and then
+    to the local cache. Only metas which are not expired yet and fit in the
+    local cache are cached, and a cached meta is dropped when it expires. Since a meta is refetched only
+    after it expires, a meta written by another process is seen after that.
+
+    :param backend: A meta storage shared by processes, e.g. on Redis
+    :param max_bytes: A max size of the local cache
+    """
+
+    def __init__(
+        self,
+        backend: MetaStorageBase,
+        *,
+        max_bytes: int = DEFAULT_LOCAL_MAX_BYTES,
+    ) -> None:
+        self.backend = backend
+        self.local = LRUMemoryStorage(max_bytes)
+
+    @staticmethod
+    def _is_fresh(value: bytes, now: float) -> bool:
+        try:
+            return decode_expired_at(value) > now
+        except Exception:
+            # An invalid entry is left to the backend
+            return False
+
+    def _is_cacheable(self, source_url: str, value: bytes, now: float) -> bool:
+        return self.local.fits(source_url, value) and self._is_fresh(value, now)
+
+    def get(self, source_url: str) -> Optional[bytes]:
+        now = time.time()
+        value = self.local.get(source_url)
+        if value is not None and self._is_fresh(value, now):
+            return value
+
+        value = self.backend.get(source_url)
+        if value is not None and self._is_cacheable(source_url, value, now):
+            self.local.put(source_url, value)
+        else:
+            self.local.delete(source_url)
+        return value
+
+    def delete(self, source_url: str) -> None:
+        self.local.delete(source_url)
+        self.backend.delete(source_url)
+
+    def put(self, source_url: str, value: bytes) -> None:
+        self.backend.put(source_url, value)
+        if self._is_cacheable(source_url, value, time.time()):
+            self.local.put(source_url, value)
+        else:
+            self.local.delete(source_url)
+
+    def get_many(self, source_urls: Sequence[str]) -> List[Optional[bytes]]:
+        now = time.time()
+        values = self.local.get_many(source_urls)
+        missed = [
+            i
+            for i, value in enumerate(values)
+            if value is None or not self._is_fresh(value, now)
+        ]
+        if not missed:
+            return values
+
+        fresh: Dict[str, bytes] = {}
+        stale: List[str] = []
+        backend_values = self.backend.get_many([source_urls[i] for i in missed])
+        for i, value in zip(missed, backend_values):
+            values[i] = value
+            if value is not None and self._is_cacheable(source_urls[i], value, now):
+                fresh[source_urls[i]] = value
+            else:
+                stale.append(source_urls[i])
+        self.local.put_many(fresh)
+        self.local.delete_many(stale)
+        return values
+
+    def delete_many(self, source_urls: Sequence[str]) -> None:
+        self.local.delete_many(source_urls)
+        self.backend.delete_many(source_urls)
+
+    def put_many(self, values: Mapping[str, bytes]) -> None:
+        self.backend.put_many(values)
+        now = time.time()
+        self.local.put_many(
+            {
+                source_url: value
+                for source_url, value in values.items()
+                if self._is_cacheable(source_url, value, now)
+            }
+        )
+        self.local.delete_many(
+            [
+                source_url
+                for source_url, value in values.items()
+                if not self._is_cacheable(source_url, value, now)
+            ]
+        )
@@ -1,16 +1,96 @@
-from typing import Dict, Iterable, Set
+import hashlib
+from array import array
+from typing import Dict, Iterable, Iterator, List
 from urllib.parse import urlparse
 
+DEFAULT_CHUNK_SIZE = 100
+DEFAULT_MAX_PENDING_URLS = 100000
+# 8 bytes per slot, so 8 MiB
+DEFAULT_DEDUP_SLOTS = 1 << 20
 
-def urls_per_domain(url_list: Iterable[str]) -> Dict[str, Set[str]]:
-    results: Dict[str, Set[str]] = {}
+
+def url_digest(url: str) -> int:
+    """
+    A 64-bit digest of url, which is smaller than url itself in memory
+    """
+    return int.from_bytes(
+        hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+class URLDeduplicator:
+    """
+    Remember recently seen urls in a fixed-size table of 64-bit digests
+
+    Each url has one slot, and a url overwrites an earlier url sharing the
+    slot. The table takes 8 bytes per slot however many urls are read, but
+    a duplicate whose first occurrence was overwritten isn't detected and
+    is fetched again. A new url is never taken as a duplicate, unless the
+    64-bit digests of two urls collide.
+
+    :param num_slots: A number of slots. Duplicates are detected reliably
+                      while much fewer distinct urls than this are read.
+    """
+
+    def __init__(self, num_slots: int = DEFAULT_DEDUP_SLOTS) -> None:
+        self._num_slots = num_slots
+        self._slots = array("Q", bytes(8 * num_slots))
+
+    def add(self, url: str) -> bool:
+        """
+        Remember url, and return False if it has been already seen
+        """
+        # 0 marks an empty slot
+        digest = url_digest(url) or 1
+        slot = digest % self._num_slots
+        if self._slots[slot] == digest:
+            return False
+        self._slots[slot] = digest
+        return True
+
+
+def stream_url_chunks(
+    url_list: Iterable[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_pending_urls: int = DEFAULT_MAX_PENDING_URLS,
+) -> Iterator[List[str]]:
+    """
+    Bucket urls by domain while reading url_list, and yield chunks of domains
+
+    A chunk of a domain is yielded as soon as it is full, so fetching starts
+    while url_list is still read. Urls of partial chunks are kept until their
+    chunks are full. When more than max_pending_urls urls are kept, partial
+    chunks are yielded from the domain seen first until half of them are
+    left, so url_list is never read at once.
+    """
+    deduplicator = URLDeduplicator()
+    # Dicts keep insertion order, so the oldest partial chunk comes first
+    buckets: Dict[str, List[str]] = {}
+    pending_urls = 0
     for url_str in url_list:
         try:
             url = urlparse(url_str)
-            if url.netloc in results:
-                results[url.netloc].add(url.geturl())
-            else:
-                results[url.netloc] = {url.geturl()}
         except ValueError:
-            pass
-    return results
+            continue
+        normalized_url = url.geturl()
+        if not deduplicator.add(normalized_url):
+            continue
+
+        bucket = buckets.setdefault(url.netloc, [])
+        bucket.append(normalized_url)
+        pending_urls += 1
+        if len(bucket) >= chunk_size:
+            del buckets[url.netloc]
+            pending_urls -= len(bucket)
+            yield bucket
+            continue
+        if pending_urls <= max_pending_urls:
+            continue
+
+        while buckets and pending_urls > max_pending_urls // 2:
+            domain = next(iter(buckets))
+            bucket = buckets.pop(domain)
+            pending_urls -= len(bucket)
+            yield bucket
+
+    yield from buckets.values()
@@ -1,5 +1,7 @@
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, Optional
+
+from cached_http_fetcher.model import FetchedResponse, Meta
 
 
 @dataclass(frozen=True)
@@ -8,3 +10,28 @@ class FixtureURLContent:
 
 
 FixtureURLS = Dict[str, FixtureURLContent]
+
+
+def make_fetched_response(
+    url: str,
+    *,
+    fetched_at: int = 0,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+    content: Optional[bytes] = None,
+    content_file: Optional[str] = None,
+    content_sha1: Optional[bytes] = None,
+    body_skipped: bool = False,
+    old_meta: Optional[Meta] = None,
+) -> FetchedResponse:
+    return FetchedResponse(
+        url=url,
+        fetched_at=fetched_at,
+        status_code=status_code,
+        headers=headers or {},
+        content=content,
+        content_file=content_file,
+        content_sha1=content_sha1,
+        body_skipped=body_skipped,
+        old_meta=old_meta,
+    )
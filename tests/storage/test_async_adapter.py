@@ -0,0 +1,71 @@
+import asyncio
+import hashlib
+import io
+
+from cached_http_fetcher.storage.async_adapter import (
+    AsyncContentStorageAdapter,
+    AsyncMetaStorageAdapter,
+    SyncContentStorageAdapter,
+    SyncMetaStorageAdapter,
+)
+from cached_http_fetcher.storage.memory import ContentMemoryStorage, MemoryStorage
+
+
+def test_async_meta_storage_adapter() -> None:
+    async def run(meta_storage: AsyncMetaStorageAdapter) -> None:
+        await meta_storage.put("key1", b"value1")
+        assert await meta_storage.get("key1") == b"value1"
+        await meta_storage.put_many({"key2": b"value2"})
+        assert await meta_storage.get_many(["key1", "key2", "key3"]) == [
+            b"value1",
+            b"value2",
+            None,
+        ]
+        await meta_storage.delete("key1")
+        await meta_storage.delete_many(["key2"])
+
+    memory_storage = MemoryStorage()
+    asyncio.run(run(AsyncMetaStorageAdapter(memory_storage)))
+    assert memory_storage.dict_for_debug() == {}
+
+
+def test_sync_meta_storage_adapter() -> None:
+    memory_storage = MemoryStorage()
+    # sync -> async -> sync
+    meta_storage = SyncMetaStorageAdapter(AsyncMetaStorageAdapter(memory_storage))
+
+    meta_storage.put("key1", b"value1")
+    assert meta_storage.get("key1") == b"value1"
+    meta_storage.put_many({"key2": b"value2"})
+    assert meta_storage.get_many(["key1", "key2", "key3"]) == [
+        b"value1",
+        b"value2",
+        None,
+    ]
+    meta_storage.delete("key1")
+    meta_storage.delete_many(["key2"])
+    assert memory_storage.dict_for_debug() == {}
+
+
+def test_content_storage_adapters() -> None:
+    memory_storage = ContentMemoryStorage()
+    content_storage = SyncContentStorageAdapter(
+        AsyncContentStorageAdapter(memory_storage)
+    )
+    content = b"large content"
+
+    content_storage.put_content("key1", b"value1", cache_control="")
+    content_storage.put_content_stream(
+        "key2",
+        io.BytesIO(content),
+        len(content),
+        hashlib.sha1(content).digest(),
+        cache_control="",
+        content_type="text/plain",
+    )
+    assert content_storage.get("key1") == b"value1"
+    assert content_storage.get("key2") == content
+    assert memory_storage.dict_for_debug()["key2"].content_type == "text/plain"
+    assert content_storage.cached_url("key1") == memory_storage.cached_url("key1")
+    content_storage.delete("key1")
+    assert content_storage.get("key1") is None
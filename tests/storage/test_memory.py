@@ -1,4 +1,18 @@
-from cached_http_fetcher.storage.memory import MemoryStorage
+import hashlib
+import io
+import threading
+from typing import Dict, Optional
+
+import pytest
+from cached_http_fetcher.storage.base import ContentStorageBase
+from cached_http_fetcher.storage.memory import (
+    ContentAddressedMemoryStorage,
+    ContentMemoryStorage,
+    LRUContentMemoryStorage,
+    LRUMemoryStorage,
+    MemoryStorage,
+)
+from pytest_mock import MockerFixture
 
 
 def test_memory_storage() -> None:
@@ -8,3 +22,214 @@ def test_memory_storage() -> None:
     memory_storage.put("key2", b"value2")
     assert memory_storage.get("key1") == b"value1"
     assert memory_storage.get("key2") == b"value2"
+
+
+def test_memory_storage_many() -> None:
+    memory_storage = MemoryStorage()
+
+    memory_storage.put_many({"key1": b"value1", "key2": b"value2"})
+    assert memory_storage.get_many(["key2", "key3", "key1"]) == [
+        b"value2",
+        None,
+        b"value1",
+    ]
+    memory_storage.delete_many(["key1"])
+    assert memory_storage.get_many(["key1", "key2"]) == [None, b"value2"]
+
+
+def test_content_memory_storage_stream() -> None:
+    content_storage = ContentMemoryStorage()
+    content = b"large content"
+    sha1 = hashlib.sha1(content).digest()
+
+    # a file object
+    content_storage.put_content_stream(
+        "key1", io.BytesIO(content), len(content), sha1, cache_control="max-age=60"
+    )
+    assert content_storage.get("key1") == content
+
+    # an iterator of chunks
+    content_storage.put_content_stream(
+        "key2",
+        iter([b"large ", b"content"]),
+        len(content),
+        sha1,
+        cache_control="max-age=60",
+        content_type="text/plain",
+    )
+    entry = content_storage.dict_for_debug()["key2"]
+    assert entry.value == content
+    assert entry.content_type == "text/plain"
+
+    # a truncated stream
+    with pytest.raises(ValueError):
+        content_storage.put_content_stream(
+            "key3", io.BytesIO(content[:5]), len(content), sha1, cache_control=""
+        )
+    assert content_storage.get("key3") is None
+
+
+class BufferedContentStorage(ContentStorageBase):
+    def __init__(self) -> None:
+        self.dict: Dict[str, bytes] = {}
+
+    def get(self, source_url: str) -> Optional[bytes]:
+        return self.dict.get(source_url, None)
+
+    def delete(self, source_url: str) -> None:
+        del self.dict[source_url]
+
+    def put_content(
+        self,
+        source_url: str,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self.dict[source_url] = value
+
+    def cached_url(self, source_url: str) -> str:
+        return source_url
+
+
+def test_content_storage_stream_fallback() -> None:
+    content_storage = BufferedContentStorage()
+    content = b"large content"
+    sha1 = hashlib.sha1(content).digest()
+
+    content_storage.put_content_stream(
+        "key1", io.BytesIO(content), len(content), sha1, cache_control=""
+    )
+    content_storage.put_content_stream(
+        "key2", iter([b"large ", b"content"]), len(content), sha1, cache_control=""
+    )
+    assert content_storage.get("key1") == content
+    assert content_storage.get("key2") == content
+
+
+def test_content_addressed_memory_storage(mocker: MockerFixture) -> None:
+    content_storage = ContentAddressedMemoryStorage()
+    blobs = content_storage.dict_for_debug()
+    content = b"pixel"
+    sha1 = hashlib.sha1(content).digest()
+
+    # urls with the same body share a blob
+    content_storage.put_content("key1", content, cache_control="max-age=60")
+    content_storage.put_content_stream(
+        "key2", iter([b"pix", b"el"]), len(content), sha1, cache_control=""
+    )
+    assert len(blobs) == 1
+    assert content_storage.get("key1") == content
+    assert content_storage.get("key2") == content
+    assert content_storage.cached_url("key1") == content_storage.blob_url(sha1)
+    assert content_storage.cached_url("key2") == content_storage.blob_url(sha1)
+
+    # a known blob isn't read again
+    content_storage.put_content_stream(
+        "key3", iter([]), len(content), sha1, cache_control=""
+    )
+    assert content_storage.get("key3") == content
+
+    # a changed body is linked to a new blob
+    content_storage.put_content("key1", b"logo", cache_control="")
+    assert content_storage.get("key1") == b"logo"
+    assert len(blobs) == 2
+
+    # a blob is deleted when no url refers to it
+    content_storage.delete("key2")
+    assert len(blobs) == 2
+    content_storage.delete("key3")
+    assert len(blobs) == 1
+    assert content_storage.get("key2") is None
+    assert not content_storage.has_blob(sha1)
+
+    # a body with a known SHA-1 isn't hashed again
+    spy_sha1 = mocker.spy(hashlib, "sha1")
+    content_storage.put_hashed_content("key4", content, sha1, cache_control="")
+    assert content_storage.get("key4") == content
+    spy_sha1.assert_not_called()
+
+
+def test_content_addressed_memory_storage_race() -> None:
+    content_storage = ContentAddressedMemoryStorage()
+    content = b"pixel"
+    errors = []
+
+    # a blob released by another url is stored again before the link
+    def put_and_delete(source_url: str) -> None:
+        for _ in range(1000):
+            content_storage.put_content(source_url, content, cache_control="")
+            if content_storage.get(source_url) != content:
+                errors.append(source_url)
+            content_storage.delete(source_url)
+
+    threads = [
+        threading.Thread(target=put_and_delete, args=(f"key{i}",)) for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert content_storage.dict_for_debug() == {}
+
+
+def test_lru_memory_storage() -> None:
+    # each entry is 4 bytes of a key and 6 bytes of a value
+    memory_storage = LRUMemoryStorage(max_bytes=25)
+
+    memory_storage.put("key1", b"value1")
+    memory_storage.put("key2", b"value2")
+    assert memory_storage.get("key1") == b"value1"  # key2 is least recently used
+    memory_storage.put("key3", b"value3")
+    assert memory_storage.size == 20
+    assert memory_storage.get_many(["key1", "key2", "key3"]) == [
+        b"value1",
+        None,
+        b"value3",
+    ]
+
+    # a value larger than max_bytes is refused, and the old one is kept
+    with pytest.raises(ValueError):
+        memory_storage.put("key3", b"x" * 30)
+    with pytest.raises(ValueError):
+        memory_storage.put_many({"key4": b"v4", "key5": b"x" * 30})
+    assert memory_storage.get("key3") == b"value3"
+    assert memory_storage.get("key4") is None
+    assert memory_storage.size == 20
+
+    # replaced values are accounted by their new sizes
+    memory_storage.put_many({"key1": b"v1", "key2": b"v2"})
+    assert memory_storage.size == 22
+    memory_storage.delete("key4")  # not stored
+    memory_storage.delete_many(["key1", "key2", "key3"])
+    assert memory_storage.size == 0
+    assert memory_storage.stats.hits == 4
+    assert memory_storage.stats.misses == 2
+    assert memory_storage.stats.evictions == 1
+
+
+def test_lru_content_memory_storage() -> None:
+    content_storage = LRUContentMemoryStorage(max_bytes=10)
+
+    content_storage.put_content("key1", b"12345", cache_control="")
+    content_storage.put_content("key2", b"12345", cache_control="")
+    assert content_storage.get("key1") == b"12345"
+    content_storage.put_content("key3", b"123", cache_control="")
+    assert content_storage.get("key2") is None  # evicted
+    assert content_storage.size == 8
+
+    # a replaced value is accounted by its new size
+    content_storage.put_content("key1", b"1", cache_control="")
+    assert content_storage.size == 4
+    content_storage.delete("key1")
+    assert content_storage.size == 3
+    assert content_storage.stats.hits == 1
+    assert content_storage.stats.misses == 1
+    assert content_storage.stats.evictions == 1
+
+    # a value larger than max_bytes is refused, and the old one is kept
+    with pytest.raises(ValueError):
+        content_storage.put_content("key3", b"12345678901", cache_control="")
+    assert content_storage.get("key3") == b"123"
+    assert content_storage.size == 3
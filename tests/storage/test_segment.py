@@ -0,0 +1,67 @@
+import hashlib
+import io
+import multiprocessing
+import pickle
+from pathlib import Path
+
+from cached_http_fetcher.storage.segment import SegmentContentStorage
+
+
+def test_segment_content_storage(tmp_path: Path) -> None:
+    content_storage = SegmentContentStorage(str(tmp_path))
+
+    content_storage.put_content("key1", b"value1", cache_control="max-age=60")
+    content_storage.put_content("key2", b"", cache_control="max-age=60")
+    assert content_storage.get("key1") == b"value1"
+    assert content_storage.get("key2") == b""
+    assert content_storage.get("key3") is None
+
+    # the map follows the grown segment file
+    content = b"large content" * 1000
+    content_storage.put_content_stream(
+        "key3",
+        io.BytesIO(content),
+        len(content),
+        hashlib.sha1(content).digest(),
+        cache_control="max-age=60",
+        content_type="text/plain",
+    )
+    assert content_storage.get("key3") == content
+
+    content_storage.put_content("key1", b"value2", cache_control="max-age=60")
+    assert content_storage.get("key1") == b"value2"
+    content_storage.delete("key1")
+    assert content_storage.get("key1") is None
+
+    # persisted in the directory
+    assert SegmentContentStorage(str(tmp_path)).get("key3") == content
+
+
+def put_contents(content_storage: SegmentContentStorage, prefix: str) -> None:
+    for i in range(50):
+        content_storage.put_content(
+            f"{prefix}{i}", f"{prefix}{i}".encode() * 100, cache_control=""
+        )
+
+
+def test_segment_content_storage_processes(tmp_path: Path) -> None:
+    content_storage = SegmentContentStorage(str(tmp_path))
+    content_storage.put_content("key", b"value", cache_control="")
+    assert content_storage.get("key") == b"value"  # mapped before fork
+    content_storage = pickle.loads(pickle.dumps(content_storage))
+
+    processes = [
+        multiprocessing.Process(target=put_contents, args=(content_storage, prefix))
+        for prefix in ["a", "b", "c"]
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+
+    # appends by processes aren't interleaved
+    for prefix in ["a", "b", "c"]:
+        for i in range(50):
+            expected = f"{prefix}{i}".encode() * 100
+            assert content_storage.get(f"{prefix}{i}") == expected
@@ -0,0 +1,70 @@
+import hashlib
+import io
+import multiprocessing
+import pickle
+
+import pytest
+from cached_http_fetcher.storage.server import (
+    ContentStorageClient,
+    MetaStorageClient,
+    StorageServer,
+)
+
+
+def put_values(meta_storage: MetaStorageClient, prefix: str) -> None:
+    meta_storage.put_many({f"{prefix}{i}": b"value" for i in range(100)})
+
+
+def test_storage_server_meta() -> None:
+    with StorageServer() as server:
+        meta_storage = server.meta_storage()
+
+        meta_storage.put("key1", b"value1")
+        assert meta_storage.get("key1") == b"value1"
+        meta_storage.delete("key1")
+        assert meta_storage.get("key1") is None
+        # an exception in the server is raised in the client
+        with pytest.raises(KeyError):
+            meta_storage.delete("key1")
+
+        # shared by processes
+        meta_storage = pickle.loads(pickle.dumps(meta_storage))
+        processes = [
+            multiprocessing.Process(target=put_values, args=(meta_storage, prefix))
+            for prefix in ["a", "b"]
+        ]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+            assert p.exitcode == 0
+
+        urls = [f"{prefix}{i}" for prefix in ["a", "b"] for i in range(100)]
+        assert meta_storage.get_many(urls) == [b"value"] * 200
+        meta_storage.delete_many(urls)
+        assert meta_storage.get_many(urls) == [None] * 200
+
+
+def test_storage_server_content() -> None:
+    with StorageServer() as server:
+        content_storage: ContentStorageClient = server.content_storage()
+        content = b"large content" * 10000
+        sha1 = hashlib.sha1(content).digest()
+
+        content_storage.put_content("key1", b"value1", cache_control="")
+        assert content_storage.get("key1") == b"value1"
+        assert content_storage.cached_url("key1") == "memory:key1"
+
+        content_storage.put_content_stream(
+            "key2", io.BytesIO(content), len(content), sha1, cache_control=""
+        )
+        assert content_storage.get("key2") == content
+
+        # a broken stream is rejected, and the connection is still usable
+        with pytest.raises(ValueError):
+            content_storage.put_content_stream(
+                "key3", io.BytesIO(content[:100]), len(content), sha1, cache_control=""
+            )
+        assert content_storage.get("key3") is None
+        content_storage.delete("key2")
+        assert content_storage.get("key2") is None
@@ -0,0 +1,54 @@
+import multiprocessing
+import os
+import pickle
+from pathlib import Path
+
+from cached_http_fetcher.storage.sqlite import SQLiteMetaStorage
+
+
+def test_sqlite_meta_storage(tmp_path: Path) -> None:
+    path = os.path.join(tmp_path, "meta.sqlite")
+    meta_storage = SQLiteMetaStorage(path)
+
+    meta_storage.put("key1", b"value1")
+    meta_storage.put("key2", b"value2")
+    assert meta_storage.get("key1") == b"value1"
+    meta_storage.put("key1", b"value3")
+    assert meta_storage.get("key1") == b"value3"
+    meta_storage.delete("key1")
+    assert meta_storage.get("key1") is None
+
+    meta_storage.put_many({"key3": b"value3", "key4": b"value4"})
+    assert meta_storage.get_many(["key4", "key1", "key2"]) == [
+        b"value4",
+        None,
+        b"value2",
+    ]
+    meta_storage.delete_many(["key2", "key3"])
+    assert meta_storage.get_many(["key2", "key3", "key4"]) == [None, None, b"value4"]
+
+    # persisted in the file
+    assert SQLiteMetaStorage(path).get("key4") == b"value4"
+
+
+def put_values(meta_storage: SQLiteMetaStorage, prefix: str) -> None:
+    meta_storage.put_many({f"{prefix}{i}": b"value" for i in range(100)})
+
+
+def test_sqlite_meta_storage_processes(tmp_path: Path) -> None:
+    meta_storage = SQLiteMetaStorage(os.path.join(tmp_path, "meta.sqlite"))
+    meta_storage.put("key", b"value")
+    meta_storage = pickle.loads(pickle.dumps(meta_storage))
+
+    processes = [
+        multiprocessing.Process(target=put_values, args=(meta_storage, prefix))
+        for prefix in ["a", "b", "c"]
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+
+    urls = [f"{prefix}{i}" for prefix in ["a", "b", "c"] for i in range(100)]
+    assert meta_storage.get_many(urls) == [b"value"] * 300
@@ -0,0 +1,79 @@
+import time
+
+from cached_http_fetcher.codec import encode_meta
+from cached_http_fetcher.model import Meta
+from cached_http_fetcher.storage.memory import MemoryStorage
+from cached_http_fetcher.storage.tiered import TieredMetaStorage
+from pytest_mock import MockerFixture
+
+
+def encoded_meta(expired_at: int) -> bytes:
+    return encode_meta(
+        Meta(
+            cached_url=None,
+            etag=None,
+            last_modified=None,
+            content_sha1=None,
+            fetched_at=0,
+            expired_at=expired_at,
+        )
+    )
+
+
+def test_tiered_meta_storage(mocker: MockerFixture) -> None:
+    now = int(time.time())
+    fresh = encoded_meta(now + 3600)
+    expired = encoded_meta(now - 1)
+
+    backend = MemoryStorage()
+    backend.put("fresh", fresh)
+    backend.put("expired", expired)
+    spy_get = mocker.spy(backend, "get")
+    meta_storage = TieredMetaStorage(backend)
+
+    # a fresh meta is read from the backend once
+    assert meta_storage.get("fresh") == fresh
+    assert meta_storage.get("fresh") == fresh
+    assert spy_get.call_count == 1
+
+    # an expired meta isn't cached
+    assert meta_storage.get("expired") == expired
+    assert meta_storage.get("expired") == expired
+    assert spy_get.call_count == 3
+
+    # write through
+    meta_storage.put("new", fresh)
+    assert backend.get("new") == fresh
+    assert meta_storage.get("new") == fresh
+    assert spy_get.call_count == 4  # including backend.get() above
+
+    # a meta larger than the local cache is only written to the backend
+    small_storage = TieredMetaStorage(backend, max_bytes=len(fresh))
+    small_storage.put("small", fresh)
+    assert backend.get("small") == fresh
+    assert small_storage.get("small") == fresh
+    assert small_storage.local.get("small") is None
+
+    # invalidated on delete
+    meta_storage.delete("fresh")
+    assert meta_storage.get("fresh") is None
+    assert "fresh" not in backend.dict_for_debug()
+
+
+def test_tiered_meta_storage_many(mocker: MockerFixture) -> None:
+    now = int(time.time())
+    fresh = encoded_meta(now + 3600)
+    expired = encoded_meta(now - 1)
+
+    backend = MemoryStorage()
+    spy_get_many = mocker.spy(backend, "get_many")
+    meta_storage = TieredMetaStorage(backend)
+    meta_storage.put_many({"key1": fresh, "key2": expired})
+
+    # only misses and expired metas are read from the backend
+    assert meta_storage.get_many(["key1", "key2", "key3"]) == [fresh, expired, None]
+    spy_get_many.assert_called_once_with(["key2", "key3"])
+
+    meta_storage.delete_many(["key1", "key2"])
+    assert meta_storage.get_many(["key1", "key2"]) == [None, None]
+    assert backend.dict_for_debug() == {}
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Mapping, Optional, Tuple
+
+import requests
+import responses
+from cached_http_fetcher.async_entrypoint import fetch_urls_async
+from cached_http_fetcher.meta import get_meta
+from cached_http_fetcher.storage import (
+    AsyncContentStorageBase,
+    AsyncMetaStorageAdapter,
+    ContentMemoryStorage,
+    MemoryStorage,
+)
+
+from .model import FixtureURLS
+
+
+def test_fetch_urls_async_memory(
+    urls: FixtureURLS,
+    logger: logging.Logger,
+    requests_mock: responses.RequestsMock,
+) -> None:
+    for url, obj in urls.items():
+        requests_mock.add(requests_mock.GET, url, body=obj.content)
+
+    url_list = urls.keys()
+
+    meta_memory_storage = MemoryStorage()
+    content_memory_storage = ContentMemoryStorage()
+
+    report = asyncio.run(
+        fetch_urls_async(
+            url_list,
+            meta_memory_storage,
+            content_memory_storage,
+            logger=logger,
+        )
+    )
+
+    assert len(requests_mock.calls) == len(urls)
+    assert report.outcomes == {"stored": len(urls)}
+    assert report.stages["store_content"].count == len(urls)
+    assert len(meta_memory_storage.dict_for_debug()) == len(urls)
+    assert len(content_memory_storage.dict_for_debug()) == len(urls)
+    for url in url_list:
+        meta = get_meta(url, meta_storage=meta_memory_storage, logger=logger)
+        assert meta is not None
+        assert meta.cached_url == content_memory_storage.cached_url(url)
+
+    # all responses must be cached
+    asyncio.run(
+        fetch_urls_async(
+            url_list,
+            meta_memory_storage,
+            content_memory_storage,
+            logger=logger,
+        )
+    )
+    assert len(requests_mock.calls) == len(urls)
+
+
+def test_fetch_urls_async_concurrency_per_host(
+    logger: logging.Logger, requests_mock: responses.RequestsMock
+) -> None:
+    url_list = [f"http://example.com/image{i}.jpg" for i in range(12)]
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def request_callback(
+        request: requests.PreparedRequest,
+    ) -> Tuple[int, Mapping[str, str], bytes]:
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return 200, {}, b"content"
+
+    for url in url_list:
+        requests_mock.add_callback(requests_mock.GET, url, callback=request_callback)
+
+    meta_memory_storage = MemoryStorage()
+    content_memory_storage = ContentMemoryStorage()
+
+    asyncio.run(
+        fetch_urls_async(
+            url_list,
+            meta_memory_storage,
+            content_memory_storage,
+            max_concurrency_per_host=3,
+            logger=logger,
+        )
+    )
+
+    assert len(requests_mock.calls) == len(url_list)
+    assert len(content_memory_storage.dict_for_debug()) == len(url_list)
+    assert 1 < max_in_flight <= 3
+
+
+class SlowAsyncContentStorage(AsyncContentStorageBase):
+    def __init__(self) -> None:
+        self.dict: Dict[str, bytes] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def get(self, source_url: str) -> Optional[bytes]:
+        return self.dict.get(source_url, None)
+
+    async def delete(self, source_url: str) -> None:
+        del self.dict[source_url]
+
+    async def put_content(
+        self,
+        source_url: str,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.05)  # a remote storage
+        self.in_flight -= 1
+        self.dict[source_url] = value
+
+    def cached_url(self, source_url: str) -> str:
+        return f"slow:{source_url}"
+
+
+def test_fetch_urls_async_storage(
+    logger: logging.Logger, requests_mock: responses.RequestsMock
+) -> None:
+    url_list = [f"http://example.com/image{i}.jpg" for i in range(12)]
+    for i, url in enumerate(url_list):
+        requests_mock.add(requests_mock.GET, url, body=f"content{i}".encode())
+
+    meta_memory_storage = MemoryStorage()
+    content_storage = SlowAsyncContentStorage()
+
+    asyncio.run(
+        fetch_urls_async(
+            url_list,
+            AsyncMetaStorageAdapter(meta_memory_storage),
+            content_storage,
+            max_concurrency_per_host=2,
+            logger=logger,
+        )
+    )
+
+    assert len(content_storage.dict) == len(url_list)
+    # writes overlap with each other, beyond fetches per host
+    assert content_storage.max_in_flight > 2
+    for url in url_list:
+        meta = get_meta(url, meta_storage=meta_memory_storage, logger=logger)
+        assert meta is not None
+        assert meta.cached_url == f"slow:{url}"
@@ -0,0 +1,141 @@
+import logging
+import multiprocessing
+import time
+from typing import Optional
+
+from cached_http_fetcher.autoscale import (
+    Autoscale,
+    Autoscaler,
+    PoolStats,
+    WorkerPool,
+    scale_content,
+    scale_fetch,
+    utilization,
+)
+from cached_http_fetcher.entrypoint import (
+    ContentWorker,
+    FetchWorker,
+    ResponseQueueItem,
+    UrlQueueItem,
+)
+from cached_http_fetcher.storage import ContentMemoryStorage, MemoryStorage
+
+
+class Worker(multiprocessing.Process):
+    def __init__(
+        self, queue: "multiprocessing.Queue[Optional[int]]", stats: PoolStats
+    ) -> None:
+        super().__init__()
+        self._queue = queue
+        self._stats = stats
+
+    def run(self) -> None:
+        while self._queue.get() is not None:
+            self._stats.add_blocked(1.0)
+        self._stats.add_idle(1.0)
+
+
+def test_scale_fetch() -> None:
+    autoscale = Autoscale(min_fetch_processes=2, max_fetch_processes=10)
+    # busy fetchers are grown by a quarter
+    assert scale_fetch(autoscale, 8, utilization=0.9, blocked=0.0, fill=0.0) == 2
+    assert scale_fetch(autoscale, 9, utilization=0.9, blocked=0.0, fill=0.0) == 1
+    assert scale_fetch(autoscale, 10, utilization=0.9, blocked=0.0, fill=0.0) == 0
+    # content processes can't keep up
+    assert scale_fetch(autoscale, 8, utilization=0.9, blocked=0.0, fill=0.9) == 0
+    assert scale_fetch(autoscale, 8, utilization=0.9, blocked=0.5, fill=0.9) == -1
+    # idle fetchers
+    assert scale_fetch(autoscale, 8, utilization=0.1, blocked=0.0, fill=0.0) == -1
+    assert scale_fetch(autoscale, 2, utilization=0.1, blocked=0.0, fill=0.0) == 0
+    assert scale_fetch(autoscale, 8, utilization=0.5, blocked=0.0, fill=0.0) == 0
+
+
+def test_scale_content() -> None:
+    autoscale = Autoscale(min_content_processes=1, max_content_processes=4)
+    assert scale_content(autoscale, 1, utilization=0.5, fill=0.9) == 1
+    assert scale_content(autoscale, 4, utilization=0.5, fill=0.9) == 0
+    assert scale_content(autoscale, 2, utilization=0.9, fill=0.0) == 1
+    assert scale_content(autoscale, 2, utilization=0.1, fill=0.0) == -1
+    assert scale_content(autoscale, 1, utilization=0.1, fill=0.0) == 0
+    # responses are still queued
+    assert scale_content(autoscale, 2, utilization=0.1, fill=0.2) == 0
+
+
+def test_utilization() -> None:
+    assert utilization(1.0, 2, 2.0) == 0.75
+    assert utilization(10.0, 2, 2.0) == 0.0
+    assert utilization(0.0, 0, 2.0) == 0.0
+
+
+def test_worker_pool() -> None:
+    queue: "multiprocessing.Queue[Optional[int]]" = multiprocessing.Queue(2)
+    stats = PoolStats()
+    pool = WorkerPool(lambda: Worker(queue, stats), queue)
+
+    assert pool.grow(3) == 3
+    assert pool.live == 3
+    assert pool.shrink(1) == 1
+    assert pool.live == 2
+    for i in range(4):
+        queue.put(i)
+
+    pool.close()
+    assert pool.live == 0
+    assert pool.grow(1) == 0
+    assert pool.shrink(1) == 0
+    for worker in pool.workers:
+        worker.join()
+        assert worker.exitcode == 0
+    assert len(pool.workers) == 3
+    assert stats.read() == (3.0, 4.0)
+
+
+def test_autoscaler_starved(logger: logging.Logger) -> None:
+    url_queue: "multiprocessing.Queue[UrlQueueItem]" = multiprocessing.Queue()
+    response_queue: "multiprocessing.Queue[ResponseQueueItem]" = multiprocessing.Queue(
+        10
+    )
+    meta_storage = MemoryStorage()
+    fetch_stats = PoolStats()
+    content_stats = PoolStats()
+    fetch_pool = WorkerPool(
+        lambda: FetchWorker(
+            url_queue, response_queue, meta_storage, 0, 0, stats=fetch_stats
+        ),
+        url_queue,
+    )
+    content_pool = WorkerPool(
+        lambda: ContentWorker(
+            response_queue,
+            0,
+            0,
+            meta_storage,
+            ContentMemoryStorage(),
+            stats=content_stats,
+        ),
+        response_queue,
+    )
+    fetch_pool.grow(1)
+    content_pool.grow(1)
+
+    # workers waiting on empty queues aren't seen as busy
+    autoscaler = Autoscaler(
+        Autoscale(max_fetch_processes=6, max_content_processes=6, interval=0.3),
+        fetch_pool,
+        fetch_stats,
+        content_pool,
+        content_stats,
+        response_queue,
+        10,
+        logger=logger,
+    )
+    autoscaler.start()
+    time.sleep(2.0)
+    autoscaler.stop()
+
+    fetch_pool.close()
+    content_pool.close()
+    for worker in fetch_pool.workers + content_pool.workers:
+        worker.join()
+    assert len(fetch_pool.workers) == 1
+    assert len(content_pool.workers) == 1
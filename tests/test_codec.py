@@ -0,0 +1,71 @@
+import pickle
+
+import pytest
+from cached_http_fetcher.codec import decode_expired_at, decode_meta, encode_meta
+from cached_http_fetcher.model import Meta
+
+# Meta pickled by a version before the codec, without content_length
+LEGACY_PICKLED_META = (
+    b"\x80\x04\x95\xcd\x00\x00\x00\x00\x00\x00\x00\x8c\x19cached_http_fetcher.model"
+    b"\x94\x8c\x04Meta\x94\x93\x94)\x81\x94}\x94(\x8c\ncached_url\x94\x8c$memory:"
+    b'http://example.com/image1.jpg\x94\x8c\x04etag\x94\x8c\x06"etag"\x94\x8c\r'
+    b"last_modified\x94N\x8c\x0ccontent_sha1\x94C\x14\x01\x01\x01\x01\x01\x01\x01"
+    b"\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x01\x94\x8c\nfetched_at\x94"
+    b"J<\xe1f`\x8c\nexpired_at\x94J\xbc2h`ub."
+)
+
+
+def test_encode_meta() -> None:
+    meta = Meta(
+        cached_url="memory:http://example.com/image1.jpg",
+        etag='"etag"',
+        last_modified="Wed, 21 Oct 2015 07:28:00 GMT",
+        content_sha1=b"\x01" * 20,
+        fetched_at=1617355068,
+        expired_at=1617441468,
+        content_length=1234567,
+    )
+    encoded = encode_meta(meta)
+    assert decode_meta(encoded) == meta
+    assert decode_expired_at(encoded) == meta.expired_at
+    assert len(encoded) < len(pickle.dumps(meta))
+
+    # None fields are omitted
+    meta = Meta(
+        cached_url=None,
+        etag=None,
+        last_modified=None,
+        content_sha1=None,
+        fetched_at=0,
+        expired_at=-1,
+        content_length=None,
+    )
+    assert decode_meta(encode_meta(meta)) == meta
+
+
+def test_decode_legacy_meta() -> None:
+    meta = decode_meta(LEGACY_PICKLED_META)
+    assert meta == Meta(
+        cached_url="memory:http://example.com/image1.jpg",
+        etag='"etag"',
+        last_modified=None,
+        content_sha1=b"\x01" * 20,
+        fetched_at=1617355068,
+        expired_at=1617441468,
+        content_length=None,
+    )
+    assert decode_expired_at(LEGACY_PICKLED_META) == 1617441468
+
+
+def test_decode_invalid_meta() -> None:
+    with pytest.raises(Exception):
+        decode_meta(b"")
+    with pytest.raises(Exception):
+        decode_meta(b"invalid")
+    with pytest.raises(ValueError):
+        decode_meta(encode_meta(decode_meta(LEGACY_PICKLED_META)) + b"\x00")
+    # only Meta can be unpickled
+    with pytest.raises(pickle.UnpicklingError):
+        decode_meta(pickle.dumps({"cached_url": None}))
+    with pytest.raises(pickle.UnpicklingError):
+        decode_meta(pickle.dumps(ValueError("not a meta")))
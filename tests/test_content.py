@@ -1,4 +1,7 @@
+import hashlib
 import logging
+import os
+import tempfile
 from email.utils import formatdate
 
 from cached_http_fetcher.content import (
@@ -6,11 +9,17 @@ from cached_http_fetcher.content import (
     parse_cache_control,
     put_content,
 )
-from cached_http_fetcher.model import FetchedResponse
-from cached_http_fetcher.storage import ContentMemoryStorage
-from requests import Response
+from cached_http_fetcher.model import Meta
+from cached_http_fetcher.storage import (
+    ContentAddressedMemoryStorage,
+    ContentMemoryStorage,
+    LRUContentMemoryStorage,
+)
+from pytest_mock import MockerFixture
 from requests.structures import CaseInsensitiveDict
 
+from .model import make_fetched_response
+
 
 def test_parse_cache_control() -> None:
     directives = parse_cache_control("no-cache")
@@ -79,12 +88,9 @@ def test_put_content(logger: logging.Logger) -> None:
     content_storage_dict = content_storage.dict_for_debug()
 
     # No content type
-    response = Response()
-    response.url = url
-    response.status_code = 200
-    response._content = content
+    fetched_response = make_fetched_response(url, fetched_at=now, content=content)
     meta = put_content(
-        FetchedResponse(url, now, response, None),
+        fetched_response,
         min_cache_age,
         content_max_age,
         content_storage,
@@ -102,12 +108,11 @@ def test_put_content(logger: logging.Logger) -> None:
     assert meta.expired_at is not None  # tested in test_calc_expired_at()
 
     # With content type
-    response = Response()
-    response.url = url
-    response.status_code = 200
-    response.headers["Content-Type"] = "image/jpeg"
+    fetched_response = make_fetched_response(
+        url, fetched_at=now, headers={"content-type": "image/jpeg"}
+    )
     meta = put_content(
-        FetchedResponse(url, now, response, None),
+        fetched_response,
         min_cache_age,
         content_max_age,
         content_storage,
@@ -118,12 +123,11 @@ def test_put_content(logger: logging.Logger) -> None:
 
     # With etag
     etag = "test etag"
-    response = Response()
-    response.url = url
-    response.status_code = 200
-    response.headers["ETag"] = etag
+    fetched_response = make_fetched_response(
+        url, fetched_at=now, headers={"etag": etag}, old_meta=meta
+    )
     meta = put_content(
-        FetchedResponse(url, now, response, meta),
+        fetched_response,
         min_cache_age,
         content_max_age,
         content_storage,
@@ -134,12 +138,11 @@ def test_put_content(logger: logging.Logger) -> None:
 
     # With last-modified
     last_modified = "Wed, 21 Oct 2015 07:28:00 GMT"
-    response = Response()
-    response.url = url
-    response.status_code = 200
-    response.headers["Last-Modified"] = last_modified
+    fetched_response = make_fetched_response(
+        url, fetched_at=now, headers={"last-modified": last_modified}, old_meta=meta
+    )
     meta = put_content(
-        FetchedResponse(url, now, response, meta),
+        fetched_response,
         min_cache_age,
         content_max_age,
         content_storage,
@@ -151,11 +154,11 @@ def test_put_content(logger: logging.Logger) -> None:
     # 304
     content_storage = ContentMemoryStorage()
     content_storage_dict = content_storage.dict_for_debug()
-    response = Response()
-    response.url = url
-    response.status_code = 304
+    fetched_response = make_fetched_response(
+        url, fetched_at=now, status_code=304, old_meta=meta
+    )
     meta = put_content(
-        FetchedResponse(url, now, response, meta),
+        fetched_response,
         min_cache_age,
         content_max_age,
         content_storage,
@@ -164,15 +167,15 @@ def test_put_content(logger: logging.Logger) -> None:
     assert meta is not None
     assert len(content_storage_dict) == 0  # Not saved
     assert meta.cached_url == content_storage.cached_url(url)
+    assert meta.last_modified == last_modified  # kept from the old meta
+    assert meta.content_length == 0
 
     # 500
     content_storage = ContentMemoryStorage()
     content_storage_dict = content_storage.dict_for_debug()
-    response = Response()
-    response.url = url
-    response.status_code = 500
+    fetched_response = make_fetched_response(url, fetched_at=now, status_code=500)
     meta = put_content(
-        FetchedResponse(url, now, response, None),
+        fetched_response,
         min_cache_age,
         content_max_age,
         content_storage,
@@ -180,3 +183,86 @@ def test_put_content(logger: logging.Logger) -> None:
     )
     assert meta is None
     assert len(content_storage_dict) == 0  # Not saved
+
+
+def test_put_content_file(logger: logging.Logger, mocker: MockerFixture) -> None:
+    now = 1617355068
+    url = "http://example.com/image1.jpg"
+    content = b"large content"
+
+    content_storage = ContentMemoryStorage()
+    content_storage_dict = content_storage.dict_for_debug()
+
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        f.write(content)
+    fetched_response = make_fetched_response(url, fetched_at=now, content_file=f.name)
+    spy_put_content_stream = mocker.spy(content_storage, "put_content_stream")
+    meta = put_content(fetched_response, 3600, 3600, content_storage, logger=logger)
+    assert meta is not None
+    assert meta.content_length == len(content)
+    assert content_storage_dict[url].value == content
+    assert not os.path.exists(f.name)  # removed after stored
+    spy_put_content_stream.assert_called_once()  # not loaded into memory at once
+
+
+def test_put_content_body_skipped(logger: logging.Logger) -> None:
+    now = 1617355068
+    url = "http://example.com/image1.jpg"
+    content_sha1 = hashlib.sha1(b"test content").digest()
+
+    content_storage = ContentMemoryStorage()
+    old_meta = Meta(
+        cached_url=content_storage.cached_url(url),
+        etag='"deadbeef"',
+        last_modified=None,
+        content_sha1=content_sha1,
+        fetched_at=now - 3600,
+        expired_at=now - 1,
+        content_length=12,
+    )
+    fetched_response = make_fetched_response(
+        url,
+        fetched_at=now,
+        headers={"etag": '"deadbeef"', "content-length": "12"},
+        body_skipped=True,
+        old_meta=old_meta,
+    )
+    meta = put_content(fetched_response, 3600, 3600, content_storage, logger=logger)
+    assert meta is not None
+    assert meta.content_sha1 == content_sha1
+    assert meta.content_length == 12
+    assert meta.fetched_at == now
+    assert len(content_storage.dict_for_debug()) == 0  # Not written
+
+
+def test_put_content_too_large(logger: logging.Logger) -> None:
+    now = 1617355068
+    url = "http://example.com/image1.jpg"
+
+    # Meta isn't built for a body the content storage can't hold
+    content_storage = LRUContentMemoryStorage(max_bytes=4)
+    fetched_response = make_fetched_response(
+        url, fetched_at=now, content=b"test content"
+    )
+    meta = put_content(fetched_response, 3600, 3600, content_storage, logger=logger)
+    assert meta is None
+    assert content_storage.get(url) is None
+
+
+def test_put_content_addressed(logger: logging.Logger) -> None:
+    now = 1617355068
+    content = b"pixel"
+
+    content_storage = ContentAddressedMemoryStorage()
+    metas = []
+    for url in ["http://example.com/a/pixel.gif", "http://example.com/b/pixel.gif"]:
+        fetched_response = make_fetched_response(url, fetched_at=now, content=content)
+        meta = put_content(fetched_response, 3600, 3600, content_storage, logger=logger)
+        assert meta is not None
+        metas.append(meta)
+
+    # both urls point to the shared blob
+    assert len(content_storage.dict_for_debug()) == 1
+    sha1 = hashlib.sha1(content).digest()
+    assert metas[0].cached_url == content_storage.blob_url(sha1)
+    assert metas[1].cached_url == content_storage.blob_url(sha1)
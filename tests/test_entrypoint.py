@@ -1,5 +1,11 @@
+import dataclasses
+import glob
 import logging
 import multiprocessing
+import os
+import tempfile
+import threading
+import time
 from typing import List, Mapping, Optional, Tuple
 from unittest import mock
 
@@ -8,16 +14,20 @@ import requests
 import responses
 from cached_http_fetcher import Meta
 from cached_http_fetcher.entrypoint import (
+    SPOOL_DIR_PREFIX,
+    ContentWorker,
     FetchWorker,
+    ResponseQueueItem,
+    UrlQueueItem,
     fetch_urls,
     fetch_urls_single,
-    url_queue_from_iterable,
 )
-from cached_http_fetcher.meta import get_meta
-from cached_http_fetcher.model import FetchedResponse
+from cached_http_fetcher.meta import get_meta, put_meta
+from cached_http_fetcher.plan import ExpiryIndex, PlannedChunk
 from cached_http_fetcher.storage import ContentMemoryStorage, MemoryStorage
+from cached_http_fetcher.url_list import stream_url_chunks
 
-from .model import FixtureURLS
+from .model import FixtureURLS, make_fetched_response
 
 
 def test_fetch_urls_single_memory(
@@ -38,7 +48,9 @@ def test_fetch_urls_single_memory(
         meta = get_meta(url, meta_storage=meta_memory_storage, logger=logger)
         assert meta is None
 
-    fetch_urls_single(
+    spool_pattern = os.path.join(tempfile.gettempdir(), SPOOL_DIR_PREFIX + "*")
+    spool_dirs = set(glob.glob(spool_pattern))
+    report = fetch_urls_single(
         url_list,
         meta_storage=meta_memory_storage,
         content_storage=content_memory_storage,
@@ -49,8 +61,17 @@ def test_fetch_urls_single_memory(
     content_storage = content_memory_storage.dict_for_debug()
 
     assert len(requests_mock.calls) == len(urls)
+    assert report.plan.missing == len(urls)
+    assert report.outcomes == {"stored": len(urls)}
+    assert report.status_codes == {200: len(urls)}
+    assert report.bytes_downloaded == sum(len(obj.content) for obj in urls.values())
+    assert report.bytes_stored == report.bytes_downloaded
+    assert report.stages["fetch"].count == len(urls)
+    assert sum(summary.requests for summary in report.domains.values()) == len(urls)
     assert len(meta_storage) == len(urls)
     assert len(content_storage) == len(urls)
+    # the directory of spooled bodies is removed
+    assert set(glob.glob(spool_pattern)) == spool_dirs
 
     # get cached urls
     for url in url_list:
@@ -59,7 +80,7 @@ def test_fetch_urls_single_memory(
         assert meta.cached_url == content_memory_storage.cached_url(url)
 
     # all responses must be cached
-    fetch_urls_single(
+    report = fetch_urls_single(
         url_list,
         meta_storage=meta_memory_storage,
         content_storage=content_memory_storage,
@@ -67,6 +88,8 @@ def test_fetch_urls_single_memory(
     )
 
     assert len(requests_mock.calls) == len(urls)
+    assert report.plan.fresh == len(urls)
+    assert report.outcomes == {}
     assert len(meta_storage) == len(urls)
     assert len(content_storage) == len(urls)
 
@@ -84,13 +107,76 @@ def test_fetch_urls_single_memory(
     assert len(content_storage) == len(urls)
 
 
+def test_fetch_urls_single_revalidate(
+    logger: logging.Logger, requests_mock: responses.RequestsMock
+) -> None:
+    url = "http://example.com/image.jpg"
+    etag = '"deadbeef"'
+
+    def request_callback(
+        request: requests.PreparedRequest,
+    ) -> Tuple[int, Mapping[str, str], bytes]:
+        if request.headers.get("If-None-Match") == etag:
+            return 304, {}, b""
+        return 200, {"etag": etag}, b"content"
+
+    requests_mock.add_callback(requests_mock.GET, url, callback=request_callback)
+
+    meta_memory_storage = MemoryStorage()
+    content_memory_storage = ContentMemoryStorage()
+
+    fetch_urls_single(
+        [url],
+        meta_storage=meta_memory_storage,
+        content_storage=content_memory_storage,
+        logger=logger,
+    )
+    meta = get_meta(url, meta_storage=meta_memory_storage, logger=logger)
+    assert meta is not None
+    assert meta.content_length == len(b"content")
+
+    # expire the meta, then it is revalidated with a conditional request
+    expired_meta = dataclasses.replace(meta, expired_at=meta.fetched_at - 1)
+    put_meta(url, expired_meta, meta_memory_storage)
+    content_memory_storage.dict_for_debug().clear()
+
+    report = fetch_urls_single(
+        [url],
+        meta_storage=meta_memory_storage,
+        content_storage=content_memory_storage,
+        logger=logger,
+    )
+    assert report.outcomes == {"not_modified": 1}
+    assert report.bytes_saved == len(b"content")
+    assert len(requests_mock.calls) == 2
+    assert requests_mock.calls[-1].request.headers["If-None-Match"] == etag
+    assert len(content_memory_storage.dict_for_debug()) == 0  # not touched
+    meta = get_meta(url, meta_storage=meta_memory_storage, logger=logger)
+    assert meta is not None
+    assert meta.etag == etag
+    assert meta.content_sha1 == expired_meta.content_sha1
+    assert meta.expired_at > expired_meta.expired_at
+
+    # without revalidation, expired urls are fetched in full
+    put_meta(url, expired_meta, meta_memory_storage)
+    fetch_urls_single(
+        [url],
+        meta_storage=meta_memory_storage,
+        content_storage=content_memory_storage,
+        revalidate=False,
+        logger=logger,
+    )
+    assert "If-None-Match" not in requests_mock.calls[-1].request.headers
+    assert content_memory_storage.dict_for_debug()[url].value == b"content"
+
+
 def test_fetch_worker(
     url_list: List[str], mocker: mock.MagicMock, logger: logging.Logger
 ) -> None:
-    url_queue = url_queue_from_iterable(url_list, logger)
-    response_queue: multiprocessing.Queue[
-        Optional[FetchedResponse]
-    ] = multiprocessing.Queue()
+    url_queue: "multiprocessing.Queue[UrlQueueItem]" = multiprocessing.Queue()
+    for url_chunk in stream_url_chunks(url_list):
+        url_queue.put(url_chunk)
+    response_queue: "multiprocessing.Queue[ResponseQueueItem]" = multiprocessing.Queue()
     url_queue.put(None)
 
     meta_memory_storage = MemoryStorage()
@@ -107,8 +193,9 @@ def test_fetch_worker(
         expired_at=0,
     )
 
-    mock_get_valid_meta = mocker.patch(
-        "cached_http_fetcher.entrypoint.get_valid_meta", return_value=meta
+    mock_get_valid_metas = mocker.patch(
+        "cached_http_fetcher.entrypoint.get_valid_metas",
+        side_effect=lambda url_chunk, *args, **kwargs: [meta] * len(url_chunk),
     )
     mock_rate_limit_fetcher = mocker.patch(
         "cached_http_fetcher.entrypoint.RateLimitFetcher"
@@ -122,11 +209,107 @@ def test_fetch_worker(
         fetch_count_window,
     )
     fw.run()
-    fw.close()
-    assert mock_get_valid_meta.call_count == len(url_list)
+    # metas are read once per chunk, and a chunk has urls of a domain
+    assert mock_get_valid_metas.call_count == 3
     mock_rate_limit_fetcher.assert_called_once()
     assert len(mock_rate_limit_fetcher.mock_calls) == len(url_list) * 2 + 1
 
+    # metas read while planning aren't read again
+    url = "http://example.com/image.jpg"
+    list(fw.fetch_chunk(PlannedChunk([url], [meta])))
+    assert mock_get_valid_metas.call_count == 3
+    mock_rate_limit_fetcher.return_value.fetch.assert_called_with(url, meta, mock.ANY)
+    fw.close()
+
+
+def test_content_worker_meta_batch(logger: logging.Logger) -> None:
+    response_queue: "multiprocessing.Queue[ResponseQueueItem]" = multiprocessing.Queue()
+    meta_memory_storage = MemoryStorage()
+    content_memory_storage = ContentMemoryStorage()
+    expiry_index = ExpiryIndex()
+
+    cw = ContentWorker(
+        response_queue,
+        3600,
+        3600,
+        meta_memory_storage,
+        content_memory_storage,
+        meta_batch_size=2,
+        expiry_index=expiry_index,
+    )
+    for i in range(3):
+        cw.process(
+            make_fetched_response(
+                f"http://example.com/image{i}.jpg", content=b"content"
+            )
+        )
+        # metas are written in a batch after contents are stored
+        assert len(content_memory_storage.dict_for_debug()) == i + 1
+        assert len(meta_memory_storage.dict_for_debug()) == [0, 2, 2][i]
+
+    cw.flush_metas()
+    assert len(meta_memory_storage.dict_for_debug()) == 3
+    # written metas are indexed
+    assert len(expiry_index) == 3
+    meta = get_meta("http://example.com/image0.jpg", meta_memory_storage, logger=logger)
+    assert meta is not None
+    assert expiry_index.get("http://example.com/image0.jpg") == meta.expired_at
+    cw.close()
+
+
+class SlowContentMemoryStorage(ContentMemoryStorage):
+    def __init__(self) -> None:
+        super().__init__()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def put_content(
+        self,
+        source_url: str,
+        value: bytes,
+        cache_control: str,
+        content_type: Optional[str] = None,
+    ) -> None:
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.02)  # a remote storage
+        with self.lock:
+            self.in_flight -= 1
+        if source_url.endswith("broken.jpg"):
+            raise IOError("broken")
+        super().put_content(source_url, value, cache_control, content_type)
+
+
+def test_content_worker_in_flight(logger: logging.Logger) -> None:
+    response_queue: "multiprocessing.Queue[ResponseQueueItem]" = multiprocessing.Queue()
+    meta_memory_storage = MemoryStorage()
+    content_storage = SlowContentMemoryStorage()
+
+    cw = ContentWorker(
+        response_queue,
+        3600,
+        3600,
+        meta_memory_storage,
+        content_storage,
+        meta_batch_size=4,
+        max_in_flight=3,
+    )
+    url_list = [f"http://example.com/image{i}.jpg" for i in range(8)]
+    url_list.append("http://example.com/broken.jpg")
+    for url in url_list:
+        cw.process(make_fetched_response(url, content=url.encode()))
+    cw.drain()
+
+    # at most max_in_flight writes at once
+    assert 1 < content_storage.max_in_flight <= 3
+    assert len(content_storage.dict_for_debug()) == 8
+    # no meta for a failed content
+    assert len(meta_memory_storage.dict_for_debug()) == 8
+    assert "http://example.com/broken.jpg" not in meta_memory_storage.dict_for_debug()
+    cw.close()
+
 
 @pytest.mark.skip(reason="not working well")
 def test_fetch_urls_memory(
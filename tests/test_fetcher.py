@@ -0,0 +1,62 @@
+import logging
+
+import pytest
+import responses
+from cached_http_fetcher import ExpiryIndex, Fetcher
+from cached_http_fetcher.meta import get_meta
+from cached_http_fetcher.report import STORED
+from cached_http_fetcher.storage import StorageServer
+
+from .model import FixtureURLS
+
+
+def test_fetcher(urls: FixtureURLS, logger: logging.Logger) -> None:
+    # Worker processes are forked with the mocked responses, and calls in
+    # them aren't seen by this process
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as requests_mock:
+        for url, obj in urls.items():
+            requests_mock.add(requests_mock.GET, url, body=obj.content)
+        run_batches(urls, logger)
+
+
+def run_batches(urls: FixtureURLS, logger: logging.Logger) -> None:
+    url_list = list(urls.keys())
+    first, second = url_list[:4], url_list[4:]
+
+    expiry_index = ExpiryIndex()
+    with StorageServer() as server:
+        meta_storage = server.meta_storage()
+        content_storage = server.content_storage()
+        with Fetcher(
+            meta_storage,
+            content_storage,
+            num_fetch_processes=2,
+            num_content_processes=2,
+            max_in_flight_writes=2,
+            expiry_index=expiry_index,
+            logger=logger,
+        ) as fetcher:
+            report = fetcher.submit(first)
+            assert report.outcomes == {STORED: len(first)}
+            assert report.plan.missing == len(first)
+            # Metas are written before submit() returns
+            for url in first:
+                meta = get_meta(url, meta_storage, logger=logger)
+                assert meta is not None
+                assert content_storage.get(url) == urls[url].content
+            # Content processes index the metas they write
+            assert len(expiry_index) == len(first)
+
+            # The same processes fetch the next batch
+            report = fetcher.submit(url_list)
+            assert report.outcomes == {STORED: len(second)}
+            assert report.plan.fresh == len(first)
+            assert report.plan.missing == len(second)
+            for url in second:
+                assert get_meta(url, meta_storage, logger=logger) is not None
+
+            report = fetcher.submit([])
+            assert report.outcomes == {}
+
+        with pytest.raises(RuntimeError):
+            fetcher.submit(first)
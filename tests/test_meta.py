@@ -1,8 +1,16 @@
 import logging
 
-from cached_http_fetcher.meta import get_valid_meta, put_meta
+from typing import Dict, Optional
+
+from cached_http_fetcher.meta import (
+    get_metas,
+    get_valid_meta,
+    get_valid_metas,
+    put_meta,
+    put_metas,
+)
 from cached_http_fetcher.model import Meta
-from cached_http_fetcher.storage import MemoryStorage
+from cached_http_fetcher.storage import MemoryStorage, MetaStorageBase
 
 
 def test_get_valid_meta(logger: logging.Logger) -> None:
@@ -44,3 +52,53 @@ def test_get_valid_meta(logger: logging.Logger) -> None:
     put_meta(url, meta, meta_storage)
     assert get_valid_meta(url, now, meta_storage, logger=logger) is None
     assert len(meta_storage_dict) == 1  # not deleted
+
+
+class SingleKeyStorage(MetaStorageBase):
+    """
+    A storage without batch operations
+    """
+
+    def __init__(self) -> None:
+        self.dict: Dict[str, bytes] = {}
+
+    def get(self, source_url: str) -> Optional[bytes]:
+        return self.dict.get(source_url, None)
+
+    def delete(self, source_url: str) -> None:
+        del self.dict[source_url]
+
+    def put(self, source_url: str, value: bytes) -> None:
+        self.dict[source_url] = value
+
+
+def test_metas(logger: logging.Logger) -> None:
+    now = 1617355068
+    urls = [f"http://example.com/image{i}.jpg" for i in range(4)]
+
+    def new_meta(expired_at: int) -> Meta:
+        return Meta(
+            cached_url="dummy",
+            etag=None,
+            last_modified=None,
+            content_sha1=None,
+            fetched_at=now,
+            expired_at=expired_at,
+        )
+
+    for meta_storage in [MemoryStorage(), SingleKeyStorage()]:
+        put_metas(
+            {urls[0]: new_meta(now + 3600), urls[1]: new_meta(now - 3600)},
+            meta_storage,
+        )
+        meta_storage.put(urls[2], b"invalid")
+
+        metas = get_metas(urls, meta_storage, logger=logger)
+        assert metas == [new_meta(now + 3600), new_meta(now - 3600), None, None]
+        assert meta_storage.get(urls[2]) is None  # invalid entry is removed
+
+        metas = get_valid_metas(urls, now, meta_storage, logger=logger)
+        assert metas == [new_meta(now + 3600), None, None, None]
+
+        put_metas({urls[0]: None}, meta_storage)
+        assert get_metas(urls[:1], meta_storage, logger=logger) == [None]
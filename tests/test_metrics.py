@@ -0,0 +1,100 @@
+import logging
+import multiprocessing
+import urllib.request
+
+import requests
+from cached_http_fetcher.metrics import (
+    InstrumentedMetaStorage,
+    MetricsHook,
+    MetricsRegistry,
+)
+from cached_http_fetcher.rate_limit_fetcher import RateLimitFetcher
+from cached_http_fetcher.request import MAX_TRIES, requests_get
+from cached_http_fetcher.storage import MemoryStorage
+from pytest_mock import MockerFixture
+
+
+def record_in_worker(registry: MetricsRegistry) -> None:
+    registry.retry("timeout")
+    registry.storage_call("meta", "get", 0.002)
+    registry.flush()
+
+
+def test_metrics_registry() -> None:
+    with MetricsRegistry() as registry:
+        registry.retry("timeout")
+        registry.queue_depth("url", 3)
+        registry.queue_depth("url", 2)
+        registry.request_started()
+        registry.storage_call("meta", "get", 0.002)
+
+        # metrics of worker processes are added up
+        process = multiprocessing.Process(target=record_in_worker, args=(registry,))
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+
+        text = registry.export()
+        assert "# TYPE cached_http_fetcher_request_retries_total counter" in text
+        assert 'cached_http_fetcher_request_retries_total{reason="timeout"} 2' in text
+        assert 'cached_http_fetcher_queue_depth{queue="url"} 2' in text
+        assert "cached_http_fetcher_in_flight_requests 1" in text
+        assert (
+            'cached_http_fetcher_storage_call_seconds_bucket{method="get",storage="meta",le="0.001"} 0'
+            in text
+        )
+        assert (
+            'cached_http_fetcher_storage_call_seconds_bucket{method="get",storage="meta",le="+Inf"} 2'
+            in text
+        )
+        assert (
+            'cached_http_fetcher_storage_call_seconds_count{method="get",storage="meta"} 2'
+            in text
+        )
+
+        host, port = registry.serve()
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            assert response.read().decode("utf-8") == registry.export()
+
+
+def test_instrumented_storage(mocker: MockerFixture) -> None:
+    metrics = mocker.MagicMock(spec=MetricsHook)
+    storage = InstrumentedMetaStorage(MemoryStorage(), metrics)
+    storage.put_many({"key1": b"value1"})
+    assert storage.get("key1") == b"value1"
+    assert [c.args[:2] for c in metrics.storage_call.call_args_list] == [
+        ("meta", "put_many"),
+        ("meta", "get"),
+    ]
+
+
+def test_fetch_hooks(mocker: MockerFixture, logger: logging.Logger) -> None:
+    metrics = mocker.MagicMock(spec=MetricsHook)
+    url = "http://example.com/image1.jpg"
+
+    mocker.patch("cached_http_fetcher.rate_limit_fetcher.time.sleep")
+    mocker.patch(
+        "cached_http_fetcher.rate_limit_fetcher.cached_requests_get",
+        return_value=None,
+    )
+    rate_limiter = mocker.MagicMock()
+    rate_limiter.acquire.return_value = 1.5
+    rate_limit_fetcher = RateLimitFetcher(
+        max_fetch_count=0,
+        fetch_count_window=0,
+        rate_limiter=rate_limiter,
+        metrics=metrics,
+        logger=logger,
+    )
+    assert list(rate_limit_fetcher.fetch(url, None, 0)) == []
+    metrics.rate_limit_wait.assert_called_once_with("example.com", 1.5)
+    metrics.request_started.assert_called_once()
+    metrics.request_finished.assert_called_once()
+
+    # retries after timeouts
+    mocker.patch("cached_http_fetcher.request.time.sleep")
+    session = mocker.MagicMock()
+    session.get_session.return_value.get.side_effect = requests.exceptions.Timeout
+    assert requests_get(url, {}, session, metrics) is None
+    assert metrics.retry.call_count == MAX_TRIES - 1
+    metrics.retry.assert_called_with("timeout")
@@ -0,0 +1,84 @@
+import logging
+
+from cached_http_fetcher.meta import put_meta
+from cached_http_fetcher.model import Meta
+from cached_http_fetcher.plan import ExpiryIndex, PlanReport, plan_url_chunks
+from cached_http_fetcher.storage import MemoryStorage
+from pytest_mock import MockerFixture
+
+
+def test_plan_url_chunks(mocker: MockerFixture, logger: logging.Logger) -> None:
+    now = 1617355068
+    mocker.patch("cached_http_fetcher.plan.time.time", return_value=now)
+    fresh_url = "http://example.com/fresh.jpg"
+    stale_url = "http://example.com/stale.jpg"
+    missing_url = "http://example.com/missing.jpg"
+
+    meta_storage = MemoryStorage()
+    for url, expired_at in [(fresh_url, now + 3600), (stale_url, now - 3600)]:
+        put_meta(
+            url,
+            Meta(
+                cached_url="dummy",
+                etag=None,
+                last_modified=None,
+                content_sha1=None,
+                fetched_at=now - 7200,
+                expired_at=expired_at,
+            ),
+            meta_storage,
+        )
+
+    report = PlanReport()
+    expiry_index = ExpiryIndex()
+    chunks = list(
+        plan_url_chunks(
+            [[fresh_url, stale_url], [missing_url], [fresh_url]],
+            meta_storage,
+            expiry_index=expiry_index,
+            report=report,
+            logger=logger,
+        )
+    )
+    # metas are passed with the urls
+    assert [chunk.urls for chunk in chunks] == [[stale_url], [missing_url]]
+    assert [
+        [meta.expired_at if meta is not None else None for meta in chunk.metas]
+        for chunk in chunks
+    ] == [[now - 3600], [None]]
+    assert (report.fresh, report.stale, report.missing) == (2, 1, 1)
+    assert len(expiry_index) == 2
+    assert expiry_index.get(fresh_url) == now + 3600
+
+    # fresh urls in the index don't read metas
+    mock_get_many = mocker.spy(meta_storage, "get_many")
+    report = PlanReport()
+    chunks = list(
+        plan_url_chunks(
+            [[fresh_url]],
+            meta_storage,
+            expiry_index=expiry_index,
+            report=report,
+            logger=logger,
+        )
+    )
+    assert chunks == []
+    assert report.fresh == 1
+    mock_get_many.assert_not_called()
+
+
+def test_expiry_index() -> None:
+    expiry_index = ExpiryIndex()
+    assert expiry_index.get("http://example.com/1") is None
+    expiry_index.update("http://example.com/1", 100)
+    expiry_index.update("http://example.com/1", 200)
+    assert expiry_index.get("http://example.com/1") == 200
+    assert len(expiry_index) == 1
+
+    # the size is bounded, and an overwritten url is unknown
+    expiry_index = ExpiryIndex(num_slots=1)
+    expiry_index.update("http://example.com/1", 100)
+    expiry_index.update("http://example.com/2", 200)
+    assert len(expiry_index) == 1
+    assert expiry_index.get("http://example.com/1") is None
+    assert expiry_index.get("http://example.com/2") == 200
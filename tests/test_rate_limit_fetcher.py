@@ -1,9 +1,10 @@
 import logging
 
-from cached_http_fetcher.model import FetchedResponse, Meta
+from cached_http_fetcher.model import Meta
 from cached_http_fetcher.rate_limit_fetcher import RateLimitFetcher
 from pytest_mock import MockerFixture
-from requests import Response
+
+from .model import make_fetched_response
 
 
 def test_rate_limit_fetcher(mocker: MockerFixture, logger: logging.Logger) -> None:
@@ -11,9 +12,7 @@ def test_rate_limit_fetcher(mocker: MockerFixture, logger: logging.Logger) -> No
     past = now - 3600
     future = now + 3600
     url = "http://example.com/image1.jpg"
-    mock_fetched_response = FetchedResponse(
-        url=url, fetched_at=now, response=Response(), old_meta=None
-    )
+    mock_fetched_response = make_fetched_response(url, fetched_at=now, content=b"")
 
     mock = mocker.patch(
         "cached_http_fetcher.rate_limit_fetcher.cached_requests_get",
@@ -40,3 +39,39 @@ def test_rate_limit_fetcher(mocker: MockerFixture, logger: logging.Logger) -> No
     assert call_args[0] == url
     assert call_args[1] == old_meta
     assert call_args[2] == now
+
+
+def test_rate_limit_fetcher_rate_limiter(
+    mocker: MockerFixture, logger: logging.Logger
+) -> None:
+    now = 1617355068
+    url = "http://example.com/image1.jpg"
+    mocker.patch(
+        "cached_http_fetcher.rate_limit_fetcher.cached_requests_get",
+        return_value=None,
+    )
+    mock_sleep = mocker.patch("cached_http_fetcher.rate_limit_fetcher.time.sleep")
+    rate_limiter = mocker.MagicMock()
+    rate_limiter.acquire.return_value = 1.5
+
+    rate_limit_fetcher = RateLimitFetcher(
+        max_fetch_count=0,
+        fetch_count_window=0,
+        rate_limiter=rate_limiter,
+        logger=logger,
+    )
+    assert list(rate_limit_fetcher.fetch(url, None, now)) == []
+    rate_limiter.acquire.assert_called_once_with("example.com")
+    mock_sleep.assert_called_once_with(1.5)
+
+    # a still valid url doesn't take a token
+    old_meta = Meta(
+        cached_url=url,
+        etag=None,
+        last_modified=None,
+        content_sha1=None,
+        fetched_at=now,
+        expired_at=now + 3600,
+    )
+    assert list(rate_limit_fetcher.fetch(url, old_meta, now)) == []
+    rate_limiter.acquire.assert_called_once()
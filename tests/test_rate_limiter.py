@@ -0,0 +1,111 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+from cached_http_fetcher.rate_limiter import (
+    MemoryRateLimiter,
+    RateLimiterBase,
+    SharedConcurrencyLimiter,
+    SharedMemoryRateLimiter,
+    create_rate_limiter,
+    take_token,
+)
+from pytest_mock import MockerFixture
+
+
+def test_take_token() -> None:
+    # refilled up to the capacity
+    tokens, wait = take_token(0.0, 0.0, 3.0, 1.0, 100.0)
+    assert tokens == 2.0
+    assert wait == 0.0
+
+    # an empty bucket reserves a token and waits for the refill
+    tokens, wait = take_token(0.0, 100.0, 3.0, 0.5, 100.0)
+    assert tokens == -1.0
+    assert wait == 2.0
+    tokens, wait = take_token(tokens, 100.0, 3.0, 0.5, 100.0)
+    assert tokens == -2.0
+    assert wait == 4.0
+
+
+def _acquire(rate_limiter: RateLimiterBase, key: str) -> None:
+    rate_limiter.acquire(key)
+
+
+@pytest.mark.parametrize("cls", [MemoryRateLimiter, SharedMemoryRateLimiter])
+def test_rate_limiter(cls: type, mocker: MockerFixture) -> None:
+    mocker.patch("cached_http_fetcher.rate_limiter.time.time", return_value=1000.0)
+    rate_limiter = cls(2, 10)
+
+    assert rate_limiter.acquire("example.com") == 0.0
+    assert rate_limiter.acquire("example.com") == 0.0
+    assert rate_limiter.acquire("example.com") == 5.0
+    # another key has its own bucket
+    assert rate_limiter.acquire("example.net") == 0.0
+
+
+def test_shared_memory_rate_limiter_processes() -> None:
+    rate_limiter = SharedMemoryRateLimiter(2, 3600)
+
+    p = multiprocessing.Process(target=_acquire, args=(rate_limiter, "example.com"))
+    p.start()
+    p.join()
+
+    # a token is taken in the other process
+    assert rate_limiter.acquire("example.com") == 0.0
+    assert rate_limiter.acquire("example.com") > 0.0
+
+
+def test_create_rate_limiter() -> None:
+    assert create_rate_limiter(0, 10, shared=False) is None
+    assert create_rate_limiter(10, 0, shared=True) is None
+    assert isinstance(create_rate_limiter(1, 1, shared=False), MemoryRateLimiter)
+    assert isinstance(create_rate_limiter(1, 1, shared=True), SharedMemoryRateLimiter)
+
+
+def _hold(limiter: SharedConcurrencyLimiter, key: str, seconds: float) -> None:
+    with limiter.hold(key):
+        time.sleep(seconds)
+
+
+def test_shared_concurrency_limiter() -> None:
+    limiter = SharedConcurrencyLimiter(2)
+    running = 0
+    max_running = 0
+    lock = threading.Lock()
+
+    def request() -> None:
+        nonlocal running, max_running
+        with limiter.hold("example.com"):
+            with lock:
+                running += 1
+                max_running = max(max_running, running)
+            time.sleep(0.01)
+            with lock:
+                running -= 1
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max_running == 2
+
+    # requests in other processes are counted
+    processes = [
+        multiprocessing.Process(target=_hold, args=(limiter, "example.com", 0.2))
+        for _ in range(2)
+    ]
+    for p in processes:
+        p.start()
+    time.sleep(0.1)
+    # another key isn't limited
+    started = time.monotonic()
+    with limiter.hold("example.net"):
+        assert time.monotonic() - started < 0.05
+    started = time.monotonic()
+    with limiter.hold("example.com"):
+        assert time.monotonic() - started > 0.05
+    for p in processes:
+        p.join()
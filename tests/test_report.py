@@ -0,0 +1,52 @@
+from cached_http_fetcher.report import (
+    FETCH,
+    STORED,
+    LatencyHistogram,
+    FetchReport,
+)
+
+
+def test_latency_histogram() -> None:
+    histogram = LatencyHistogram()
+    assert histogram.mean == 0.0
+    assert histogram.quantile(0.5) == 0.0
+
+    for seconds in [0.002, 0.002, 0.002, 0.3]:
+        histogram.observe(seconds)
+    assert histogram.count == 4
+    assert histogram.mean == (0.006 + 0.3) / 4
+    assert histogram.quantile(0.5) == 0.0025
+    assert histogram.quantile(0.99) == 0.5
+
+    # over the last bound
+    histogram.observe(60)
+    assert histogram.quantile(1.0) == float("inf")
+
+
+def test_fetch_report_merge() -> None:
+    report1 = FetchReport()
+    report1.count(STORED)
+    report1.count_status(200)
+    report1.observe(FETCH, 0.01)
+    report1.domain("example.com").requests += 1
+    report1.bytes_downloaded = 10
+
+    report2 = FetchReport()
+    report2.count(STORED, 2)
+    report2.count_status(200)
+    report2.count_status(404)
+    report2.observe(FETCH, 0.02)
+    report2.domain("example.com").requests += 2
+    report2.domain("example.net").failures += 1
+    report2.bytes_downloaded = 20
+    report2.plan.fresh = 3
+
+    report1.merge(report2)
+    assert report1.outcomes == {STORED: 3}
+    assert report1.status_codes == {200: 2, 404: 1}
+    assert report1.stages[FETCH].count == 2
+    assert report1.domains["example.com"].requests == 3
+    assert report1.domains["example.net"].failures == 1
+    assert report1.bytes_downloaded == 30
+    assert report1.plan.fresh == 3
+    assert "3 stored" in str(report1)
@@ -1,8 +1,22 @@
+import glob
+import hashlib
 import logging
+import os
+import pickle
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
 
 import responses
 from cached_http_fetcher.model import Meta
-from cached_http_fetcher.request import cached_requests_get
+from cached_http_fetcher.request import (
+    FetchSession,
+    cached_requests_get,
+    is_unchanged,
+)
+from pytest_mock import MockerFixture
+from requests import Response
 
 
 def test_cached_requests_get(
@@ -20,8 +34,8 @@ def test_cached_requests_get(
     assert len(requests_mock.calls) == 1
     assert fetched_response.url == url
     assert fetched_response.fetched_at == now
-    assert fetched_response.response.status_code == 200
-    assert fetched_response.response.content == b"test"
+    assert fetched_response.status_code == 200
+    assert fetched_response.content == b"test"
     last_call = requests_mock.calls[-1]
     assert "If-None-Match" not in last_call.request.headers
     assert "If-Modified-Since" not in last_call.request.headers
@@ -52,8 +66,8 @@ def test_cached_requests_get(
     assert len(requests_mock.calls) == 2
     assert fetched_response.url == url
     assert fetched_response.fetched_at == now
-    assert fetched_response.response.status_code == 200
-    assert fetched_response.response.content == b"test"
+    assert fetched_response.status_code == 200
+    assert fetched_response.content == b"test"
     last_call = requests_mock.calls[-1]
     assert last_call.request.headers["If-None-Match"] == meta.etag
     assert "If-Modified-Since" not in last_call.request.headers
@@ -72,11 +86,288 @@ def test_cached_requests_get(
     assert len(requests_mock.calls) == 3
     assert fetched_response.url == url
     assert fetched_response.fetched_at == now
-    assert fetched_response.response.status_code == 200
-    assert fetched_response.response.content == b"test"
+    assert fetched_response.status_code == 200
+    assert fetched_response.content == b"test"
     last_call = requests_mock.calls[-1]
     assert "If-None-Match" not in last_call.request.headers
     assert last_call.request.headers["If-Modified-Since"] == meta.last_modified
 
 
+def test_fetch_session(
+    requests_mock: responses.RequestsMock,
+    mocker: MockerFixture,
+    logger: logging.Logger,
+) -> None:
+    now = 1617355068
+    url = "https://example.com/image1.txt"
+    requests_mock.add(requests_mock.GET, url, body=b"test")
+
+    mock_monotonic = mocker.patch(
+        "cached_http_fetcher.request.time.monotonic", return_value=100.0
+    )
+    session = FetchSession(pool_maxsize=3, idle_timeout=60)
+
+    # the session is reused between requests
+    cached_requests_get(url, None, now, session=session, logger=logger)
+    first_session = session.get_session()
+    cached_requests_get(url, None, now, session=session, logger=logger)
+    assert session.get_session() is first_session
+    assert len(requests_mock.calls) == 2
+    adapter = first_session.get_adapter(url)
+    assert adapter._pool_maxsize == 3  # type: ignore
+
+    # the session is recreated after idle_timeout
+    mock_monotonic.return_value = 161.0
+    assert session.get_session() is not first_session
+
+    session.close()
+
+
+def test_cached_requests_get_throwaway_session(
+    requests_mock: responses.RequestsMock,
+    mocker: MockerFixture,
+    logger: logging.Logger,
+) -> None:
+    now = 1617355068
+    url = "https://example.com/image1.txt"
+    requests_mock.add(requests_mock.GET, url, body=b"test")
+
+    # a session created for a single request is closed
+    spy_close = mocker.spy(FetchSession, "close")
+    fetched_response = cached_requests_get(url, None, now, logger=logger)
+    assert fetched_response is not None
+    assert fetched_response.content == b"test"
+    assert spy_close.call_count == 1
+
+    # a given session is kept open
+    session = FetchSession()
+    cached_requests_get(url, None, now, session=session, logger=logger)
+    assert spy_close.call_count == 1
+    session.close()
+
+
+def test_cached_requests_get_transport(
+    requests_mock: responses.RequestsMock,
+    mocker: MockerFixture,
+    logger: logging.Logger,
+) -> None:
+    now = 1617355068
+    url = "https://example.com/image1.txt"
+    requests_mock.add(
+        requests_mock.GET,
+        url,
+        body=b"large content",
+        headers={"ETag": "deadbeef", "X-Unused": "unused"},
+        content_type="text/plain",
+    )
+
+    # only the headers we use are kept
+    fetched_response = cached_requests_get(url, None, now, logger=logger)
+    assert fetched_response is not None
+    assert fetched_response.headers["etag"] == "deadbeef"
+    assert fetched_response.headers["content-type"] == "text/plain"
+    assert "x-unused" not in fetched_response.headers
+    assert pickle.loads(pickle.dumps(fetched_response)) == fetched_response
+
+    # a large body is spooled to a file
+    mocker.patch("cached_http_fetcher.request.INLINE_CONTENT_MAX", 4)
+    mocker.patch("cached_http_fetcher.request.CHUNK_SIZE", 3)
+    fetched_response = cached_requests_get(url, None, now, logger=logger)
+    assert fetched_response is not None
+    assert fetched_response.content is None
+    assert fetched_response.content_file is not None
+    with open(fetched_response.content_file, "rb") as f:
+        assert f.read() == b"large content"
+    os.unlink(fetched_response.content_file)
+
+
+def test_cached_requests_get_body(
+    requests_mock: responses.RequestsMock,
+    mocker: MockerFixture,
+    logger: logging.Logger,
+) -> None:
+    now = 1617355068
+    url = "https://example.com/image1.txt"
+    large_url = "https://example.com/large.txt"
+    declared_url = "https://example.com/declared.txt"
+    error_url = "https://example.com/error.txt"
+    requests_mock.add(requests_mock.GET, url, body=b"test")
+    requests_mock.add(requests_mock.GET, large_url, body=b"large content")
+    requests_mock.add(
+        requests_mock.GET,
+        declared_url,
+        body=b"test",
+        headers={"Content-Length": "100"},
+    )
+    requests_mock.add(requests_mock.GET, error_url, body=b"not found", status=404)
+
+    # the body is hashed while reading
+    fetched_response = cached_requests_get(
+        url, None, now, max_content_length=4, logger=logger
+    )
+    assert fetched_response is not None
+    assert fetched_response.content == b"test"
+    assert fetched_response.content_sha1 == hashlib.sha1(b"test").digest()
+
+    # a too large body is dropped while streaming, and no spool is left
+    mocker.patch("cached_http_fetcher.request.INLINE_CONTENT_MAX", 4)
+    mocker.patch("cached_http_fetcher.request.CHUNK_SIZE", 3)
+    spool_pattern = os.path.join(tempfile.gettempdir(), "cached-http-fetcher-*")
+    spools = set(glob.glob(spool_pattern))
+    fetched_response = cached_requests_get(
+        large_url, None, now, max_content_length=8, logger=logger
+    )
+    assert fetched_response is None
+    assert set(glob.glob(spool_pattern)) == spools
+
+    # a large body is spooled into spool_dir
+    with tempfile.TemporaryDirectory() as spool_dir:
+        fetched_response = cached_requests_get(
+            large_url, None, now, spool_dir=spool_dir, logger=logger
+        )
+        assert fetched_response is not None
+        assert fetched_response.content_file is not None
+        assert os.path.dirname(fetched_response.content_file) == spool_dir
+
+    # a too large body is dropped by its Content-Length
+    spy_iter_content = mocker.spy(Response, "iter_content")
+    fetched_response = cached_requests_get(
+        declared_url, None, now, max_content_length=8, logger=logger
+    )
+    assert fetched_response is None
+    spy_iter_content.assert_not_called()
+
+    # the body of an error response is discarded
+    fetched_response = cached_requests_get(error_url, None, now, logger=logger)
+    assert fetched_response is not None
+    assert fetched_response.status_code == 404
+    assert fetched_response.content is None
+    assert fetched_response.content_sha1 is None
+
+
+def test_is_unchanged() -> None:
+    meta = Meta(
+        cached_url="memory:https://example.com/image1.txt",
+        etag='"deadbeef"',
+        last_modified="Wed, 21 Oct 2015 07:28:00 GMT",
+        content_sha1=b"sha1",
+        fetched_at=0,
+        expired_at=0,
+        content_length=4,
+    )
+
+    assert is_unchanged({"etag": '"deadbeef"', "content-length": "4"}, meta)
+    assert is_unchanged(
+        {"last-modified": "Wed, 21 Oct 2015 07:28:00 GMT", "content-length": "4"},
+        meta,
+    )
+    # a changed validator
+    assert not is_unchanged({"etag": '"cafebabe"', "content-length": "4"}, meta)
+    assert not is_unchanged({"etag": '"deadbeef"', "content-length": "5"}, meta)
+    # a weak etag, or no length to compare
+    assert not is_unchanged({"etag": 'W/"deadbeef"', "content-length": "4"}, meta)
+    assert not is_unchanged({"etag": '"deadbeef"'}, meta)
+    assert not is_unchanged(
+        {"etag": '"deadbeef"', "content-length": "4", "content-encoding": "gzip"},
+        meta,
+    )
+    assert not is_unchanged({"etag": '"deadbeef"', "content-length": "4"}, None)
+
+
+def test_cached_requests_get_unchanged(
+    requests_mock: responses.RequestsMock,
+    mocker: MockerFixture,
+    logger: logging.Logger,
+) -> None:
+    now = 1617355068
+    url = "https://example.com/image1.txt"
+    # An origin ignoring If-None-Match
+    requests_mock.add(
+        requests_mock.GET,
+        url,
+        body=b"test",
+        headers={"ETag": '"deadbeef"', "Content-Length": "4"},
+    )
+    meta = Meta(
+        cached_url=url,
+        etag='"deadbeef"',
+        last_modified=None,
+        content_sha1=hashlib.sha1(b"test").digest(),
+        fetched_at=now - 3600,
+        expired_at=now - 1,
+        content_length=4,
+    )
+
+    spy_iter_content = mocker.spy(Response, "iter_content")
+    fetched_response = cached_requests_get(url, meta, now, logger=logger)
+    assert fetched_response is not None
+    assert fetched_response.status_code == 200
+    assert fetched_response.body_skipped
+    assert fetched_response.content is None
+    spy_iter_content.assert_not_called()
+
+
+class NotModifiedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self) -> None:
+        NotModifiedHandler.connections += 1
+        super().setup()
+
+    def do_GET(self) -> None:
+        if self.path == "/not_found.txt":
+            body = b"not found"
+            self.send_response(404)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(304)
+            self.send_header("ETag", '"deadbeef"')
+            self.end_headers()
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def test_cached_requests_get_keep_alive(logger: logging.Logger) -> None:
+    now = 1617355068
+    server = ThreadingHTTPServer(("127.0.0.1", 0), NotModifiedHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        url = f"{base_url}/image1.txt"
+        meta = Meta(
+            cached_url=url,
+            etag='"deadbeef"',
+            last_modified=None,
+            content_sha1=None,
+            fetched_at=now - 3600,
+            expired_at=now - 1,
+        )
+        session = FetchSession()
+
+        # 304 and 404 responses give their connection back to the pool
+        NotModifiedHandler.connections = 0
+        for _ in range(3):
+            fetched_response = cached_requests_get(
+                url, meta, now, session=session, logger=logger
+            )
+            assert fetched_response is not None
+            assert fetched_response.status_code == 304
+        fetched_response = cached_requests_get(
+            f"{base_url}/not_found.txt", None, now, session=session, logger=logger
+        )
+        assert fetched_response is not None
+        assert fetched_response.status_code == 404
+        assert NotModifiedHandler.connections == 1
+
+        session.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
 # TODO: test_requests_get()
@@ -1,31 +1,74 @@
-from typing import List
-
-from cached_http_fetcher.url_list import urls_per_domain
-
-
-def test_url_list(url_list: List[str]) -> None:
-    assert len(url_list) == 9
-
-    result = urls_per_domain(url_list)
-
-    assert set(result.keys()) == {
-        "domain1.example.com",
-        "domain2.example.com",
-        "domain3.example.com",
-    }
-
-    assert result["domain1.example.com"] == {
-        "http://domain1.example.com/image.jpg",
-        "https://domain1.example.com/image.jpg",
-        "https://domain1.example.com/large_image.jpg",
-        "https://domain1.example.com/path/image.jpg",
-    }
-    assert result["domain2.example.com"] == {
-        "https://domain2.example.com/image.jpg",
-    }
-    assert result["domain3.example.com"] == {
-        "https://domain3.example.com/image.jpg",
-        "https://domain3.example.com/image2.jpg",
-        "https://domain3.example.com/image3.jpg",
-        "https://domain3.example.com/image4.jpg",
-    }
+from typing import Iterator, List
+
+from cached_http_fetcher.url_list import URLDeduplicator, stream_url_chunks
+
+
+def test_url_deduplicator() -> None:
+    deduplicator = URLDeduplicator()
+    assert deduplicator.add("http://example.com/1")
+    assert deduplicator.add("http://example.com/2")
+    assert not deduplicator.add("http://example.com/1")
+
+    # a url overwritten in its slot is seen as new again
+    deduplicator = URLDeduplicator(num_slots=1)
+    assert deduplicator.add("http://example.com/1")
+    assert deduplicator.add("http://example.com/2")
+    assert deduplicator.add("http://example.com/1")
+    assert not deduplicator.add("http://example.com/1")
+
+
+def test_stream_url_chunks(url_list: List[str]) -> None:
+    # all the urls without duplicates
+    chunks = list(stream_url_chunks(list(url_list) * 2, 2))
+    urls = [url for chunk in chunks for url in chunk]
+    assert len(urls) == len(set(urls))
+    assert set(urls) == set(url_list)
+    for chunk in chunks:
+        assert 1 <= len(chunk) <= 2
+        assert len({url.split("/")[2] for url in chunk}) == 1
+
+    # url list is read lazily
+    read_count = 0
+
+    def generate_urls() -> Iterator[str]:
+        nonlocal read_count
+        for i in range(10):
+            read_count += 1
+            yield f"http://a.example.com/{i}"
+
+    url_chunks = stream_url_chunks(generate_urls(), 3, max_pending_urls=4)
+    assert next(url_chunks) == [f"http://a.example.com/{i}" for i in range(3)]
+    assert read_count == 3
+
+    # partial chunks are flushed when too many urls are pending
+    url_chunks = stream_url_chunks(
+        [f"http://{host}.example.com/" for host in "abcde"], 3, max_pending_urls=3
+    )
+    assert next(url_chunks) == ["http://a.example.com/"]
+
+
+def test_stream_url_chunks_immediate() -> None:
+    # a full chunk is yielded before url_list ends, with the default limit
+    read_count = 0
+
+    def generate_urls() -> Iterator[str]:
+        nonlocal read_count
+        for i in range(1000):
+            read_count += 1
+            yield f"http://{'ab'[i % 2]}.example.com/{i}"
+
+    url_chunks = stream_url_chunks(generate_urls(), 2)
+    assert next(url_chunks) == ["http://a.example.com/0", "http://a.example.com/2"]
+    assert read_count == 3
+
+    # chunks come in the order they are full, and partial ones at the end
+    url_list = [f"http://a.example.com/{i}" for i in range(5)]
+    url_list += [f"http://b.example.com/{i}" for i in range(3)]
+    chunks = list(stream_url_chunks(url_list, 2))
+    assert [(chunk[0].split("/")[2], len(chunk)) for chunk in chunks] == [
+        ("a.example.com", 2),
+        ("a.example.com", 2),
+        ("b.example.com", 2),
+        ("a.example.com", 1),
+        ("b.example.com", 1),
+    ]